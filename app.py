@@ -1,11 +1,18 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime
 from src.main_processor import MainProcessor
+from src.parsers.document_parser import as_source
+from src.utils.output_writer import dumps_compact
 
 st.set_page_config(page_title="Document Parser", page_icon="📄", layout="wide")
 
+
+@st.cache_resource
+def get_processor(gemini_api_key):
+    """One warm processor per API key, kept across reruns and sessions"""
+    return MainProcessor(gemini_api_key, cache_dir="data/cache", signature_db="data/signatures.db")
+
+
 # Clean, modern CSS
 st.markdown("""
 <style>
@@ -137,27 +144,23 @@ with col1:
     gemini_api_key = st.text_input("Gemini API Key (optional)", type="password")
     
     if st.button("Process Documents", disabled=not uploaded_files):
-        processor = MainProcessor(gemini_api_key if gemini_api_key else None)
+        processor = get_processor(gemini_api_key or None)
         
         progress = st.progress(0)
         
-        for i, file in enumerate(uploaded_files):
-            with st.spinner(f"Processing {file.name}..."):
-                temp_path = f"data/{file.name}"
-                os.makedirs("data", exist_ok=True)
-                
-                with open(temp_path, "wb") as f:
-                    f.write(file.getbuffer())
-                
-                try:
-                    document, log = processor.process_document(temp_path, sender_name or None)
+        # Uploads are parsed straight from memory, named for format detection
+        sources = [as_source(file.getvalue(), file.name) for file in uploaded_files]
+        
+        with st.spinner(f"Processing {len(sources)} documents..."):
+            results = processor.process_batch(sources, sender_name or None)
+            for i, (source, document, log) in enumerate(results):
+                if document is not None:
                     st.session_state.processed_docs.append(document)
                     st.session_state.processing_logs.append(log)
-                    os.remove(temp_path)
-                except Exception as e:
-                    st.error(f"Error: {e}")
+                else:
+                    st.error(f"Error: {'; '.join(log.warnings)}")
                 
-                progress.progress((i + 1) / len(uploaded_files))
+                progress.progress((i + 1) / len(sources))
         
         processor.save_signatures()
         st.success("Processing complete!")
@@ -226,15 +229,23 @@ with col2:
                 
                 st.json(json_data)
                 
-                # Download
-                json_str = json.dumps(json_data, indent=2)
+                # Download (compact: content once, text fields as offsets into it)
                 st.download_button(
                     "Download JSON",
-                    json_str,
+                    dumps_compact(doc),
                     f"{doc.document_id}.json",
                     "application/json",
                     key=f"download_{i}"
                 )
+        
+        # Whole batch as JSON Lines, one compact record per document
+        st.download_button(
+            "Download All (JSONL)",
+            "".join(dumps_compact(doc) + "\n" for doc in st.session_state.processed_docs),
+            "documents.jsonl",
+            "application/x-ndjson",
+            key="download_all"
+        )
     else:
         st.markdown("""
         <div style="text-align: center; padding: 2rem; color: #64748b;">
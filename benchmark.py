@@ -0,0 +1,53 @@
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.utils.benchmark import (BenchmarkSuite, compare, load_report, save_report,
+                                 DEFAULT_SIZES_MB, DEFAULT_THRESHOLD, DEFAULT_SIGNATURES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the document processing pipeline")
+    parser.add_argument('--sizes', default=",".join(f"{size:g}" for size in DEFAULT_SIZES_MB),
+                        help="Synthetic document sizes in MB, comma separated")
+    parser.add_argument('--formats', default="text,html,docx,pdf", help="Synthetic formats, comma separated")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per document")
+    parser.add_argument('--signatures', type=int, default=DEFAULT_SIGNATURES,
+                        help="Learned patterns in the signature lookup benchmarks")
+    parser.add_argument('--output', default="data/benchmark.json", help="Where to write the JSON report")
+    parser.add_argument('--baseline', help="Report to compare against; exits 1 on regressions")
+    parser.add_argument('--save-baseline', help="Also write this run's report as the baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative change flagged as a regression")
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(
+        sizes_mb=tuple(float(size) for size in args.sizes.split(',') if size),
+        repeat=args.repeat,
+        formats=tuple(name for name in args.formats.split(',') if name),
+        signatures=args.signatures
+    )
+    report = suite.run()
+    save_report(report, args.output)
+    print(f"[OK] Report written to {args.output}")
+    if args.save_baseline:
+        save_report(report, args.save_baseline)
+        print(f"[OK] Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        baseline = load_report(args.baseline)
+        if baseline is None:
+            print(f"[ERROR] Baseline not found: {args.baseline}")
+            return 1
+        regressions = compare(report, baseline, args.threshold)
+        for regression in regressions:
+            print(f"[REGRESSION] {regression}")
+        if regressions:
+            return 1
+        print(f"[OK] No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import sys
+import os
+import signal
+import json
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.main_processor import MainProcessor
+from src.ai.routing import ROUTING_POLICIES, make_policy
+from src.parsers.document_parser import backend_preferences
+from src.utils.folder_watcher import FolderWatcher, Throughput, POLL_INTERVAL, SETTLE_SECONDS, REPORT_INTERVAL
+from src.utils.http_service import ExtractionService, make_server, MAX_ACTIVE_REQUESTS
+from src.utils.instrumentation import MetricsRegistry
+from src.utils.output_writer import open_writer
+
+
+def build_processor(args) -> MainProcessor:
+    """Pipeline configured from the shared command line options"""
+    fields = [name for name in args.fields.split(',') if name] if args.fields else None
+    return MainProcessor(
+        args.api_key or os.environ.get('GEMINI_API_KEY') or None,
+        cache_dir=args.cache_dir or None,
+        signature_db=args.signature_db or None,
+        artifact_db=args.artifact_db or None,
+        metrics=MetricsRegistry(args.log_jsonl) if args.metrics or args.log_jsonl else None,
+        fields=fields,
+        parser_backends=backend_preferences(args.parsers) if args.parsers else None,
+        page_workers=args.page_workers,
+        routing=make_policy(args.routing, max_cost=args.ai_budget, max_seconds=args.ai_deadline)
+    )
+
+
+def expand_paths(paths):
+    """Files named directly plus every file under named directories"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def write_deferred(processor: MainProcessor, writer, wait: bool = False) -> int:
+    """Append documents upgraded by deferred AI fallbacks (same document_id, later line wins)"""
+    if wait and processor.deferred and processor.deferred.backlog:
+        print(f"[OK] Waiting for {processor.deferred.backlog} deferred AI fallbacks")
+    upgraded = 0
+    for document, log in processor.deferred_results(wait):
+        writer.write(document)
+        upgraded += 1
+    if upgraded:
+        print(f"[OK] Upgraded {upgraded} documents with deferred AI results")
+    return upgraded
+
+
+def write_metrics(processor: MainProcessor, path: str):
+    if path and processor.metrics:
+        processor.metrics.write_prometheus(path)
+        print(f"[OK] Metrics written to {path}")
+
+
+def process_command(args) -> int:
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    processor = build_processor(args)
+    throughput = Throughput()
+    with open_writer(args.output, processor.fields) as writer:
+        for file_path, document, log in processor.process_batch(expand_paths(args.paths), args.sender, args.workers):
+            throughput.add(log, failed=document is None)
+            if document is None:
+                print(f"[ERROR] {file_path}: {'; '.join(log.warnings)}")
+                continue
+            writer.write(document)
+            print(f"[OK] {file_path}: {document.processing_method}, confidence {document.confidence_score:.2f}")
+        write_deferred(processor, writer, wait=True)
+    if not processor.signature_engine.store.persistent:
+        processor.save_signatures()
+    print(f"[OK] {throughput.summary()}")
+    print(f"[OK] Results written to {args.output}")
+    write_metrics(processor, args.metrics)
+    return 1 if throughput.failed else 0
+
+
+def ingest_command(args) -> int:
+    missing = [path for path in args.paths if not os.path.isfile(path)]
+    if missing:
+        print(f"[ERROR] No such file: {', '.join(missing)}")
+        return 1
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    processor = build_processor(args)
+    throughput = Throughput()
+    with open_writer(args.output, processor.fields) as writer:
+        for path in args.paths:
+            for part, document, log in processor.process_bundle(path, args.sender, args.workers):
+                throughput.add(log, failed=document is None)
+                if document is None:
+                    print(f"[ERROR] {part.path}: {'; '.join(log.warnings)}")
+                    continue
+                writer.write(document)
+                print(f"[OK] {part.path}: {document.source_type}, {document.processing_method}, "
+                      f"confidence {document.confidence_score:.2f}")
+        write_deferred(processor, writer, wait=True)
+    if not processor.signature_engine.store.persistent:
+        processor.save_signatures()
+    print(f"[OK] {throughput.summary()}")
+    print(f"[OK] Results written to {args.output}")
+    write_metrics(processor, args.metrics)
+    return 1 if throughput.failed else 0
+
+
+def reprocess_command(args) -> int:
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    processor = build_processor(args)
+    if not processor.artifacts:
+        print("[ERROR] Reprocessing needs --artifact-db")
+        return 1
+    throughput = Throughput()
+    with open_writer(args.output, processor.fields) as writer:
+        for source_key, document, log in processor.reprocess(args.keys or None, args.sender, args.workers):
+            throughput.add(log, failed=document is None)
+            if document is None:
+                print(f"[ERROR] {source_key[:12]}: {'; '.join(log.warnings)}")
+                continue
+            writer.write(document)
+            reused = sum(step.startswith("Reused") for step in log.steps)
+            print(f"[OK] {source_key[:12]}: {document.processing_method}, {reused} stages reused")
+        write_deferred(processor, writer, wait=True)
+    if not processor.signature_engine.store.persistent:
+        processor.save_signatures()
+    print(f"[OK] {throughput.summary()}")
+    print(f"[OK] Results written to {args.output}")
+    write_metrics(processor, args.metrics)
+    return 1 if throughput.failed else 0
+
+
+def watch_command(args) -> int:
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    processor = build_processor(args)
+    watcher = FolderWatcher(
+        processor, args.folder, args.output,
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        sender=args.sender,
+        fields=processor.fields,
+        poll_interval=args.interval,
+        settle_seconds=args.settle,
+        report_interval=args.report_interval
+    )
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: watcher.stop())
+    watcher.run(once=args.once)
+    write_metrics(processor, args.metrics)
+    return 0
+
+
+def serve_command(args) -> int:
+    processor = build_processor(args)
+    if (args.workers or os.cpu_count() or 1) > 1 and not processor.signature_engine.store.persistent:
+        print("[ERROR] Serving with worker processes needs --signature-db (or --workers 1)")
+        return 1
+    service = ExtractionService(processor, workers=args.workers, allowed_roots=args.allow_path,
+                                max_active_requests=args.max_requests)
+    server = make_server(service, args.host, args.port)
+    # SIGTERM stops the server like Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"[OK] Serving on http://{args.host}:{server.server_address[1]} ({service.workers} workers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    write_metrics(service.processor, args.metrics)
+    return 0
+
+
+def report_command(args) -> int:
+    # Imported here so processing commands never load pandas
+    from src.utils.corpus_stats import corpus_report, CHUNK_DOCUMENTS
+    missing = [path for path in args.paths if not os.path.isfile(path)]
+    if missing:
+        print(f"[ERROR] No such results file: {', '.join(missing)}")
+        return 1
+    report = corpus_report(args.paths, args.top, args.chunk_documents or CHUNK_DOCUMENTS)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] Report on {report['documents']} documents written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multi-format document processing")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    common.add_argument('--sender', help="Sender the documents came from")
+    common.add_argument('--fields', help="Extract only these fields, comma separated")
+    common.add_argument('--parsers', help="Preferred parser backends, e.g. pdf=pymupdf|pypdf2,html=bs4 "
+                                          "(default: $MULTIDOC_PARSERS, then the fastest installed)")
+    common.add_argument('--page-workers', type=int,
+                        help="Processes extracting the pages of one large PDF (default: one page at a time)")
+    common.add_argument('--api-key', help="Gemini API key (default: $GEMINI_API_KEY)")
+    common.add_argument('--cache-dir', default="data/cache", help="Result cache directory ('' disables)")
+    common.add_argument('--signature-db', default="data/signatures.db", help="SQLite signature store ('' uses JSON)")
+    common.add_argument('--artifact-db', default="data/artifacts.db",
+                        help="Per-stage artifact store for incremental reprocessing ('' disables)")
+    common.add_argument('--routing', default='threshold', choices=sorted(ROUTING_POLICIES),
+                        help="When the AI fallback runs: threshold (inline below the confidence threshold), "
+                             "defer (in the background after the rule-only result) or rules-only")
+    common.add_argument('--ai-budget', type=float, help="Most AI spend per batch in USD, deferred calls included; the rest is skipped")
+    common.add_argument('--ai-deadline', type=float,
+                        help="Seconds into a batch after which no new inline AI call starts; the rest is deferred")
+    common.add_argument('--metrics', help="Write Prometheus metrics to this file on exit")
+    common.add_argument('--log-jsonl', help="Append every processing log to this JSON Lines file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    process = commands.add_parser('process', parents=[common], help="Process files and folders once")
+    process.add_argument('paths', nargs='+', help="Files or folders to process")
+    process.add_argument('--output', default="data/results.jsonl", help="Results file (.jsonl or .parquet)")
+    process.set_defaults(handler=process_command)
+
+    ingest = commands.add_parser('ingest', parents=[common],
+                                 help="Process every document in ZIP archives, mbox files and .eml messages, "
+                                      "attachments included")
+    ingest.add_argument('paths', nargs='+', help="Archives, mailboxes or messages to unpack in memory")
+    ingest.add_argument('--output', default="data/results.jsonl", help="Results file (.jsonl or .parquet)")
+    ingest.set_defaults(handler=ingest_command)
+
+    reprocess = commands.add_parser('reprocess', parents=[common],
+                                    help="Rerun stored documents, recomputing only stages whose version changed")
+    reprocess.add_argument('keys', nargs='*', help="Artifact keys (file SHA-256) to rerun (default: all stored)")
+    reprocess.add_argument('--output', default="data/results.jsonl", help="Results file (.jsonl or .parquet)")
+    reprocess.set_defaults(handler=reprocess_command)
+
+    watch = commands.add_parser('watch', parents=[common], help="Process files as they appear in a folder")
+    watch.add_argument('folder', help="Folder to watch (including subfolders)")
+    watch.add_argument('--output', default="data/results.jsonl", help="JSON Lines file results are appended to")
+    watch.add_argument('--checkpoint', help="Processed-file ledger (default: <output>.checkpoint)")
+    watch.add_argument('--interval', type=float, default=POLL_INTERVAL, help="Seconds between folder scans")
+    watch.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                       help="Seconds a file must be unmodified before it is processed")
+    watch.add_argument('--report-interval', type=float, default=REPORT_INTERVAL,
+                       help="Seconds between throughput reports")
+    watch.add_argument('--once', action='store_true', help="Drain the folder once and exit")
+    watch.set_defaults(handler=watch_command)
+
+    serve = commands.add_parser('serve', parents=[common], help="Serve a local HTTP extraction API")
+    serve.add_argument('--host', default="127.0.0.1", help="Interface to listen on")
+    serve.add_argument('--port', type=int, default=8000, help="Port to listen on")
+    serve.add_argument('--allow-path', action='append', default=[],
+                       help="Folder whose files may be requested by path (repeatable; default: uploads only)")
+    serve.add_argument('--max-requests', type=int, default=MAX_ACTIVE_REQUESTS,
+                       help="Requests processed at once before answering 503")
+    serve.set_defaults(handler=serve_command)
+
+    report = commands.add_parser('report', help="Corpus statistics over results files")
+    report.add_argument('paths', nargs='+', help="Results files (.jsonl or .parquet) written by process or watch")
+    report.add_argument('--top', type=int, default=20, help="Entries per token and signature table")
+    report.add_argument('--chunk-documents', type=int, help="Documents counted per vectorized step")
+    report.add_argument('--output', help="Write the report to this JSON file (default: print it)")
+    report.set_defaults(handler=report_command)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
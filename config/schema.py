@@ -20,6 +20,20 @@ class ProcessingLog(BaseModel):
     steps: List[str] = []
     rules_applied: List[str] = []
     ai_usage: bool = False
+    cache_hit: bool = False
     cost_estimate: float = 0.0
+    ai_prompt_tokens: int = 0  # tokens billed for the AI fallback (0 when its answer was cached)
+    ai_output_tokens: int = 0
+    ai_cache_hit: bool = False  # AI answer reused from a near-identical document's prompt
+    ai_deferred: bool = False  # AI fallback left to the background queue by the routing policy
+    ai_failed: bool = False  # AI fallback returned an error (the result is not cached, so the call is retried)
+    routing_policy: Optional[str] = None
+    routing_action: Optional[str] = None  # ai, skip or defer
+    signature: Optional[str] = None
+    source_key: Optional[str] = None  # artifact store key of the input (SHA-256 of its bytes)
     processing_time: float = 0.0
-    warnings: List[str] = []
\ No newline at end of file
+    warnings: List[str] = []
+    stage_timings: Dict[str, float] = {}  # seconds per pipeline stage
+    input_bytes: int = 0
+    content_chars: int = 0
+    profile: Dict[str, Any] = {}  # cProfile/tracemalloc capture when enabled
\ No newline at end of file
@@ -0,0 +1,199 @@
+import json
+import time
+import asyncio
+from typing import Dict, List, Any, Optional
+from src.ai.gemini_processor import GeminiProcessor, PROMPT_FIELDS
+from src.ai.response_cache import ResponseCache
+
+
+class TokenBucket:
+    """Token-bucket rate limiter for async callers"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncGeminiProcessor(GeminiProcessor):
+    """Non-blocking Gemini client for running many AI fallbacks at once
+
+    At most max_concurrency requests are in flight and requests start at no
+    more than requests_per_second (bursts up to burst). Failed or timed-out
+    calls are retried with exponential backoff. With pack_size > 1, documents
+    shorter than pack_chars that arrive within pack_linger seconds of each
+    other share one prompt; if the packed reply can't be split back into one
+    result per document they are retried individually. Prompts are
+    compacted and looked up in the response cache before any of this,
+    and identical prompts already in flight share one call.
+    """
+
+    def __init__(self, api_key: str = None, model: Any = None, max_concurrency: int = 4,
+                 requests_per_second: float = None, burst: int = None, max_retries: int = 3,
+                 timeout: float = 30.0, backoff: float = 1.0, pack_size: int = 1,
+                 pack_chars: int = 1000, pack_linger: float = 0.05, response_cache: ResponseCache = None):
+        super().__init__(api_key, model=model, response_cache=response_cache)
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.pack_size = pack_size
+        self.pack_chars = pack_chars
+        self.pack_linger = pack_linger
+
+        # Limiters and the pack queue belong to the event loop that uses them
+        self._loop = None
+        self._semaphore = None
+        self._bucket = None
+        self._pack = []
+        self._pack_timer = None
+        self._pack_tasks = set()
+        self._in_flight = {}  # response cache key -> future of its result
+
+    def _bind_loop(self):
+        """Create the limiters for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._bucket = TokenBucket(self.requests_per_second, self.burst) if self.requests_per_second else None
+            self._pack = []
+            self._pack_timer = None
+            self._in_flight = {}
+        return loop
+
+    async def _call_model(self, prompt: str) -> Any:
+        """Send one prompt with rate limiting, timeout and retries"""
+        self._bind_loop()
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    if self._bucket:
+                        await self._bucket.acquire()
+                    try:
+                        return await asyncio.wait_for(self._generate(prompt), self.timeout)
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(f"Model call timed out after {self.timeout}s")
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+    async def _generate(self, prompt: str) -> Any:
+        """Model response, without blocking the event loop"""
+        if hasattr(self.model, 'generate_content_async'):
+            return await self.model.generate_content_async(prompt)
+        return await asyncio.to_thread(self.model.generate_content, prompt)
+
+    async def extract_structured_data(self, content: str, doc_type: str,
+                                      extracted_fields: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Use AI to extract structured data without blocking other work"""
+        text = self.compact(content, extracted_fields)
+        key = self.cache_key(text, doc_type)
+        cached = self.cached_result(key)
+        if cached is not None:
+            return cached
+        loop = self._bind_loop()
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            # The same prompt is already on its way: wait for its answer instead of paying twice
+            result = await asyncio.shield(shared)
+            return self.cached_result(key) or result
+
+        shared = self._in_flight[key] = loop.create_future()
+        result = self.error_result(RuntimeError("Extraction was cancelled"))
+        try:
+            if self.pack_size > 1 and len(text) <= self.pack_chars:
+                result = await self._extract_packed(text, doc_type)
+            else:
+                result = await self._extract_single(text, doc_type)
+            self.remember(key, result)
+        finally:
+            del self._in_flight[key]
+            shared.set_result(result)
+        return result
+
+    async def _extract_single(self, content: str, doc_type: str) -> Dict[str, Any]:
+        """One compacted document, one prompt"""
+        prompt = self.build_prompt(content, doc_type)
+        try:
+            response = await self._call_model(prompt)
+            return self.parse_response(prompt, response.text, self.token_usage(prompt, response))
+        except Exception as e:
+            return self.error_result(e)
+
+    async def _extract_packed(self, content: str, doc_type: str) -> Dict[str, Any]:
+        """Queue a small document to share a prompt with its neighbours"""
+        loop = self._bind_loop()
+        future = loop.create_future()
+        self._pack.append((content, doc_type, future))
+        if len(self._pack) >= self.pack_size:
+            self._flush_pack()
+        elif self._pack_timer is None:
+            self._pack_timer = loop.call_later(self.pack_linger, self._flush_pack)
+        return await future
+
+    def _flush_pack(self):
+        """Send whatever is queued as one packed request"""
+        if self._pack_timer is not None:
+            self._pack_timer.cancel()
+            self._pack_timer = None
+        pack, self._pack = self._pack, []
+        if pack:
+            task = asyncio.ensure_future(self._send_pack(pack))
+            self._pack_tasks.add(task)
+            task.add_done_callback(self._pack_tasks.discard)
+
+    async def _send_pack(self, pack: List[tuple]):
+        """Resolve every queued document from one request, or singly as a fallback"""
+        results = None
+        if len(pack) > 1:
+            prompt = self.build_pack_prompt([(content, doc_type) for content, doc_type, _ in pack])
+            try:
+                response = await self._call_model(prompt)
+                results = self.parse_pack_response(prompt, response.text, len(pack),
+                                                   self.token_usage(prompt, response))
+            except Exception:
+                results = None
+        if results is None:
+            results = await asyncio.gather(*(self._extract_single(content, doc_type) for content, doc_type, _ in pack))
+
+        for (_, _, future), result in zip(pack, results):
+            if not future.done():
+                future.set_result(result)
+
+    def build_pack_prompt(self, documents: List[tuple]) -> str:
+        """Extraction prompt covering several (content, doc_type) documents"""
+        sections = "\n\n".join(
+            f"Document {number} ({doc_type}):\n{content}"
+            for number, (content, doc_type) in enumerate(documents, 1)
+        )
+        return (f"Extract key information from each of these {len(documents)} documents and return a JSON array "
+                f"with one object per document, in the same order. Each object must have these fields:\n"
+                f"{PROMPT_FIELDS}\n\n{sections}")
+
+    def parse_pack_response(self, prompt: str, response_text: str, count: int,
+                            usage: Optional[tuple] = None) -> Optional[List[Dict[str, Any]]]:
+        """Split a packed response into per-document results, sharing the cost evenly"""
+        result = json.loads(response_text)
+        if not isinstance(result, list) or len(result) != count or not all(isinstance(item, dict) for item in result):
+            return None
+
+        prompt_tokens, output_tokens = usage or self.token_usage(prompt, response_text)
+        return [{'extracted_data': item, **self.usage_result(prompt_tokens, output_tokens, count)} for item in result]
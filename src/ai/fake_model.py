@@ -0,0 +1,72 @@
+import re
+import json
+import time
+import asyncio
+from typing import Dict, Any
+
+# Packed prompts announce how many documents they carry
+PACK_COUNT_PATTERN = re.compile(r'each of these (\d+) documents')
+
+
+class FakeResponse:
+    """Minimal stand-in for a Gemini response"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Local stand-in for genai.GenerativeModel with injected latency and failures
+
+    Pass it as ai_model to MainProcessor (or model to GeminiProcessor /
+    AsyncGeminiProcessor) to exercise the AI path offline. The first
+    `failures` calls raise; every call waits `latency` seconds and answers
+    with `response` (one copy per document for packed prompts).
+    """
+
+    def __init__(self, latency: float = 0.0, failures: int = 0, response: Dict[str, Any] = None):
+        self.latency = latency
+        self.failures = failures
+        self.response = response or {
+            'title': 'Fake Document',
+            'key_fields': {},
+            'summary': 'Generated by FakeGenerativeModel',
+            'confidence': 0.9
+        }
+        self.calls = 0
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _respond(self, prompt: str) -> FakeResponse:
+        """Record the call and build its response"""
+        self.calls += 1
+        self.prompts.append(prompt)
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("Injected model failure")
+
+        pack = PACK_COUNT_PATTERN.search(prompt)
+        if pack:
+            return FakeResponse(json.dumps([self.response] * int(pack.group(1))))
+        return FakeResponse(json.dumps(self.response))
+
+    def generate_content(self, prompt: str) -> FakeResponse:
+        """Blocking call, like GenerativeModel.generate_content"""
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            return self._respond(prompt)
+        finally:
+            self.in_flight -= 1
+
+    async def generate_content_async(self, prompt: str) -> FakeResponse:
+        """Non-blocking call, like GenerativeModel.generate_content_async"""
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return self._respond(prompt)
+        finally:
+            self.in_flight -= 1
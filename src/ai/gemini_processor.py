@@ -1,53 +1,132 @@
-import google.generativeai as genai
 import json
-from typing import Dict, Any
+import math
+from typing import Dict, Any, Optional, Tuple
+from src.ai.prompt_compactor import compact_content, PROMPT_CHARS
+from src.ai.response_cache import ResponseCache
+
+# Gemini 1.5 Flash list prices per token (USD, prompts up to 128k tokens)
+INPUT_COST_PER_TOKEN = 0.075 / 1_000_000
+OUTPUT_COST_PER_TOKEN = 0.30 / 1_000_000
+
+# Characters per token when a response carries no usage metadata
+CHARS_PER_TOKEN = 4
+
+# Output tokens assumed per answer when estimating a call's cost in advance
+EXPECTED_OUTPUT_TOKENS = 200
+
+# Requested fields; instructions come first and the compacted text last, without indentation
+PROMPT_FIELDS = """- title: document title
+- key_fields: important data fields found
+- summary: brief summary
+- confidence: confidence score 0-1
+Return only valid JSON, no other text."""
+
+PROMPT_TEMPLATE = ("Extract key information from this {doc_type} document and return JSON with these fields:\n"
+                   + PROMPT_FIELDS + "\n\nDocument content:\n{content}")
 
 class GeminiProcessor:
     """AI processor using Gemini 1.5 Flash for outliers only"""
     
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
-        self.cost_per_token = 0.000001  # Approximate cost
+    def __init__(self, api_key: str, model: Any = None, response_cache: ResponseCache = None,
+                 prompt_chars: int = PROMPT_CHARS):
+        # Any object with generate_content (e.g. a local stub) can stand in for Gemini
+        if model is None:
+            # Imported here so runs without an API key never load the client library
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model = model
+        self.version = "1.1"  # Prompt and model; stored AI results are reused only under the same version
+        self.input_cost_per_token = INPUT_COST_PER_TOKEN
+        self.output_cost_per_token = OUTPUT_COST_PER_TOKEN
+        self.prompt_chars = prompt_chars  # Unexplained text sent per document
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
     
-    def extract_structured_data(self, content: str, doc_type: str) -> Dict[str, Any]:
-        """Use AI to extract structured data from complex documents"""
-        prompt = f"""
-        Extract key information from this {doc_type} document and return as JSON:
-        
-        Document content:
-        {content[:2000]}  # Limit content to control costs
-        
-        Return JSON with these fields:
-        - title: document title
-        - key_fields: important data fields found
-        - summary: brief summary
-        - confidence: confidence score 0-1
+    def compact(self, content: str, extracted_fields: Dict[str, Any] = None) -> str:
+        """Document text the rule pass could not explain, within the prompt budget"""
+        return compact_content(content, extracted_fields, self.prompt_chars)
+    
+    def build_prompt(self, content: str, doc_type: str) -> str:
+        """Extraction prompt for one (compacted) document"""
+        return PROMPT_TEMPLATE.format(doc_type=doc_type, content=content)
+    
+    def estimate_cost(self, content: str, extracted_fields: Dict[str, Any] = None) -> float:
+        """Expected cost of extracting a document, before calling the model"""
+        prompt_tokens = math.ceil(len(self.build_prompt(self.compact(content, extracted_fields), '')) / CHARS_PER_TOKEN)
+        return prompt_tokens * self.input_cost_per_token + EXPECTED_OUTPUT_TOKENS * self.output_cost_per_token
+    
+    def token_usage(self, prompt: str, response: Any) -> Tuple[int, int]:
+        """(prompt, output) tokens of a call, from usage metadata when the response has it"""
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None)
+        output_tokens = getattr(usage, 'candidates_token_count', None)
+        if prompt_tokens is None:
+            prompt_tokens = math.ceil(len(prompt) / CHARS_PER_TOKEN)
+        if output_tokens is None:
+            output_tokens = math.ceil(len(getattr(response, 'text', response) or '') / CHARS_PER_TOKEN)
+        return prompt_tokens, output_tokens
+    
+    def usage_result(self, prompt_tokens: int, output_tokens: int, share: int = 1) -> Dict[str, Any]:
+        """Token counts and cost of a call, split across share documents"""
+        cost = prompt_tokens * self.input_cost_per_token + output_tokens * self.output_cost_per_token
+        return {
+            'cost': cost / share,
+            'tokens_used': (prompt_tokens + output_tokens) // share,
+            'prompt_tokens': prompt_tokens // share,
+            'output_tokens': output_tokens // share
+        }
+    
+    def parse_response(self, prompt: str, response_text: str,
+                       usage: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        """Decode a JSON response and account for its tokens"""
+        result = json.loads(response_text)
+        prompt_tokens, output_tokens = usage or self.token_usage(prompt, response_text)
+        return {'extracted_data': result, **self.usage_result(prompt_tokens, output_tokens)}
+    
+    def error_result(self, error: Exception) -> Dict[str, Any]:
+        """Result returned when extraction fails"""
+        return {
+            'extracted_data': {'error': str(error)},
+            'cost': 0,
+            'tokens_used': 0
+        }
+    
+    def cache_key(self, text: str, doc_type: str) -> str:
+        """Response cache key for compacted text"""
+        return self.response_cache.make_key(self.version, doc_type, text)
+    
+    def cached_result(self, key: str) -> Optional[Dict[str, Any]]:
+        """A cached result for a prompt key, free of charge"""
+        result = self.response_cache.get(key)
+        if result is None:
+            return None
+        return {'extracted_data': dict(result['extracted_data']), 'cost': 0.0, 'tokens_used': 0,
+                'prompt_tokens': 0, 'output_tokens': 0, 'cached': True}
+    
+    def remember(self, key: str, result: Dict[str, Any]):
+        """Cache a successful result"""
+        if not result['extracted_data'].get('error'):
+            self.response_cache.put(key, {'extracted_data': result['extracted_data']})
+    
+    def extract_structured_data(self, content: str, doc_type: str,
+                                extracted_fields: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Use AI to extract structured data from complex documents
         
-        Return only valid JSON, no other text.
+        Only text the rule pass (extracted_fields) could not explain is sent,
+        and documents whose remaining text matches an earlier prompt reuse
+        its result.
         """
+        text = self.compact(content, extracted_fields)
+        key = self.cache_key(text, doc_type)
+        cached = self.cached_result(key)
+        if cached is not None:
+            return cached
+        prompt = self.build_prompt(text, doc_type)
         
         try:
             response = self.model.generate_content(prompt)
-            result = json.loads(response.text)
-            
-            # Estimate cost based on token usage
-            estimated_tokens = len(prompt.split()) + len(response.text.split())
-            cost = estimated_tokens * self.cost_per_token
-            
-            return {
-                'extracted_data': result,
-                'cost': cost,
-                'tokens_used': estimated_tokens
-            }
+            result = self.parse_response(prompt, response.text, self.token_usage(prompt, response))
         except Exception as e:
-            return {
-                'extracted_data': {'error': str(e)},
-                'cost': 0,
-                'tokens_used': 0
-            }
-    
-    def should_use_ai(self, content: str, confidence_score: float) -> bool:
-        """Determine if AI processing is needed"""
-        # Use AI only for low confidence or complex documents
-        return confidence_score < 0.7 or len(content) > 5000
\ No newline at end of file
+            return self.error_result(e)
+        self.remember(key, result)
+        return result
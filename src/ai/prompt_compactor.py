@@ -0,0 +1,76 @@
+import re
+from typing import Dict, Any, List, Optional
+
+# Characters of unexplained text sent to the model per document
+PROMPT_CHARS = 2000
+
+# Words a line may keep besides extracted values and still count as a "Label: value" line
+LABEL_WORDS = 4
+
+# Extracted values shorter than this are too common to mark a line as explained
+MIN_VALUE_CHARS = 2
+
+# Lines without letters or digits (rules, box drawing) and page markers
+SEPARATOR_LINE = re.compile(r'^[\W_]+$')
+PAGE_MARKER = re.compile(r'^(page\s*)?\d+(\s*(of|/)\s*\d+)?$', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+NON_LETTERS = re.compile(r'[^A-Za-z]+')
+
+
+def extracted_values(extracted_fields: Optional[Dict[str, Any]]) -> List[str]:
+    """Key/value pair values the rule pass already found, longest first"""
+    pairs = (extracted_fields or {}).get('key_value_pairs') or {}
+    values = {str(value).strip() for value in pairs.values()}
+    return sorted((value for value in values if len(value) >= MIN_VALUE_CHARS), key=len, reverse=True)
+
+
+def _is_explained(line: str, values: List[str]) -> bool:
+    """Whether a line is only a label plus values already extracted"""
+    rest = line
+    for value in values:
+        if value in rest:
+            rest = rest.replace(value, ' ')
+    if rest == line:
+        return False
+    return len(NON_LETTERS.sub(' ', rest).split()) <= LABEL_WORDS
+
+
+def compact_content(content: str, extracted_fields: Dict[str, Any] = None, max_chars: int = PROMPT_CHARS) -> str:
+    """The parts of a document the rule pass could not explain, whitespace-collapsed
+
+    Drops lines that only restate extracted key/value pairs (and labels
+    whose value sits on the next such line), separator and page-number
+    lines, and repeats of a line already kept (running headers/footers),
+    then keeps whole lines up to max_chars.
+    """
+    values = extracted_values(extracted_fields)
+    lines = [line for line in (WHITESPACE.sub(' ', line).strip() for line in content.splitlines()) if line]
+    kept = []
+    seen = set()
+    size = 0
+    for index, line in enumerate(lines):
+        if SEPARATOR_LINE.match(line) or PAGE_MARKER.match(line):
+            continue
+        if values:
+            if _is_explained(line, values):
+                continue
+            # "Bill To:" whose value is the next line
+            if line.endswith(':') and len(line.split()) <= LABEL_WORDS and index + 1 < len(lines) \
+                    and _is_explained(lines[index + 1], values):
+                continue
+        folded = line.casefold()
+        if folded in seen:
+            continue
+        seen.add(folded)
+        if size + len(line) > max_chars:
+            if not kept:
+                kept.append(line[:max_chars])
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(kept)
+
+
+def normalize_prompt_text(text: str) -> str:
+    """Case- and whitespace-insensitive form of compacted text, for response cache keys"""
+    return WHITESPACE.sub(' ', text.casefold()).strip()
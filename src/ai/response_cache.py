@@ -0,0 +1,80 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from src.ai.prompt_compactor import normalize_prompt_text
+from src.utils.result_cache import ResultCache
+
+# AI results kept in memory
+RESPONSE_CACHE_ENTRIES = 4096
+
+# Default bound on the total size of AI results kept on disk
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class ResponseCache:
+    """AI results keyed by the normalized text a prompt would send
+
+    Keys cover the prompt version, the document type and the compacted
+    content with case and whitespace folded, so near-identical documents
+    whose differences the rule pass already extracted (invoice numbers,
+    dates, totals) share one model call. Recent results are kept in
+    memory; with cache_dir they are also written there (one small JSON
+    file per key, in a ResultCache bounded to max_bytes) so worker
+    processes and later runs share them. File names start with a tag of
+    the prompt version, so purge_stale can drop other versions' results.
+    """
+
+    def __init__(self, cache_dir: str = None, max_entries: int = RESPONSE_CACHE_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> result, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._disk = ResultCache(cache_dir, max_bytes) if cache_dir else None
+
+    def make_key(self, version: str, doc_type: str, text: str) -> str:
+        """Key for a prompt's normalized content"""
+        normalized = normalize_prompt_text(text)
+        digest = hashlib.sha256(f"{version}\0{doc_type}\0{normalized}".encode()).hexdigest()
+        return f"{ResultCache.version_tag((version,))}-{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached result for a key, or None"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+        if result is None and self._disk:
+            data = self._disk.read(key)
+            try:
+                result = json.loads(data) if data is not None else None
+            except ValueError:
+                result = None
+            if result is not None:
+                self._remember(key, result)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store a successful result"""
+        self._remember(key, result)
+        if self._disk:
+            self._disk.write(key, json.dumps(result, default=str).encode('utf-8'))
+
+    def purge_stale(self, version: str) -> int:
+        """Delete results stored on disk under other prompt versions"""
+        return self._disk.purge_stale((version,)) if self._disk else 0
+
+    def _remember(self, key: str, result: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,273 @@
+import copy
+import time
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional, NamedTuple, Iterator, Tuple
+
+# Seconds assumed per AI call until one has been timed
+DEFAULT_AI_SECONDS = 2.0
+
+# Weight of the newest call in the running AI latency estimate
+LATENCY_SMOOTHING = 0.2
+
+
+class RoutingContext(NamedTuple):
+    """What a routing policy knows about a document after the rule pass"""
+    confidence: float
+    has_rules: bool
+    content_chars: int
+    doc_type: str
+    estimated_cost: float
+    estimated_seconds: float
+
+
+class RoutingDecision(NamedTuple):
+    action: str  # 'ai' (now), 'skip' or 'defer' (background queue)
+    reason: str
+    reserved_cost: float = 0.0
+
+
+class AIBudget:
+    """Cost and wall-clock allowance for the AI calls of one batch
+
+    Cost is reserved at decision time (the estimate) and settled with the
+    actual cost once the call returns, so concurrent decisions cannot
+    overshoot; deferred calls keep their estimate. max_seconds is a
+    deadline counted from the batch start: no call starts that is expected
+    to end after it.
+    """
+
+    def __init__(self, max_cost: float = None, max_seconds: float = None):
+        self.max_cost = max_cost
+        self.max_seconds = max_seconds
+        self.batch_id = None
+        self.started_at = time.time()
+        self.spent = 0.0
+        self._lock = threading.Lock()
+
+    def start_batch(self, batch_id: str = None, started_at: float = None):
+        """Reset the allowance, unless this batch is already under way"""
+        with self._lock:
+            if batch_id is not None and batch_id == self.batch_id:
+                return
+            self.batch_id = batch_id
+            self.started_at = started_at or time.time()
+            self.spent = 0.0
+
+    def reserve(self, cost: float) -> Optional[str]:
+        """Reserve a call's estimated cost; returns why it does not fit, or None"""
+        with self._lock:
+            if self.max_cost is not None and self.spent + cost > self.max_cost:
+                return f"cost budget of ${self.max_cost:g} reached"
+            self.spent += cost
+            return None
+
+    def past_deadline(self, seconds: float) -> Optional[str]:
+        """Why a call expected to take seconds would end after the deadline, or None"""
+        if self.max_seconds is not None and time.time() - self.started_at + seconds > self.max_seconds:
+            return f"latency budget of {self.max_seconds:g}s reached"
+        return None
+
+    def settle(self, reserved: float, actual: float):
+        """Replace a reservation with what the call really cost"""
+        with self._lock:
+            self.spent += actual - reserved
+
+    def split(self, parts: int) -> 'AIBudget':
+        """Equal share of the cost allowance (the deadline is shared as is)"""
+        share = AIBudget(self.max_cost / parts if self.max_cost is not None else None, self.max_seconds)
+        share.batch_id, share.started_at = self.batch_id, self.started_at
+        return share
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class RoutingPolicy(ABC):
+    """Decides per document whether the AI fallback runs now, later or not at all
+
+    Subclasses implement decide(). route() applies the batch budget on top:
+    a call, now or deferred, that does not fit the cost allowance is
+    skipped, and one that would end after the deadline is turned into
+    over_budget ('defer' or 'skip'). Policies keep a running estimate of AI
+    latency from record().
+    """
+
+    name = 'policy'
+
+    def __init__(self, budget: AIBudget = None, over_budget: str = 'defer'):
+        if over_budget not in ('defer', 'skip'):
+            raise ValueError(f"over_budget must be 'defer' or 'skip', not {over_budget!r}")
+        self.budget = budget
+        self.over_budget = over_budget
+        self.ai_seconds = DEFAULT_AI_SECONDS
+
+    @abstractmethod
+    def decide(self, context: RoutingContext) -> RoutingDecision:
+        """The policy's own choice for a document, before the budget"""
+
+    def route(self, context: RoutingContext) -> RoutingDecision:
+        """Decision for a document, within the batch budget"""
+        decision = self.decide(context)
+        if decision.action == 'skip' or self.budget is None:
+            return decision
+        # Deferring a call still spends its cost, so the cost allowance covers deferred calls too
+        refused = self.budget.reserve(context.estimated_cost)
+        if refused:
+            return RoutingDecision('skip', f"{decision.reason}; {refused}")
+        if decision.action == 'defer':
+            return decision
+        late = self.budget.past_deadline(context.estimated_seconds)
+        if late:
+            if self.over_budget == 'skip':
+                self.budget.settle(context.estimated_cost, 0.0)
+            return RoutingDecision(self.over_budget, f"{decision.reason}; {late}")
+        return decision._replace(reserved_cost=context.estimated_cost)
+
+    @property
+    def needs_cost_estimate(self) -> bool:
+        return self.budget is not None and self.budget.max_cost is not None
+
+    def record(self, decision: RoutingDecision, cost: float, seconds: float = None):
+        """Account for a finished AI call (seconds is None for answers served from a cache)"""
+        if seconds is not None:
+            self.observe_latency(seconds)
+        if self.budget is not None:
+            self.budget.settle(decision.reserved_cost, cost)
+
+    def observe_latency(self, seconds: float):
+        """Fold one AI call's duration into the latency estimate"""
+        self.ai_seconds += LATENCY_SMOOTHING * (seconds - self.ai_seconds)
+
+    def start_batch(self, batch_id: str = None, started_at: float = None):
+        if self.budget is not None:
+            self.budget.start_batch(batch_id, started_at)
+
+    def for_workers(self, workers: int) -> 'RoutingPolicy':
+        """Copy for one of several worker processes, with an equal share of the budget"""
+        policy = copy.copy(self)
+        if self.budget is not None:
+            policy.budget = self.budget.split(workers)
+        return policy
+
+
+class ThresholdPolicy(RoutingPolicy):
+    """AI when rule confidence is below a threshold, and for layouts with no learned rules"""
+
+    name = 'threshold'
+
+    def __init__(self, threshold: float = 0.7, new_layouts: bool = True, **options):
+        super().__init__(**options)
+        self.threshold = threshold
+        self.new_layouts = new_layouts  # Learn unseen layouts from AI even when the rules look confident
+
+    def decide(self, context: RoutingContext) -> RoutingDecision:
+        if context.confidence < self.threshold:
+            return RoutingDecision('ai', f"confidence {context.confidence:.2f} below {self.threshold:g}")
+        if self.new_layouts and not context.has_rules:
+            return RoutingDecision('ai', "no learned rules for this layout")
+        return RoutingDecision('skip', f"confidence {context.confidence:.2f}")
+
+
+class DeferPolicy(ThresholdPolicy):
+    """Same choice as ThresholdPolicy, but AI always runs in the background queue"""
+
+    name = 'defer'
+
+    def decide(self, context: RoutingContext) -> RoutingDecision:
+        decision = super().decide(context)
+        if decision.action == 'ai':
+            return decision._replace(action='defer')
+        return decision
+
+
+class RulesOnlyPolicy(RoutingPolicy):
+    """Never call AI"""
+
+    name = 'rules-only'
+
+    def decide(self, context: RoutingContext) -> RoutingDecision:
+        return RoutingDecision('skip', "rules only")
+
+
+# Policies selectable by name (cli.py --routing)
+ROUTING_POLICIES = {policy.name: policy for policy in (ThresholdPolicy, DeferPolicy, RulesOnlyPolicy)}
+
+
+def make_policy(name: str, max_cost: float = None, max_seconds: float = None, **options) -> RoutingPolicy:
+    """Named policy, with a batch budget when either limit is given"""
+    if name not in ROUTING_POLICIES:
+        raise ValueError(f"Unknown routing policy '{name}' (choose from {', '.join(ROUTING_POLICIES)})")
+    budget = AIBudget(max_cost, max_seconds) if max_cost is not None or max_seconds is not None else None
+    return ROUTING_POLICIES[name](budget=budget, **options)
+
+
+class DeferredDocument(NamedTuple):
+    """A rule-only document whose AI fallback was deferred"""
+    document: Any  # DocumentSchema
+    sender: Optional[str]
+    signature: Optional[str]
+    source_key: Optional[str] = None  # artifact store key, so the AI result is stored for reprocessing
+
+
+class DeferredAIQueue:
+    """Background thread running deferred AI fallbacks off the batch's critical path
+
+    Documents are finished with their rule fields first; put() queues the
+    AI call, and the upgraded document (same document_id) is available from
+    results() once it is done. The thread starts on the first put().
+    """
+
+    def __init__(self, finish):
+        self._finish = finish  # DeferredDocument -> (document or None, log); must not raise
+        self._pending = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, deferred: DeferredDocument):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='deferred-ai', daemon=True)
+                self._thread.start()
+        self._pending.put(deferred)
+
+    def _run(self):
+        while True:
+            deferred = self._pending.get()
+            try:
+                if deferred is None:
+                    return
+                self._results.put(self._finish(deferred))
+            finally:
+                self._pending.task_done()
+
+    @property
+    def backlog(self) -> int:
+        """Deferred documents not finished yet"""
+        return self._pending.unfinished_tasks
+
+    def results(self, wait: bool = False) -> Iterator[Tuple[Any, Any]]:
+        """Upgraded (document, log) pairs finished so far; with wait, once the queue is empty"""
+        if wait and self._thread is not None:
+            self._pending.join()
+        while True:
+            try:
+                yield self._results.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        """Stop the thread after the documents already queued"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._pending.put(None)
+            thread.join()
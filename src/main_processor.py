@@ -1,92 +1,648 @@
+import io
 import os
 import uuid
+import signal
 import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from typing import Dict, List, Any, Tuple
+from itertools import chain, islice
+from typing import Dict, List, Any, Tuple, Iterable, Iterator, AsyncIterator, NamedTuple, Optional, Union
 from config.schema import DocumentSchema, ProcessingLog
-from src.parsers.document_parser import DocumentParser
-from src.rules.signature_engine import SignatureEngine
-from src.utils.rule_processor import RuleProcessor
+from src.parsers.document_parser import DocumentParser, DocumentSource, as_source, is_path, source_name, source_size
+from src.parsers.bundle_reader import BundlePart, iter_bundle
+from src.rules.signature_engine import SignatureEngine, SignatureHead
+from src.rules.signature_store import SQLiteSignatureStore
+from src.rules.compiled_rules import compile_rules
+from src.rules.similarity import SHAPE_LINES
+from src.utils.rule_processor import RuleProcessor, resolve_fields, features_for
+from src.utils.document_scanner import DocumentScanner
+from src.utils.result_cache import ResultCache, DEFAULT_MAX_BYTES, file_digest
+from src.utils.artifact_store import ArtifactStore, stage_stamp, value_digest
+from src.utils.instrumentation import MetricsRegistry, timed, profiled
 from src.ai.gemini_processor import GeminiProcessor
+from src.ai.async_gemini_processor import AsyncGeminiProcessor
+from src.ai.response_cache import ResponseCache
+from src.ai.routing import (RoutingPolicy, ThresholdPolicy, RoutingContext, RoutingDecision,
+                            DeferredAIQueue, DeferredDocument)
+
+# Leading characters kept as document content in streaming mode
+STREAM_PREVIEW_CHARS = 2000
+
+# Documents queued per worker process in process_batch
+BATCH_QUEUE_FACTOR = 4
+
+# Documents waiting on AI per allowed concurrent request in process_batch_async
+AI_QUEUE_FACTOR = 4
+
+# Fewest pages a document needs before its known layout is parsed page by page
+EARLY_EXIT_MIN_PAGES = 3
+
+
+class PageProbe(NamedTuple):
+    """What the signature-first early exit found out, so a miss repeats none of it"""
+    doc_type: str
+    parsed: Optional[Tuple[str, Dict, str]] = None  # Whole text, or only the learned pages of a hit
+    signature: Optional[str] = None
+    match: Optional[Tuple[Optional[Dict], Optional[str], float]] = None  # match_pattern of the whole text
+    rules: Optional[Tuple[Dict[str, Any], float]] = None  # Compiled rule (extracted_fields, confidence) of a hit
+    stored: bool = False  # parsed is the artifact store's text
+
+class PreparedDocument(NamedTuple):
+    """A parsed, rule-extracted document waiting on its AI fallback"""
+    file_path: Any  # the document as given (path or in-memory source)
+    cache_key: Optional[str]
+    doc_id: str
+    content: str
+    metadata: Dict[str, Any]
+    doc_type: str
+    signature: str
+    scan: DocumentScanner
+    sender: Optional[str]
+    log: ProcessingLog
+    start_time: float
+    extracted_fields: Dict[str, Any]
+    confidence: float
+    source_key: Optional[str] = None
+    routing: Optional[RoutingDecision] = None
 
 class MainProcessor:
     """Main document processing pipeline"""
     
-    def __init__(self, gemini_api_key: str = None):
-        self.parser = DocumentParser()
-        self.signature_engine = SignatureEngine()
+    def __init__(self, gemini_api_key: str = None, signature_engine: SignatureEngine = None,
+                 cache_dir: str = None, cache_max_bytes: int = None, ai_model: Any = None,
+                 signature_db: str = None, metrics: MetricsRegistry = None, profile: bool = False,
+                 fields: Iterable[str] = None, parser_backends: Dict[str, Any] = None, artifact_db: str = None,
+                 routing: RoutingPolicy = None, defer_in_background: bool = True, page_workers: int = None):
+        self.gemini_api_key = gemini_api_key
+        self.metrics = metrics  # Aggregates every finished log when set
+        self.profile = profile  # Capture cProfile/tracemalloc per document into log.profile
+        # Extract only these fields (running only the scan passes they need); None extracts everything
+        self.fields = resolve_fields(fields) if fields is not None else None
+        self.parser_backends = parser_backends  # Preferred DocumentParser backends per format
+        # Processes extracting the pages of one large PDF; None extracts them in turn
+        self.page_workers = page_workers
+        self.parser = DocumentParser(parser_backends, page_workers)
         self.rule_processor = RuleProcessor()
-        self.ai_processor = GeminiProcessor(gemini_api_key) if gemini_api_key else None
+        self.ai_processor = None
+        if gemini_api_key or ai_model is not None:
+            # AI responses are shared through the result cache directory, when there is one
+            response_cache = ResponseCache(os.path.join(cache_dir, 'ai') if cache_dir else None)
+            self.ai_processor = GeminiProcessor(gemini_api_key, model=ai_model, response_cache=response_cache)
+            response_cache.purge_stale(self.ai_processor.version)
+        # Decides per document whether AI runs now, in the background or not at all
+        self.routing = routing or ThresholdPolicy()
+        # Deferred AI fallbacks run on a background thread (batch workers hand theirs back instead)
+        self.deferred = None
+        if self.ai_processor and defer_in_background:
+            self.deferred = DeferredAIQueue(self._finish_deferred_safely)
+        
+        if signature_engine is not None:
+            self.signature_engine = signature_engine
+        elif signature_db:
+            # Indexed store, seeded once from the JSON file it replaces
+            store = SQLiteSignatureStore(signature_db)
+            store.migrate_json('data/signatures.json')
+            self.signature_engine = SignatureEngine(store)
+        else:
+            # Load existing signatures
+            self.signature_engine = SignatureEngine()
+            self.signature_engine.load_signatures('data/signatures.json')
         
-        # Load existing signatures
-        self.signature_engine.load_signatures('data/signatures.json')
+        # Optional content-addressed result cache
+        self.cache = None
+        if cache_dir:
+            self.cache = ResultCache(cache_dir, cache_max_bytes or DEFAULT_MAX_BYTES)
+            self.cache.purge_stale(self.pipeline_versions())
+        
+        # Optional per-stage artifacts, so reprocessing reruns only stale stages
+        self.artifacts = ArtifactStore(artifact_db) if artifact_db else None
+    
+    def pipeline_versions(self) -> Tuple[str, ...]:
+        """Versions of every component a cached result depends on"""
+        return (self.parser.version, self.rule_processor.version, self.signature_engine.version)
+    
+    def _parse_stamp(self) -> str:
+        return stage_stamp(self.parser.version)
+    
+    def _signature_stamp(self) -> str:
+        return stage_stamp(self.parser.version, self.signature_engine.version)
+    
+    def _rules_stamp(self, existing_rules: Dict, matched: Optional[str], extractors: Dict = None) -> str:
+        """Rule output depends on the text, the rule code, the selected fields and the rules matched"""
+        return stage_stamp(self.parser.version, self.rule_processor.version, self.fields,
+                           value_digest([matched, existing_rules] + ([extractors] if extractors else [])))
     
-    def process_document(self, file_path: str, sender: str = None) -> Tuple[DocumentSchema, ProcessingLog]:
-        """Process single document through hybrid pipeline"""
+    def _ai_stamp(self) -> str:
+        return stage_stamp(self.parser.version, self.ai_processor.version)
+    
+    def process_document(self, source: DocumentSource, sender: str = None) -> Tuple[DocumentSchema, ProcessingLog]:
+        """Process single document through hybrid pipeline
+        
+        source is a file path, or the document's bytes or a readable binary
+        stream (named, e.g. an upload, so text files can be told by their
+        extension); in-memory documents are never written to disk.
+        """
+        if self.profile:
+            capture = {}
+            with profiled(capture):
+                document, log = self._process_document(source, sender)
+            log.profile = capture
+        else:
+            document, log = self._process_document(source, sender)
+        self._observe(log)
+        self._queue_deferred(document, log, sender)
+        return document, log
+    
+    def _process_document(self, source: DocumentSource, sender: str = None) -> Tuple[DocumentSchema, ProcessingLog]:
+        """Pipeline steps for one document, timed per stage"""
         start_time = time.time()
         doc_id = str(uuid.uuid4())
+        source = as_source(source)
         
         log = ProcessingLog(document_id=doc_id)
         log.steps.append("Started processing")
+        timings = log.stage_timings
+        log.input_bytes = source_size(source)
+        
+        # Step 0: Identical documents are served from the cache
+        source_key = self._source_key(source, sender, log)
+        cache_key, cached = self._cached_document(source, sender, doc_id, log, start_time, source_key)
+        if cached:
+            return cached, log
+        
+        # Step 1: Known layouts parse only the pages holding their fields
+        probe = self._known_pages_stage(source, sender, log, source_key)
+        if probe.rules:
+            content, metadata, doc_type = probe.parsed
+            document, log = self._complete_document(doc_id, content, metadata, doc_type, probe.signature, None,
+                                                    sender, log, start_time, rules=probe.rules)
+        else:
+            # Parse document (or reuse its stored text)
+            content, metadata, doc_type = self._parse_stage(source, log, source_key, probe)
+            
+            # Steps 2-5: Signature, rules, AI fallback and normalization
+            document, log = self._extract_parsed(doc_id, source_key, content, metadata, doc_type, sender, log,
+                                                 start_time, probe)
+        
+        if cache_key and not log.ai_deferred and not log.ai_failed:
+            with timed(timings, 'cache_store'):
+                self.cache.put(cache_key, document)
+        return document, log
+    
+    def _observe(self, log: ProcessingLog, failed: bool = False):
+        """Hand a finished log to the metrics registry, if any"""
+        if self.metrics:
+            self.metrics.observe(log, failed)
+    
+    def _cached_document(self, source: Union[str, io.BytesIO], sender: str, doc_id: str, log: ProcessingLog,
+                         start_time: float, source_key: str = None) -> Tuple[Optional[str], Optional[DocumentSchema]]:
+        """Cache key for a document and its cached result, if any"""
+        if not self.cache:
+            return None, None
+        with timed(log.stage_timings, 'cache'):
+            context = (sender or '', bool(self.ai_processor))
+            if self.ai_processor:
+                context += (self.routing.name,)
+            if self.fields is not None:
+                context += (self.fields,)
+            cache_key = self.cache.make_key(source, self.pipeline_versions(), context, source_key)
+            cached = self.cache.get(cache_key)
+        if not cached:
+            return cache_key, None
+        
+        document = cached.model_copy(update={'document_id': doc_id})
+        log.cache_hit = True
+        log.steps.append(f"Cache hit for {cache_key.split('-')[-1][:12]}, skipped parsing and extraction")
+        processing_time = time.time() - start_time
+        log.processing_time = processing_time
+        log.steps.append(f"Completed in {processing_time:.2f}s")
+        return cache_key, document
+    
+    def _source_key(self, source: Union[str, io.BytesIO], sender: str, log: ProcessingLog) -> Optional[str]:
+        """Artifact key of a file (the SHA-256 of its bytes), recorded with its path and sender"""
+        if not self.artifacts:
+            return None
+        with timed(log.stage_timings, 'artifacts'):
+            source_key = log.source_key = file_digest(source)
+            self.artifacts.record_source(source_key, source if is_path(source) else None, sender)
+        return source_key
+    
+    def _stored_parse(self, source_key: str, log: ProcessingLog, stamp: str = None) -> Optional[Tuple[str, Dict, str]]:
+        """Stored (content, metadata, doc_type) of a document, if current"""
+        with timed(log.stage_timings, 'artifacts'):
+            parsed = self.artifacts.get(source_key, 'parse', stamp or self._parse_stamp())
+        if parsed is None:
+            return None
+        log.content_chars = len(parsed['content'])
+        log.steps.append(f"Reused parsed {parsed['doc_type']} document")
+        return parsed['content'], parsed['metadata'], parsed['doc_type']
+    
+    def _parse_stage(self, source: Union[str, io.BytesIO], log: ProcessingLog, source_key: str = None,
+                     probe: PageProbe = None) -> Tuple[str, Dict, str]:
+        """Detect and parse a file, reusing its stored text while the parser version is unchanged
+        
+        A probe from _known_pages_stage, which has already looked for stored
+        text, supplies the detected type and, for paged documents, the text.
+        """
+        if probe is not None and probe.stored:
+            return probe.parsed
+        if source_key and probe is None:
+            parsed = self._stored_parse(source_key, log)
+            if parsed:
+                return parsed
         
-        # Step 1: Parse document
-        content, metadata, doc_type = self.parser.parse_document(file_path)
+        timings = log.stage_timings
+        if probe is not None and probe.parsed:
+            content, metadata, doc_type = probe.parsed
+        else:
+            if probe is not None:
+                doc_type = probe.doc_type
+            else:
+                with timed(timings, 'detect'):
+                    doc_type = self.parser.detect_format(source)
+            with timed(timings, 'parse'):
+                content, metadata, doc_type = self.parser.parse_document(source, doc_type)
+        log.content_chars = len(content)
         log.steps.append(f"Parsed {doc_type} document")
+        if source_key:
+            with timed(timings, 'artifacts'):
+                self.artifacts.put(source_key, 'parse', self._parse_stamp(),
+                                   {'content': content, 'metadata': metadata, 'doc_type': doc_type})
+        return content, metadata, doc_type
+    
+    def _known_pages_stage(self, source: Union[str, io.BytesIO], sender: str, log: ProcessingLog,
+                           source_key: str = None) -> PageProbe:
+        """Signature-first early exit: parse only the pages a known layout keeps its fields on
+        
+        Leading pages are read until they settle the signature and cover the
+        lines its similarity sketch is taken from, so both (and the pattern
+        match) come out as they would from the whole text. When the layout's
+        compiled rules know the pages holding its fields and those are fewer
+        than the document has, only they are parsed and probe.rules holds
+        the fields. Otherwise the open document is parsed whole, reusing the
+        pages already read. With an artifact store, stored text is reused
+        instead, and the partial text of a hit is not stored (reprocessing
+        reparses the file); in-memory documents, which cannot be reparsed,
+        are parsed whole. Skipped with selected fields.
+        """
+        if source_key:
+            parsed = self._stored_parse(source_key, log)
+            if parsed:
+                return PageProbe(parsed[2], parsed, stored=True)
+        timings = log.stage_timings
+        with timed(timings, 'detect'):
+            doc_type = self.parser.detect_format(source)
+        if self.fields is not None or (source_key and not is_path(source)):
+            return PageProbe(doc_type)
+        with timed(timings, 'parse'):
+            document = self.parser.open_pages(source, doc_type)
+        if document is None:
+            return PageProbe(doc_type)
+        with document:
+            texts = {}
+            if document.page_count < EARLY_EXIT_MIN_PAGES:
+                with timed(timings, 'parse'):
+                    return PageProbe(doc_type, self.parser.parse_opened(document, source, doc_type))
+            head = SignatureHead()
+            settled = False
+            with timed(timings, 'parse'):
+                for page in range(document.page_count):
+                    texts[page] = document.text(page)
+                    settled = head.feed(texts[page])
+                    if settled and "".join(texts.values()).lstrip().count('\n') > SHAPE_LINES:
+                        break
+            if not settled:
+                # Every page was read without settling the signature (a very short document)
+                with timed(timings, 'parse'):
+                    return PageProbe(doc_type, self.parser.parse_opened(document, source, doc_type, texts))
+            with timed(timings, 'signature'):
+                signature = self.signature_engine.extract_signature_from_head(head, document.metadata)
+            with timed(timings, 'rules.match'):
+                sketch = self.signature_engine.extract_sketch("".join(texts.values()).strip())
+                match = self.signature_engine.match_pattern(signature, sketch, sender)
+                entry, matched, _ = match
+                compiled = self.signature_engine.compiled_rules(matched, entry, sender) if entry else None
+                pages = compiled.pages_for(document.page_count) if compiled else None
+            fast = None
+            if pages and len(pages) < document.page_count:
+                with timed(timings, 'parse'):
+                    for page in pages:
+                        if page not in texts:
+                            texts[page] = document.text(page)
+                with timed(timings, 'rules.compiled'):
+                    fast = compiled.extract_pages({page: texts[page] for page in pages}, document.page_count)
+                if fast is None:
+                    log.steps.append("Compiled rules missed on the learned pages, parsing the whole document")
+            if fast is None:
+                with timed(timings, 'parse'):
+                    parsed = self.parser.parse_opened(document, source, doc_type, texts)
+                return PageProbe(doc_type, parsed, signature, match)
+            metadata = dict(document.metadata, pages_parsed=[page + 1 for page in pages])
         
-        # Step 2: Extract signature
-        signature = self.signature_engine.extract_signature(content, metadata)
+        content = "".join(texts[page] for page in pages).strip()
+        log.content_chars = len(content)
+        log.signature = signature
+        log.steps.append(f"Parsed pages {', '.join(map(str, metadata['pages_parsed']))} "
+                         f"of {metadata['pages']} of {doc_type} document")
         log.steps.append(f"Extracted signature: {signature}")
+        log.rules_applied.append(f"Applied compiled rules of signature {matched} to pages "
+                                 f"{', '.join(map(str, metadata['pages_parsed']))}")
+        return PageProbe(doc_type, (content, metadata, doc_type), signature, match, fast)
+    
+    def _signature_stage(self, content: str, metadata: Dict, log: ProcessingLog, source_key: str = None,
+                         signature: str = None) -> str:
+        """Layout signature of parsed content, reused while parser and engine versions are unchanged
+        
+        signature passes in one already taken from the leading pages.
+        """
+        timings = log.stage_timings
+        stored = None
+        if source_key and signature is None:
+            with timed(timings, 'artifacts'):
+                stored = self.artifacts.get(source_key, 'signature', self._signature_stamp())
+        if stored:
+            signature = log.signature = stored['signature']
+            log.steps.append(f"Reused signature: {signature}")
+            return signature
+        
+        if signature is None:
+            with timed(timings, 'signature'):
+                signature = self.signature_engine.extract_signature(content, metadata)
+        log.signature = signature
+        log.steps.append(f"Extracted signature: {signature}")
+        if source_key:
+            with timed(timings, 'artifacts'):
+                self.artifacts.put(source_key, 'signature', self._signature_stamp(), {'signature': signature})
+        return signature
+    
+    def _extract_parsed(self, doc_id: str, source_key: Optional[str], content: str, metadata: Dict, doc_type: str,
+                        sender: str, log: ProcessingLog, start_time: float,
+                        probe: PageProbe = None) -> Tuple[DocumentSchema, ProcessingLog]:
+        """Signature, rules, AI fallback and normalization for parsed content (reusing a probe's signature and match)"""
+        signature = self._signature_stage(content, metadata, log, source_key, probe.signature if probe else None)
+        return self._complete_document(doc_id, content, metadata, doc_type, signature, None, sender, log,
+                                       start_time, source_key, match=probe.match if probe else None)
+    
+    def process_document_stream(self, source: DocumentSource, sender: str = None,
+                                chunk_size: int = None) -> Iterator[Dict[str, Any]]:
+        """Process a very large document block by block with bounded memory
         
+        Yields {'event': 'signature'} as soon as the leading lines are read,
+        {'event': 'block'} with the fields each block added, and finally
+        {'event': 'complete'} with the document and log. The document keeps
+        only a leading preview of the text as its content.
+        """
+        start_time = time.time()
+        doc_id = str(uuid.uuid4())
+        
+        source = as_source(source)
+        
+        log = ProcessingLog(document_id=doc_id)
+        log.steps.append("Started streaming")
+        timings = log.stage_timings
+        log.input_bytes = source_size(source)
+        
+        blocks, metadata, doc_type = self.parser.iter_document(source, chunk_size)
+        head = SignatureHead()
+        signature = None
+        scan = DocumentScanner(retain_text=False, features=features_for(self.fields))
+        preview = []
+        preview_size = 0
+        
+        for block in blocks:
+            if preview_size < STREAM_PREVIEW_CHARS:
+                preview.append(block.text[:STREAM_PREVIEW_CHARS - preview_size])
+                preview_size += len(preview[-1])
+            
+            if signature is None:
+                with timed(timings, 'signature'):
+                    if head.feed(block.text):
+                        signature = self.signature_engine.extract_signature_from_head(head, metadata)
+                if signature is not None:
+                    log.steps.append(f"Extracted signature: {signature}")
+                    yield {'event': 'signature', 'signature': signature}
+            
+            with timed(timings, 'rules.scan'):
+                fields = self.rule_processor.extract_block(scan, block.text)
+            yield {'event': 'block', 'offset': block.offset, 'page': block.page, **fields}
+        
+        with timed(timings, 'rules.scan'):
+            scan.finish()
+        log.content_chars = scan.char_count
+        log.steps.append(f"Streamed {doc_type} document ({scan.char_count} chars)")
+        if signature is None:
+            signature = self.signature_engine.extract_signature_from_head(head, metadata)
+            log.steps.append(f"Extracted signature: {signature}")
+            yield {'event': 'signature', 'signature': signature}
+        
+        metadata['streamed'] = True
+        content = "".join(preview).strip()
+        log.signature = signature
+        document, log = self._complete_document(doc_id, content, metadata, doc_type, signature, scan, sender, log, start_time)
+        self._observe(log)
+        self._queue_deferred(document, log, sender)
+        yield {'event': 'complete', 'document': document, 'log': log}
+    
+    def _complete_document(self, doc_id: str, content: str, metadata: Dict, doc_type: str, signature: str,
+                           scan: Optional[DocumentScanner], sender: str, log: ProcessingLog,
+                           start_time: float, source_key: str = None,
+                           rules: Tuple[Dict[str, Any], float] = None,
+                           match: Tuple[Optional[Dict], Optional[str], float] = None
+                           ) -> Tuple[DocumentSchema, ProcessingLog]:
+        """Rule extraction, AI fallback and normalization (content is scanned only if the rules run)
+        
+        rules passes in (extracted_fields, confidence) already found by a
+        learned layout's compiled rules, match a pattern match already made.
+        """
         # Step 3: Try rule-based extraction
-        existing_rules = self.signature_engine.get_rules(signature, sender)
-        if existing_rules:
-            extracted_fields, confidence = self.rule_processor.apply_rules(content, existing_rules)
-            log.rules_applied.append(f"Applied existing rules for signature {signature}")
-            processing_method = "rule_based"
+        if rules is not None:
+            (extracted_fields, confidence), has_rules = rules, True
         else:
-            extracted_fields, confidence = self.rule_processor.apply_rules(content)
-            log.rules_applied.append("Applied default rules")
-            processing_method = "rule_based"
+            extracted_fields, confidence, has_rules, scan = self._apply_rules(content, signature, scan, sender, log,
+                                                                              source_key, match)
+        
+        # Step 4: AI fallback if the routing policy asks for it now
+        ai_result = None
+        decision = self._route_ai(content, doc_type, extracted_fields, confidence, has_rules, log)
+        if decision.action == 'ai':
+            ai_result = self._stored_ai_result(source_key, log)
+            if ai_result is not None:
+                self.routing.record(decision, 0.0)
+            else:
+                log.steps.append("Using AI for low confidence document")
+                started = time.perf_counter()
+                with timed(log.stage_timings, 'ai'):
+                    ai_result = self.ai_processor.extract_structured_data(content, doc_type, extracted_fields)
+                self._record_ai(decision, ai_result, time.perf_counter() - started)
+                self._store_ai_result(source_key, ai_result, log)
         
-        # Step 4: AI fallback if needed
+        return self._finish_document(doc_id, content, metadata, doc_type, signature, scan, sender, log,
+                                     start_time, extracted_fields, confidence, ai_result)
+    
+    def _apply_rules(self, content: str, signature: str, scan: Optional[DocumentScanner], sender: str,
+                     log: ProcessingLog, source_key: str = None,
+                     match: Tuple[Optional[Dict], Optional[str], float] = None
+                     ) -> Tuple[Dict[str, Any], float, bool, Optional[DocumentScanner]]:
+        """Rule-based fields, their confidence, whether learned rules matched and the scan used
+        
+        With a source_key, the stored rule output is reused while the text,
+        rule code, selected fields and matched rules are unchanged; content
+        without a scan is only tokenized when the rules actually run. A
+        learned layout's compiled extractors replace the full extraction
+        when they find its fields. match passes in the match_pattern result
+        for this content when it is already known.
+        """
+        timings = log.stage_timings
+        if match is None:
+            with timed(timings, 'rules.match'):
+                sketch = self.signature_engine.extract_sketch(content)
+                match = self.signature_engine.match_pattern(signature, sketch, sender)
+        entry, matched, similarity = match
+        existing_rules = (entry or {}).get('rules', {})
+        
+        stored = None
+        if source_key:
+            stamp = self._rules_stamp(existing_rules, matched, (entry or {}).get('extractors'))
+            with timed(timings, 'artifacts'):
+                stored = self.artifacts.get(source_key, 'rules', stamp)
+        if stored:
+            extracted_fields, confidence = stored['extracted_fields'], stored['confidence']
+            log.rules_applied.append(stored['rules_applied'])
+            log.steps.append("Reused rule output")
+        else:
+            compiled = None
+            if existing_rules and scan is None and self.fields is None:
+                compiled = self.signature_engine.compiled_rules(matched, entry, sender)
+            fast = None
+            if compiled is not None:
+                with timed(timings, 'rules.compiled'):
+                    fast = self.rule_processor.apply_compiled(content, compiled)
+                if fast is None:
+                    log.steps.append("Compiled rules missed, running full extraction")
+            if fast is not None:
+                extracted_fields, confidence = fast
+                log.rules_applied.append(f"Applied compiled rules of signature {matched}")
+            else:
+                # Step 3a: Tokenize once for every rule extractor
+                if scan is None:
+                    with timed(timings, 'rules.scan'):
+                        scan = self.rule_processor.scan(content, self.fields)
+                if existing_rules:
+                    extracted_fields, confidence = self.rule_processor.apply_rules(
+                        content, existing_rules, scan=scan, timings=timings, fields=self.fields)
+                    if matched == signature:
+                        log.rules_applied.append(f"Applied existing rules for signature {signature}")
+                    else:
+                        log.rules_applied.append(
+                            f"Applied rules of similar signature {matched} (similarity {similarity:.2f})")
+                else:
+                    extracted_fields, confidence = self.rule_processor.apply_rules(content, scan=scan, timings=timings,
+                                                                                  fields=self.fields)
+                    log.rules_applied.append("Applied default rules")
+            if source_key:
+                with timed(timings, 'artifacts'):
+                    self.artifacts.put(source_key, 'rules', stamp, {'extracted_fields': extracted_fields,
+                                                                    'confidence': confidence,
+                                                                    'rules_applied': log.rules_applied[-1]})
+        
+        return extracted_fields, confidence, bool(existing_rules), scan
+    
+    def _route_ai(self, content: str, doc_type: str, extracted_fields: Dict[str, Any], confidence: float,
+                  has_rules: bool, log: ProcessingLog) -> RoutingDecision:
+        """Ask the routing policy what to do with a document's AI fallback"""
+        if not self.ai_processor:
+            return RoutingDecision('skip', "no AI configured")
+        if not content.strip():
+            # An empty or unreadable document scores 0 every time; the AI has nothing to read either
+            decision = RoutingDecision('skip', "no text to extract from")
+        else:
+            estimated_cost = 0.0
+            if self.routing.needs_cost_estimate:
+                estimated_cost = self.ai_processor.estimate_cost(content, extracted_fields)
+            decision = self.routing.route(RoutingContext(confidence, has_rules, len(content), doc_type,
+                                                         estimated_cost, self.routing.ai_seconds))
+        log.routing_policy = self.routing.name
+        log.routing_action = decision.action
+        log.steps.append(f"AI routing ({self.routing.name}): {decision.action}, {decision.reason}")
+        if decision.action == 'defer':
+            log.ai_deferred = True
+        return decision
+    
+    def _record_ai(self, decision: RoutingDecision, ai_result: Dict[str, Any], seconds: float):
+        """Charge a finished AI call to the routing policy's budget and latency estimate"""
+        cached = ai_result.get('cached', False)
+        self.routing.record(decision, ai_result.get('cost', 0.0), None if cached else seconds)
+    
+    def _stored_ai_result(self, source_key: Optional[str], log: ProcessingLog) -> Optional[Dict[str, Any]]:
+        """A successful AI result stored for this text and prompt version (at no new cost)"""
+        if not source_key:
+            return None
+        with timed(log.stage_timings, 'artifacts'):
+            stored = self.artifacts.get(source_key, 'ai', self._ai_stamp())
+        if stored is None:
+            return None
+        log.steps.append("Reused stored AI result")
+        return dict(stored, cost=0.0, tokens_used=0, prompt_tokens=0, output_tokens=0)
+    
+    def _store_ai_result(self, source_key: Optional[str], ai_result: Dict[str, Any], log: ProcessingLog):
+        """Keep a successful AI result so reprocessing never pays for it twice"""
+        if source_key and ai_result and not ai_result.get('extracted_data', {}).get('error'):
+            with timed(log.stage_timings, 'artifacts'):
+                self.artifacts.put(source_key, 'ai', self._ai_stamp(), ai_result)
+    
+    def _finish_document(self, doc_id: str, content: str, metadata: Dict, doc_type: str, signature: str,
+                         scan: DocumentScanner, sender: str, log: ProcessingLog, start_time: float,
+                         extracted_fields: Dict[str, Any], confidence: float,
+                         ai_result: Dict[str, Any] = None) -> Tuple[DocumentSchema, ProcessingLog]:
+        """Merge an AI result (if any) into the rule fields and build the document"""
+        processing_method = "rule_based"
         ai_cost = 0.0
-        if self.ai_processor and (confidence < 0.7 or not existing_rules):
-            log.steps.append("Using AI for low confidence document")
-            ai_result = self.ai_processor.extract_structured_data(content, doc_type)
+        if ai_result and 'extracted_data' in ai_result and not ai_result['extracted_data'].get('error'):
+            extracted_fields.update(ai_result['extracted_data'])
+            confidence = max(confidence, ai_result['extracted_data'].get('confidence', 0.5))
+            processing_method = "ai_assisted"
+            log.ai_usage = True
+            ai_cost = ai_result.get('cost', 0.0)
+            log.ai_prompt_tokens = ai_result.get('prompt_tokens', 0)
+            log.ai_output_tokens = ai_result.get('output_tokens', 0)
+            log.ai_cache_hit = ai_result.get('cached', False)
+            if log.ai_cache_hit:
+                log.steps.append("Reused AI response of a matching prompt")
             
-            if 'extracted_data' in ai_result and not ai_result['extracted_data'].get('error'):
-                extracted_fields.update(ai_result['extracted_data'])
-                confidence = max(confidence, ai_result['extracted_data'].get('confidence', 0.5))
-                processing_method = "ai_assisted"
-                log.ai_usage = True
-                ai_cost = ai_result.get('cost', 0.0)
-                
-                # Learn new pattern if AI was successful
-                if confidence > 0.8:
-                    self.signature_engine.learn_pattern(signature, extracted_fields, sender)
-                    log.steps.append("Learned new pattern from AI extraction")
+            # Learn new pattern if AI was successful
+            if confidence > 0.8:
+                self.signature_engine.learn_pattern(signature, extracted_fields, sender,
+                                                    self.signature_engine.extract_sketch(content),
+                                                    compile_rules(content, extracted_fields,
+                                                                  metadata.get('page_starts')))
+                log.steps.append("Learned new pattern from AI extraction")
+        elif ai_result and ai_result.get('extracted_data', {}).get('error'):
+            log.ai_failed = True
+            log.warnings.append(f"AI extraction failed, kept rule fields: {ai_result['extracted_data']['error']}")
         
         # Step 5: Create normalized output
-        basic_fields = self.rule_processor.extract_basic_fields(content)
-        
-        # Ensure title is a string
-        title = extracted_fields.get('title') or basic_fields.get('title')
-        if isinstance(title, list) and title:
-            title = title[0]
-        elif not isinstance(title, str):
-            title = str(title) if title else None
-            
-        document = DocumentSchema(
-            document_id=doc_id,
-            title=title,
-            content=content,
-            metadata=metadata,
-            extracted_fields=extracted_fields,
-            source_type=doc_type,
-            processed_at=datetime.now(),
-            confidence_score=confidence,
-            processing_method=processing_method
-        )
+        with timed(log.stage_timings, 'schema'):
+            # Ensure title is a string (basic fields need a scan, absent when stored rule output was reused)
+            title = extracted_fields.get('title')
+            if not title and scan is not None:
+                title = self.rule_processor.extract_basic_fields(content, scan=scan).get('title')
+            if isinstance(title, list) and title:
+                title = title[0]
+            elif not isinstance(title, str):
+                title = str(title) if title else None
+                
+            document = DocumentSchema(
+                document_id=doc_id,
+                title=title,
+                content=content,
+                metadata=metadata,
+                extracted_fields=extracted_fields,
+                source_type=doc_type,
+                processed_at=datetime.now(),
+                confidence_score=confidence,
+                processing_method=processing_method
+            )
         
         # Complete log
         processing_time = time.time() - start_time
@@ -96,6 +652,448 @@ class MainProcessor:
         
         return document, log
     
+    def process_batch(self, file_paths: Iterable[DocumentSource], sender: str = None, workers: int = None,
+                      pool: ProcessPoolExecutor = None, batch: Tuple[str, float] = None
+                      ) -> Iterator[Tuple[Any, Optional[DocumentSchema], ProcessingLog]]:
+        """Process many documents across worker processes, yielding results as they complete
+        
+        Workers start from a snapshot of the learned signatures; patterns they
+        learn are merged back into this processor's SignatureEngine as each
+        result arrives. A failed document yields None with the error in the
+        log warnings. A pool from batch_pool() is reused (and left running)
+        instead of starting one per call. The routing policy's budget covers
+        the whole batch (split evenly across worker processes); calls passing
+        the same batch (id, start time) share one budget instead of each
+        resetting it. Documents may be paths or in-memory sources (see
+        process_document); each result carries the item it was given.
+        """
+        return self._fan_out(file_paths, sender, workers, pool, self._process_safely, _process_in_batch_worker,
+                             batch)
+    
+    def process_bundle(self, source: DocumentSource, sender: str = None, workers: int = None,
+                       pool: ProcessPoolExecutor = None, name: str = None
+                       ) -> Iterator[Tuple[BundlePart, Optional[DocumentSchema], ProcessingLog]]:
+        """Process every document in a ZIP archive, mbox or email message, yielding results as they complete
+        
+        Members, messages and attachments are read one at a time (see
+        iter_bundle) and go through process_batch as in-memory documents, so
+        only the documents in flight are held in memory, however large the
+        bundle. Each document's metadata['provenance'] records its path in
+        the bundle, the path of the part it was found in and how it was
+        found. Parts that cannot be read yield None, like failed documents.
+        """
+        parts = {}
+        unreadable = []
+        
+        def sources():
+            for part in iter_bundle(source, self.parser, name):
+                if part.error:
+                    unreadable.append(part)
+                    continue
+                parts[part.source] = part
+                yield part.source
+        
+        def failed():
+            while unreadable:
+                part = unreadable.pop(0)
+                log = self._failure_log(part.path, part.error)
+                self._observe(log, failed=True)
+                yield part, None, log
+        
+        for item, document, log in self.process_batch(sources(), sender, workers, pool):
+            yield from failed()
+            part = parts.pop(item)
+            if document is not None:
+                document.metadata['provenance'] = part.provenance
+            yield part, document, log
+        yield from failed()
+    
+    def reprocess(self, source_keys: Iterable[str] = None, sender: str = None, workers: int = None,
+                  pool: ProcessPoolExecutor = None) -> Iterator[Tuple[str, Optional[DocumentSchema], ProcessingLog]]:
+        """Rerun stored documents (all, or the given artifact keys), recomputing only stale stages
+        
+        Parsed text is reused while the parser version is unchanged, so new
+        rule code, learned patterns or a different field selection never
+        touch the original files; the files are read again only when the
+        parser itself changed. Each document keeps the sender it was last
+        processed with unless one is given. Yields (source_key, document,
+        log) like process_batch.
+        """
+        if not self.artifacts:
+            raise ValueError("Reprocessing needs an artifact store (artifact_db)")
+        return self._fan_out(self.artifacts.source_keys(source_keys), sender, workers, pool,
+                             self._reprocess_safely, _reprocess_in_batch_worker)
+    
+    def _fan_out(self, items: Iterable[str], sender: Optional[str], workers: Optional[int],
+                 pool: Optional[ProcessPoolExecutor], serial, task, batch: Tuple[str, float] = None
+                 ) -> Iterator[Tuple[str, Optional[DocumentSchema], ProcessingLog]]:
+        """Run serial(item, sender) here, or task(item, sender, batch) across worker processes
+        
+        Items are drawn lazily, so generators (bundle parts, say) are never
+        held in memory whole.
+        """
+        items = iter(items)
+        batch = batch or (str(uuid.uuid4()), time.time())
+        self.routing.start_batch(*batch)
+        # No more workers than items, judged from the first few
+        head = list(islice(items, workers or os.cpu_count() or 1))
+        workers = len(head)
+        items = chain(head, items)
+        if workers <= 1 and pool is None:
+            for item in items:
+                document, log = serial(item, sender)
+                yield item, document, log
+            return
+        
+        owned = pool is None
+        if owned:
+            pool = self.batch_pool(workers)
+        try:
+            # Keep a bounded number of documents in flight so huge batches
+            # don't queue every path (and every result) at once
+            pending = iter(items)
+            in_flight = {}
+            
+            def submit(item):
+                # In-memory documents travel to workers as plain (picklable) BytesIO
+                in_flight[pool.submit(task, as_source(item), sender, batch)] = item
+            
+            for item in pending:
+                submit(item)
+                if len(in_flight) >= workers * BATCH_QUEUE_FACTOR:
+                    break
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = in_flight.pop(future)
+                    document, log, learned = future.result()
+                    self.signature_engine.merge_learned(learned)
+                    self._observe(log, failed=document is None)
+                    self._queue_deferred(document, log, sender)
+                    next_item = next(pending, None)
+                    if next_item is not None:
+                        submit(next_item)
+                    yield item, document, log
+        finally:
+            if owned:
+                pool.shutdown(wait=True, cancel_futures=True)
+    
+    def reprocess_document(self, source_key: str, sender: str = None) -> Tuple[DocumentSchema, ProcessingLog]:
+        """Rerun one stored document through the stages whose stamps changed"""
+        document, log = self._reprocess_document(source_key, sender)
+        self._observe(log)
+        self._queue_deferred(document, log, sender)
+        return document, log
+    
+    def _reprocess_document(self, source_key: str, sender: str = None) -> Tuple[DocumentSchema, ProcessingLog]:
+        start_time = time.time()
+        doc_id = str(uuid.uuid4())
+        log = ProcessingLog(document_id=doc_id)
+        log.steps.append(f"Started reprocessing {source_key[:12]}")
+        
+        source = self.artifacts.source(source_key)
+        if source is None:
+            raise KeyError(f"No stored document {source_key}")
+        file_path, stored_sender = source
+        sender = sender if sender is not None else stored_sender
+        log.source_key = source_key
+        
+        parsed = self._stored_parse(source_key, log)
+        if parsed is None:
+            # The parser changed: reparse the original if it is still there and unchanged
+            if file_path and os.path.isfile(file_path) and file_digest(file_path) == source_key:
+                log.input_bytes = os.path.getsize(file_path)
+                parsed = self._parse_stage(file_path, log, source_key)
+            else:
+                with timed(log.stage_timings, 'artifacts'):
+                    stale = self.artifacts.get(source_key, 'parse')
+                if stale is None:
+                    raise FileNotFoundError(f"{file_path or 'In-memory document'} is missing or changed "
+                                            f"and no parsed text is stored")
+                parsed = stale['content'], stale['metadata'], stale['doc_type']
+                log.content_chars = len(stale['content'])
+                log.warnings.append(f"{file_path or 'In-memory document'} is missing or changed; "
+                                    f"reused text from an older parser version")
+        
+        content, metadata, doc_type = parsed
+        return self._extract_parsed(doc_id, source_key, content, metadata, doc_type, sender, log, start_time)
+    
+    def _reprocess_safely(self, source_key: str, sender: str = None) -> Tuple[Optional[DocumentSchema], ProcessingLog]:
+        """Reprocess a stored document, reporting failures in the log instead of raising"""
+        try:
+            return self.reprocess_document(source_key, sender)
+        except Exception as e:
+            log = self._failure_log(source_key, e)
+            self._observe(log, failed=True)
+            return None, log
+    
+    def batch_pool(self, workers: int = None) -> ProcessPoolExecutor:
+        """Worker processes for process_batch, started from this processor's state"""
+        return ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1,
+            initializer=_init_batch_worker,
+            initargs=(self.gemini_api_key, self._signature_options(), self._worker_options(workers))
+        )
+    
+    async def process_batch_async(self, file_paths: Iterable[DocumentSource], sender: str = None,
+                                  ai_processor: AsyncGeminiProcessor = None
+                                  ) -> AsyncIterator[Tuple[str, Optional[DocumentSchema], ProcessingLog]]:
+        """Process documents in this process while AI fallbacks run concurrently
+        
+        Parsing and rule extraction run one document at a time in a worker
+        thread; documents that need AI are handed to an AsyncGeminiProcessor
+        and parsing moves straight on to the next file. Results are yielded
+        as they complete, so rule-only documents are not held up behind AI
+        calls. Pass ai_processor to tune concurrency, rate limits, retries
+        and prompt packing; by default one is built around this processor's
+        model. Patterns learned from an AI result only apply to documents
+        parsed after it arrives.
+        """
+        if ai_processor is None and self.ai_processor:
+            ai_processor = AsyncGeminiProcessor(self.gemini_api_key, model=self.ai_processor.model,
+                                                response_cache=self.ai_processor.response_cache)
+        self.routing.start_batch(str(uuid.uuid4()), time.time())
+        
+        max_waiting = (ai_processor.max_concurrency if ai_processor else 1) * AI_QUEUE_FACTOR
+        waiting = set()
+        for file_path in file_paths:
+            prepared = await asyncio.to_thread(self._prepare_document, file_path, sender)
+            if isinstance(prepared, PreparedDocument):
+                waiting.add(asyncio.ensure_future(self._finish_with_ai(prepared, ai_processor)))
+            else:
+                yield self._observed(prepared, sender)
+            
+            # Hand back documents whose AI call finished meanwhile, and stop
+            # parsing ahead once too many are waiting on AI
+            done = {task for task in waiting if task.done()}
+            if len(waiting) - len(done) >= max_waiting:
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            waiting -= done
+            for task in done:
+                yield self._observed(task.result(), sender)
+        
+        for task in asyncio.as_completed(waiting):
+            yield self._observed(await task, sender)
+    
+    def _observed(self, result: Tuple[str, Optional[DocumentSchema], ProcessingLog], sender: str = None) -> tuple:
+        """Observe a (file_path, document, log) result, queue its deferred AI fallback and pass it through"""
+        self._observe(result[2], failed=result[1] is None)
+        self._queue_deferred(result[1], result[2], sender)
+        return result
+    
+    def _prepare_document(self, file_path: DocumentSource, sender: str = None):
+        """Steps 0-3 of process_document
+        
+        Returns the finished (file_path, document, log) when no AI is needed
+        (or the document was cached or failed), otherwise a PreparedDocument
+        waiting on its AI fallback.
+        """
+        start_time = time.time()
+        doc_id = str(uuid.uuid4())
+        log = ProcessingLog(document_id=doc_id)
+        log.steps.append("Started processing")
+        
+        try:
+            source = as_source(file_path)
+            log.input_bytes = source_size(source)
+            source_key = self._source_key(source, sender, log)
+            cache_key, cached = self._cached_document(source, sender, doc_id, log, start_time, source_key)
+            if cached:
+                return file_path, cached, log
+            
+            probe = self._known_pages_stage(source, sender, log, source_key)
+            if probe.rules:
+                content, metadata, doc_type = probe.parsed
+                signature, (extracted_fields, confidence) = probe.signature, probe.rules
+                has_rules, scan = True, None
+            else:
+                content, metadata, doc_type = self._parse_stage(source, log, source_key, probe)
+                signature = self._signature_stage(content, metadata, log, source_key, probe.signature)
+                extracted_fields, confidence, has_rules, scan = self._apply_rules(content, signature, None, sender,
+                                                                                  log, source_key, probe.match)
+            decision = self._route_ai(content, doc_type, extracted_fields, confidence, has_rules, log)
+            prepared = PreparedDocument(file_path, cache_key, doc_id, content, metadata, doc_type, signature,
+                                        scan, sender, log, start_time, extracted_fields, confidence, source_key,
+                                        decision)
+            if decision.action == 'ai':
+                ai_result = self._stored_ai_result(source_key, log)
+                if ai_result is not None:
+                    self.routing.record(decision, 0.0)
+                    return self._finish_prepared(prepared, ai_result)
+                log.steps.append("Using AI for low confidence document")
+                return prepared
+            return self._finish_prepared(prepared)
+        except Exception as e:
+            return file_path, None, self._failure_log(file_path, e)
+    
+    async def _finish_with_ai(self, prepared: PreparedDocument,
+                              ai_processor: AsyncGeminiProcessor) -> Tuple[str, Optional[DocumentSchema], ProcessingLog]:
+        """Await the AI fallback for a prepared document, then finish it"""
+        started = time.perf_counter()
+        with timed(prepared.log.stage_timings, 'ai'):
+            ai_result = await ai_processor.extract_structured_data(prepared.content, prepared.doc_type,
+                                                                   prepared.extracted_fields)
+        self._record_ai(prepared.routing, ai_result, time.perf_counter() - started)
+        try:
+            self._store_ai_result(prepared.source_key, ai_result, prepared.log)
+            return self._finish_prepared(prepared, ai_result)
+        except Exception as e:
+            return prepared.file_path, None, self._failure_log(prepared.file_path, e)
+    
+    def _finish_prepared(self, prepared: PreparedDocument,
+                         ai_result: Dict[str, Any] = None) -> Tuple[str, DocumentSchema, ProcessingLog]:
+        """Build and cache a prepared document"""
+        document, log = self._finish_document(
+            prepared.doc_id, prepared.content, prepared.metadata, prepared.doc_type, prepared.signature,
+            prepared.scan, prepared.sender, prepared.log, prepared.start_time,
+            prepared.extracted_fields, prepared.confidence, ai_result
+        )
+        if prepared.cache_key and not log.ai_deferred and not log.ai_failed:
+            with timed(log.stage_timings, 'cache_store'):
+                self.cache.put(prepared.cache_key, document)
+        return prepared.file_path, document, log
+    
+    def _signature_options(self) -> Dict[str, Any]:
+        """How worker processes get this processor's signatures
+        
+        Workers open a shared SQLite store directly (their patterns land in
+        it as they are learned); otherwise they start from a snapshot.
+        """
+        store = self.signature_engine.store
+        if isinstance(store, SQLiteSignatureStore):
+            return {'signature_db': store.path}
+        return {'signature_state': self.signature_engine.export_state()}
+    
+    def _worker_options(self, workers: int = None) -> Dict[str, Any]:
+        """Settings for worker processes: the shared cache and artifacts, profiling, fields, parsers and routing
+        
+        Workers get no metrics registry or deferred queue; their logs are
+        observed (and deferred AI fallbacks queued) here as results arrive.
+        Each worker gets an equal share of the routing budget.
+        """
+        options = {'profile': self.profile, 'fields': self.fields, 'parser_backends': self.parser_backends,
+                   'page_workers': self.page_workers,
+                   'routing': self.routing.for_workers(workers or os.cpu_count() or 1),
+                   'defer_in_background': False}
+        if self.cache:
+            options.update(cache_dir=self.cache.cache_dir, cache_max_bytes=self.cache.max_bytes)
+        if self.artifacts:
+            options['artifact_db'] = self.artifacts.path
+        return options
+    
+    def _queue_deferred(self, document: Optional[DocumentSchema], log: ProcessingLog, sender: str = None):
+        """Hand a document whose AI fallback was deferred to the background queue"""
+        if document is None or not log.ai_deferred or self.deferred is None:
+            return
+        if sender is None and log.source_key and self.artifacts:
+            # Reprocessed documents keep the sender they were stored with
+            source = self.artifacts.source(log.source_key)
+            sender = source[1] if source else None
+        self.deferred.put(DeferredDocument(document, sender, log.signature, log.source_key))
+    
+    def deferred_results(self, wait: bool = False) -> Iterator[Tuple[DocumentSchema, ProcessingLog]]:
+        """Documents upgraded by their deferred AI fallback so far; with wait, all of them
+        
+        Each replaces the rule-only document with the same document_id.
+        Failed upgrades are left out (their rule-only document stands).
+        """
+        if self.deferred is None:
+            return
+        for document, log in self.deferred.results(wait):
+            if document is not None and log.ai_usage:
+                yield document, log
+    
+    def finish_deferred(self, deferred: DeferredDocument) -> Tuple[DocumentSchema, ProcessingLog]:
+        """Run a deferred AI fallback and rebuild the document with its result
+        
+        Its estimated cost was charged to the batch budget when it was
+        deferred; its latency feeds the policy's estimate.
+        """
+        previous = deferred.document
+        start_time = time.time()
+        log = ProcessingLog(document_id=previous.document_id, ai_deferred=True, routing_policy=self.routing.name,
+                            routing_action='defer', signature=deferred.signature, source_key=deferred.source_key)
+        log.steps.append("Started deferred AI fallback")
+        ai_result = self._stored_ai_result(deferred.source_key, log)
+        if ai_result is None:
+            started = time.perf_counter()
+            with timed(log.stage_timings, 'ai'):
+                ai_result = self.ai_processor.extract_structured_data(previous.content, previous.source_type,
+                                                                      previous.extracted_fields)
+            if not ai_result.get('cached'):
+                self.routing.observe_latency(time.perf_counter() - started)
+            self._store_ai_result(deferred.source_key, ai_result, log)
+        document, log = self._finish_document(
+            previous.document_id, previous.content, previous.metadata, previous.source_type, deferred.signature,
+            None, deferred.sender, log, start_time, dict(previous.extracted_fields), previous.confidence_score,
+            ai_result
+        )
+        if document.title is None:
+            document.title = previous.title
+        return document, log
+    
+    def _finish_deferred_safely(self, deferred: DeferredDocument) -> Tuple[Optional[DocumentSchema], ProcessingLog]:
+        """finish_deferred for the background queue: failures are logged, never raised"""
+        try:
+            document, log = self.finish_deferred(deferred)
+        except Exception as e:
+            document, log = None, self._failure_log(deferred.document.document_id, e)
+        if self.metrics:
+            self.metrics.observe_deferred(log, failed=document is None)
+        return document, log
+    
+    def _process_safely(self, source: DocumentSource, sender: str = None) -> Tuple[Optional[DocumentSchema], ProcessingLog]:
+        """Process a document, reporting failures in the log instead of raising"""
+        try:
+            return self.process_document(source, sender)
+        except Exception as e:
+            log = self._failure_log(source, e)
+            self._observe(log, failed=True)
+            return None, log
+    
+    def _failure_log(self, source: DocumentSource, error: Exception) -> ProcessingLog:
+        """Log describing a document that could not be processed"""
+        log = ProcessingLog(document_id=str(uuid.uuid4()))
+        name = source_name(source) if isinstance(source, (str, io.BytesIO)) else ''
+        log.steps.append(f"Failed to process {name or 'in-memory document'}")
+        log.warnings.append(f"{type(error).__name__}: {error}")
+        return log
+    
     def save_signatures(self):
         """Save learned signatures"""
-        self.signature_engine.save_signatures('data/signatures.json')
\ No newline at end of file
+        self.signature_engine.save_signatures('data/signatures.json')
+
+
+# Pipeline owned by each process_batch worker process
+_batch_processor = None
+
+
+def _init_batch_worker(gemini_api_key: str, signature_options: Dict[str, Any], worker_options: Dict[str, Any]):
+    """Build the worker's pipeline from the parent's signature store or snapshot"""
+    global _batch_processor
+    # Ctrl+C/SIGTERM are handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if 'signature_db' in signature_options:
+        signature_engine = SignatureEngine(SQLiteSignatureStore(signature_options['signature_db']))
+    else:
+        signature_engine = SignatureEngine()
+        signature_engine.load_state(signature_options['signature_state'])
+        signature_engine.track_learned = True
+    _batch_processor = MainProcessor(gemini_api_key, signature_engine=signature_engine, **worker_options)
+
+
+def _process_in_batch_worker(source: Union[str, io.BytesIO], sender: str = None, batch: Tuple[str, float] = None):
+    """Process one document in a worker and hand back what it learned"""
+    if batch:
+        _batch_processor.routing.start_batch(*batch)
+    document, log = _batch_processor._process_safely(source, sender)
+    return document, log, _batch_processor.signature_engine.drain_learned()
+
+
+def _reprocess_in_batch_worker(source_key: str, sender: str = None, batch: Tuple[str, float] = None):
+    """Reprocess one stored document in a worker and hand back what it learned"""
+    if batch:
+        _batch_processor.routing.start_batch(*batch)
+    document, log = _batch_processor._reprocess_safely(source_key, sender)
+    return document, log, _batch_processor.signature_engine.drain_learned()
@@ -0,0 +1,154 @@
+import io
+import os
+import re
+import zipfile
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple, Union
+from src.parsers.document_parser import (DocumentParser, DocumentSource, as_source, is_path, source_name, read_bytes,
+                                         load_module)
+
+# Formats that are unpacked into the documents they hold rather than parsed
+CONTAINER_TYPES = ('zip', 'mbox')
+
+# Containers nested deeper than this (a ZIP attached to a message in a ZIP...) are left packed
+MAX_DEPTH = 5
+
+# mboxrd quoting: one '>' is added to body lines that would read as a "From " separator
+QUOTED_FROM_PATTERN = re.compile(rb'^>(>*From )')
+
+
+class BundlePart(NamedTuple):
+    """One document read out of a bundle, with where it came from
+
+    path names the part inside the top-level file: ZIP members after '/',
+    mbox messages after '#' (numbered from 1), attachments after their
+    message's path and '/'. parent is the path of the part it was found in
+    (None at the top). A part that could not be read has no source and
+    the exception in error.
+    """
+    source: Union[str, io.BytesIO, None]  # In-memory parts are named after themselves, for format detection
+    path: str
+    parent: Optional[str]
+    kind: str  # How it was found: 'document' (the file itself), 'member', 'message' or 'attachment'
+    doc_type: str
+    error: Optional[Exception] = None
+
+    @property
+    def provenance(self) -> Dict[str, Optional[str]]:
+        return {'path': self.path, 'parent': self.parent, 'kind': self.kind}
+
+
+def iter_zip_members(source: Union[str, io.BytesIO]) -> Iterator[Tuple[str, Union[io.BytesIO, Exception]]]:
+    """(name, document) of each file in a ZIP archive, decompressed one at a time
+
+    Only the central directory is read up front. A member that cannot be
+    read (encrypted, unsupported compression, corrupt) comes back as the
+    exception instead.
+    """
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            try:
+                with archive.open(info) as member:
+                    data = member.read()
+            except (RuntimeError, NotImplementedError, zipfile.BadZipFile, EOFError) as e:
+                yield info.filename, e
+                continue
+            yield info.filename, as_source(data, os.path.basename(info.filename))
+
+
+def iter_mbox_messages(source: Union[str, io.BytesIO]) -> Iterator[bytes]:
+    """Raw bytes of each message in an mbox, reading one message at a time
+
+    A "From " line at the start or after a blank line starts a message,
+    and lines quoted the mboxrd way (">From ", ">>From "...) lose one '>'.
+    """
+    file = open(source, 'rb') if is_path(source) else source
+    if not is_path(source):
+        file.seek(0)
+    try:
+        lines = []
+        blank = True
+        for line in file:
+            if blank and line.startswith(b'From '):
+                if lines:
+                    yield _message_bytes(lines)
+                lines = []
+                blank = False
+                continue
+            blank = line in (b'\n', b'\r\n')
+            if line.startswith(b'>'):
+                line = QUOTED_FROM_PATTERN.sub(rb'\1', line)
+            lines.append(line)
+        if lines:
+            yield _message_bytes(lines)
+    finally:
+        if is_path(source):
+            file.close()
+
+
+def _message_bytes(lines) -> bytes:
+    """A message's lines, without the blank line that separated it from the next"""
+    if lines and lines[-1] in (b'\n', b'\r\n'):
+        lines.pop()
+    return b''.join(lines)
+
+
+def iter_bundle(source: DocumentSource, parser: DocumentParser = None, name: str = None,
+                max_depth: int = MAX_DEPTH) -> Iterator[BundlePart]:
+    """Every document in a ZIP archive, mbox or email message, in file order, without touching disk
+
+    Messages are followed by their attachments, and containers found
+    inside (a ZIP attachment, a forwarded message) are unpacked in turn.
+    Only the part being read is held in memory, so mailboxes and archives
+    of any size go through in one pass. Any other document comes back as
+    a single part.
+    """
+    parser = parser or DocumentParser()
+    source = as_source(source, name)
+    path = os.path.basename(source_name(source)) or 'bundle'
+    yield from _expand(parser, source, path, None, 'document', max_depth)
+
+
+def _expand(parser: DocumentParser, source: Union[str, io.BytesIO], path: str, parent: Optional[str], kind: str,
+            depth: int) -> Iterator[BundlePart]:
+    """Parts of one document: itself, or what it contains
+
+    A container that cannot be read (a corrupt archive, a damaged message)
+    ends in a part with the error, after any parts read before it failed,
+    and the rest of the bundle goes on.
+    """
+    doc_type = parser.detect_format(source)
+    if doc_type in CONTAINER_TYPES and depth <= 0:
+        yield BundlePart(None, path, parent, kind, doc_type, ValueError(f"{doc_type} nested too deep to unpack"))
+        return
+    try:
+        if doc_type == 'zip':
+            for member, document in iter_zip_members(source):
+                member_path = f"{path}/{member}"
+                if isinstance(document, Exception):
+                    yield BundlePart(None, member_path, path, 'member', 'unknown', document)
+                else:
+                    yield from _expand(parser, document, member_path, path, 'member', depth - 1)
+        elif doc_type == 'mbox':
+            for number, message in enumerate(iter_mbox_messages(source), 1):
+                yield from _expand_message(parser, as_source(message, f"message-{number}.eml"), f"{path}#{number}",
+                                           path, 'message', depth - 1)
+        elif doc_type == 'email':
+            yield from _expand_message(parser, source, path, parent, kind, depth)
+        else:
+            yield BundlePart(source, path, parent, kind, doc_type)
+    except Exception as e:
+        yield BundlePart(None, path, parent, kind, doc_type, e)
+
+
+def _expand_message(parser: DocumentParser, source: Union[str, io.BytesIO], path: str, parent: Optional[str],
+                    kind: str, depth: int) -> Iterator[BundlePart]:
+    """A message, then each of its attachments"""
+    yield BundlePart(source, path, parent, kind, 'email')
+    mail = load_module('src.parsers.mail_message')
+    message = mail.read_message(read_bytes(source))
+    for index, part in enumerate(mail.iter_attachments(message), 1):
+        filename = mail.attachment_name(part, index)
+        attachment = as_source(mail.attachment_bytes(part), filename)
+        yield from _expand(parser, attachment, f"{path}/{filename}", path, 'attachment', depth - 1)
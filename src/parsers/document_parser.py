@@ -1,22 +1,343 @@
-import PyPDF2
-import docx
-from bs4 import BeautifulSoup
-from typing import Dict, Tuple
+import io
+import os
+import re
+import math
+import zipfile
+import importlib
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from xml.etree import ElementTree
+from src.parsers.mapped_text import MappedText, MAP_THRESHOLD
+from typing import Dict, List, Any, Tuple, Iterable, Iterator, NamedTuple, Optional, Union, Callable, Sequence, BinaryIO
+
+
+class TextBlock(NamedTuple):
+    """Chunk of document text yielded in streaming mode"""
+    text: str
+    offset: int  # Character offset of the block within the document text
+    page: Optional[int] = None  # Zero-based page number for paged formats
+
+
+class FormatBackend(NamedTuple):
+    """One way of parsing a format"""
+    name: str
+    module: Optional[str]  # Library that must be installed; imported on first use
+    # DocumentParser method name, or function(parser, source) -> (content, metadata); source is a
+    # file path or, for documents given in memory, a BytesIO (see as_source)
+    parse: Union[str, Callable]
+    iterate: Union[str, Callable, None] = None  # Streaming counterpart (parser, source, metadata, chunk_size)
+    rank: int = 100  # Lower is faster; the fastest installed backend is used unless configured
+    # Random page access for paged formats (parser, source) -> PagedDocument; parse_pages of what it
+    # opens must match parse
+    pages: Union[str, Callable, None] = None
+
+
+class PagedDocument:
+    """An open paged document whose pages are extracted only when asked for
+    
+    text(number) returns a page's text as parse_document joins it (with a
+    trailing newline); metadata holds 'pages' and 'title'.
+    """
+    
+    def __init__(self, pages: Sequence, extract: Callable[[Any], str], metadata: Dict, close: Callable = None):
+        self._pages = pages
+        self._extract = extract
+        self._close = close
+        self.metadata = metadata
+        self.page_count = len(pages)
+    
+    def __enter__(self) -> 'PagedDocument':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def text(self, number: int) -> str:
+        return self._extract(self._pages[number]) + "\n"
+    
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+
+# A document: a file path, its bytes, or a readable binary stream
+DocumentSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+
+def as_source(source: DocumentSource, name: str = None) -> Union[str, io.BytesIO]:
+    """A file path as is, anything else as an in-memory stream at its start
+    
+    A BytesIO (such as an upload) is taken whole, other streams from where
+    they are. The stream is named after name or the original's name, for
+    detect_format's extension fallback. Bytes are shared, not copied, so
+    normalizing an already normalized source again is free.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(source)
+    elif isinstance(source, io.BytesIO):
+        stream = io.BytesIO(source.getvalue())
+    else:
+        stream = io.BytesIO(source.read())
+    original = getattr(source, 'name', None)
+    stream.name = name or (original if isinstance(original, str) else '')
+    return stream
+
+
+def is_path(source: Union[str, io.BytesIO]) -> bool:
+    return isinstance(source, str)
+
+
+def source_name(source: Union[str, io.BytesIO]) -> str:
+    """File path, or the name of an in-memory document ('' when it has none)"""
+    return source if is_path(source) else getattr(source, 'name', '')
+
+
+def source_size(source: Union[str, io.BytesIO]) -> int:
+    """Size of a document in bytes"""
+    return os.path.getsize(source) if is_path(source) else len(source.getvalue())
+
+
+def read_bytes(source: Union[str, io.BytesIO]) -> bytes:
+    """Whole content of a document"""
+    if is_path(source):
+        with open(source, 'rb') as file:
+            return file.read()
+    return source.getvalue()
+
+
+def read_text(source: Union[str, io.BytesIO]) -> str:
+    """Whole UTF-8 text of a document, newlines translated as in text mode"""
+    if is_path(source):
+        with open(source, 'r', encoding='utf-8') as file:
+            return file.read()
+    source.seek(0)
+    wrapper = io.TextIOWrapper(source, encoding='utf-8')
+    try:
+        return wrapper.read()
+    finally:
+        # Leave the stream open for the caller
+        wrapper.detach()
+
+
+# PDFs with at least this many pages are extracted across the page workers, if any
+PARALLEL_MIN_PAGES = 100
+
+# Page ranges handed to each page worker (each reopens the file), so slow pages even out
+PAGE_RANGES_PER_WORKER = 2
+
+
+def _extract_pages(opener: str, file_path: str, start: int, stop: int) -> List[str]:
+    """Text of pages start to stop - 1, in a page worker process"""
+    with getattr(DocumentParser(), opener)(file_path) as document:
+        return [document.text(number) for number in range(start, stop)]
+
+
+# Format -> parser backends, fastest first (see register_backend)
+FORMAT_BACKENDS: Dict[str, List[FormatBackend]] = {}
+
+# Detected type names sharing another format's backends
+FORMAT_ALIASES = {'txt': 'text'}
+
+# Deployment-wide backend preferences, e.g. "pdf=pymupdf|pypdf2,html=bs4"
+BACKENDS_ENV = 'MULTIDOC_PARSERS'
+
+# Leading bytes read to sniff a file's format before asking libmagic
+SNIFF_BYTES = 2048
+
+# Header fields only mail transport adds; one of them tells a message from text that starts "From: ..."
+TRANSPORT_HEADERS = {b'message-id', b'received', b'mime-version', b'return-path', b'delivered-to',
+                     b'dkim-signature', b'x-mailer', b'in-reply-to', b'references'}
+
+# "Name: value" header line, or a folded continuation of the one before
+HEADER_LINE_PATTERN = re.compile(rb'^(?:([!-9;-~]+):|[ \t])')
+
+# Header lines sniffed for a transport header before deciding a document is not a message
+SNIFF_HEADER_LINES = 40
+
+# Message headers leading the text of a parsed email
+MAIL_HEADERS = ('Subject', 'From', 'To', 'Cc', 'Date')
+
+# Extensions detect_format falls back to, by detected type
+EXTENSION_TYPES = {'pdf': 'pdf', 'docx': 'docx', 'html': 'html', 'txt': 'txt', 'eml': 'email', 'mbox': 'mbox',
+                   'zip': 'zip'}
+
+# HTML elements whose whitespace BeautifulSoup keeps verbatim
+PRESERVE_WHITESPACE_TAGS = ('pre', 'textarea')
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DC_TITLE = '{http://purl.org/dc/elements/1.1/}title'
+RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+_modules = {}
+
+
+def load_module(name: str, optional: bool = False):
+    """Import a parser library on first use (None for a missing optional one)"""
+    if name not in _modules:
+        try:
+            _modules[name] = importlib.import_module(name)
+        except ImportError:
+            _modules[name] = None
+    if _modules[name] is None and not optional:
+        raise ImportError(f"{name} is required for this format but is not installed")
+    return _modules[name]
+
+
+def is_installed(module: Optional[str]) -> bool:
+    """Whether a library can be imported, without importing it"""
+    return module is None or importlib.util.find_spec(module.split('.')[0]) is not None
+
+
+def register_backend(doc_type: str, backend: FormatBackend):
+    """Add a parser backend for a format, replacing any of the same name"""
+    backends = [existing for existing in FORMAT_BACKENDS.get(doc_type, []) if existing.name != backend.name]
+    backends.append(backend)
+    backends.sort(key=lambda candidate: candidate.rank)
+    FORMAT_BACKENDS[doc_type] = backends
+
+
+def backend_preferences(spec: str) -> Dict[str, List[str]]:
+    """Parse "pdf=pymupdf|pypdf2,html=bs4" into per-format backend names"""
+    preferences = {}
+    for item in spec.split(','):
+        if '=' in item:
+            doc_type, names = item.split('=', 1)
+            preferences[doc_type.strip()] = [name.strip() for name in names.split('|') if name.strip()]
+    return preferences
+
+
+def sniff_format(source: Union[str, io.BytesIO], header: bytes) -> Optional[str]:
+    """Format from a file's leading bytes, when they are conclusive"""
+    stripped = header.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if stripped.startswith(b'%PDF-'):
+        return 'pdf'
+    if header.startswith(b'PK\x03\x04'):
+        try:
+            with zipfile.ZipFile(source) as archive:
+                if any(name.startswith('word/') for name in archive.namelist()):
+                    return 'docx'
+            return 'zip'
+        except zipfile.BadZipFile:
+            pass
+        return None
+    if looks_like_mbox(header):
+        return 'mbox'
+    if looks_like_message(header):
+        return 'email'
+    lowered = stripped[:512].lower()
+    if lowered.startswith((b'<!doctype html', b'<html')):
+        return 'html'
+    if lowered.startswith(b'<') and (b'<head' in lowered or b'<body' in lowered):
+        return 'html'
+    return None
+
+
+def looks_like_message(header: bytes) -> bool:
+    """Whether leading bytes are an RFC 5322 message: a header block with a transport header"""
+    lines = header.split(b'\n')
+    # The last line may be cut off mid-field
+    for line in lines[:min(SNIFF_HEADER_LINES, len(lines) - 1)]:
+        match = HEADER_LINE_PATTERN.match(line)
+        if match is None:
+            return False
+        if match.group(1) and match.group(1).lower() in TRANSPORT_HEADERS:
+            return True
+    return False
+
+
+def looks_like_mbox(header: bytes) -> bool:
+    """Whether leading bytes are an mbox: a "From " separator line, then a message"""
+    separator, _, rest = header.partition(b'\n')
+    return separator.startswith(b'From ') and looks_like_message(rest)
+
+
+def looks_like_text(header: bytes) -> bool:
+    """Whether leading bytes are UTF-8 text (a sequence cut off at the end still counts)"""
+    if b'\x00' in header:
+        return False
+    try:
+        header.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return e.reason == 'unexpected end of data'
+    return True
 
-try:
-    import magic
-    HAS_MAGIC = True
-except ImportError:
-    HAS_MAGIC = False
 
 class DocumentParser:
-    """Multi-format document parser"""
+    """Multi-format document parser
+    
+    Each format is parsed by the fastest installed backend in
+    FORMAT_BACKENDS unless backends (or the MULTIDOC_PARSERS environment
+    variable) names preferred ones, e.g. {'pdf': ['pymupdf', 'pypdf2']}.
+    With page_workers, PDFs of at least parallel_min_pages pages have their
+    pages extracted across that many processes, started per document; the
+    text is the same as extracting the pages in turn.
+    
+    Documents can be given as a file path, bytes, or a readable binary
+    stream (see as_source); in-memory ones are parsed without touching disk.
+    """
+    
+    version = "1.3"  # 1.3: email messages, ZIP and mbox detection
+    
+    # Characters per block when streaming plain text or DOCX
+    STREAM_CHUNK_SIZE = 1 << 20
+    
+    def __init__(self, backends: Dict[str, Union[str, List[str]]] = None, page_workers: int = None,
+                 parallel_min_pages: int = PARALLEL_MIN_PAGES):
+        preferences = backend_preferences(os.environ.get(BACKENDS_ENV, ''))
+        for doc_type, names in (backends or {}).items():
+            preferences[doc_type] = [names] if isinstance(names, str) else list(names)
+        for doc_type in preferences:
+            if doc_type not in FORMAT_BACKENDS:
+                raise ValueError(f"Unknown format in parser backends: {doc_type}")
+        self.backends = {
+            doc_type: self._select_backend(doc_type, preferences.get(doc_type))
+            for doc_type in FORMAT_BACKENDS
+        }
+        # Output depends on the backends, so they are part of the version results are cached under
+        self.version = self.version + ':' + ','.join(
+            f"{doc_type}={backend.name}" for doc_type, backend in sorted(self.backends.items()) if backend
+        )
+        self.page_workers = page_workers
+        self.parallel_min_pages = parallel_min_pages
+    
+    def _select_backend(self, doc_type: str, names: List[str] = None) -> Optional[FormatBackend]:
+        """Preferred installed backend, else the fastest installed one"""
+        known = {backend.name: backend for backend in FORMAT_BACKENDS[doc_type]}
+        for name in names or ():
+            if name not in known:
+                raise ValueError(f"Unknown {doc_type} parser backend: {name}")
+            if is_installed(known[name].module):
+                return known[name]
+        return next((backend for backend in FORMAT_BACKENDS[doc_type] if is_installed(backend.module)), None)
+    
+    def backend_for(self, doc_type: str) -> Optional[FormatBackend]:
+        """Backend parsing a detected type (None when unsupported)"""
+        return self.backends.get(FORMAT_ALIASES.get(doc_type, doc_type))
     
-    def detect_format(self, file_path: str) -> str:
-        """Detect document format"""
-        if HAS_MAGIC:
+    def _call(self, handler: Union[str, Callable], *args):
+        return getattr(self, handler)(*args) if isinstance(handler, str) else handler(self, *args)
+    
+    def detect_format(self, source: DocumentSource) -> str:
+        """Detect document format: leading bytes, then libmagic, then extension (or upload name)"""
+        source = as_source(source)
+        if is_path(source):
+            with open(source, 'rb') as file:
+                header = file.read(SNIFF_BYTES)
+        else:
+            header = source.getvalue()[:SNIFF_BYTES]
+        doc_type = sniff_format(source, header)
+        if doc_type:
+            return doc_type
+        
+        file_path = source_name(source)
+        magic = load_module('magic', optional=True)
+        if magic is not None:
             try:
-                mime = magic.from_file(file_path, mime=True)
+                mime = magic.from_buffer(header, mime=True)
                 if 'pdf' in mime:
                     return 'pdf'
                 elif 'word' in mime or file_path.endswith('.docx'):
@@ -30,25 +351,109 @@ class DocumentParser:
         
         # Fallback to extension
         ext = file_path.split('.')[-1].lower()
-        return ext if ext in ['pdf', 'docx', 'html', 'txt'] else 'unknown'
-    
-    def parse_pdf(self, file_path: str) -> Tuple[str, Dict]:
-        """Parse PDF document"""
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            content = ""
-            for page in reader.pages:
-                content += page.extract_text() + "\n"
-            
-            metadata = {
-                'pages': len(reader.pages),
-                'title': reader.metadata.get('/Title', '') if reader.metadata else ''
-            }
-            return content.strip(), metadata
+        if ext in EXTENSION_TYPES:
+            return EXTENSION_TYPES[ext]
+        # Unnamed in-memory documents have no extension to go by
+        if not file_path and looks_like_text(header):
+            return 'txt'
+        return 'unknown'
+    
+    def parse_pdf(self, source: Union[str, io.BytesIO], opener: str = 'open_pdf') -> Tuple[str, Dict]:
+        """Parse PDF document
+        
+        metadata['page_starts'] holds the character offset of each page in
+        the returned (stripped) text. Only PDFs on disk are split across the
+        page workers, which reopen the file themselves.
+        """
+        with getattr(self, opener)(source) as document:
+            return self.parse_pages(document, source, opener)
+    
+    def parse_pages(self, document: PagedDocument, source: Union[str, io.BytesIO], opener: Optional[str],
+                    texts: Dict[int, str] = None) -> Tuple[str, Dict]:
+        """parse_pdf's result for an open document, without extracting the pages in texts again
+        
+        opener (the method that opened it) lets the page workers reopen the
+        file; long documents handed to them are extracted whole.
+        """
+        metadata = dict(document.metadata)
+        texts = texts or {}
+        if opener and self.page_workers and document.page_count >= self.parallel_min_pages and is_path(source):
+            texts = self._parallel_pages(opener, source, document.page_count)
+        else:
+            texts = [texts[number] if number in texts else document.text(number)
+                     for number in range(document.page_count)]
+        content = "".join(texts)
+        stripped = content.strip()
+        leading = len(content) - len(content.lstrip())
+        offsets = list(accumulate(map(len, texts), initial=0))[:len(texts)]
+        metadata['page_starts'] = [max(0, offset - leading) for offset in offsets]
+        return stripped, metadata
+    
+    def _parallel_pages(self, opener: str, file_path: str, page_count: int) -> List[str]:
+        """Page texts, extracted in ranges by the page workers and put back in page order
+        
+        The pool lives only as long as the document, so parsers inside batch
+        worker processes leave no processes behind.
+        """
+        step = math.ceil(page_count / (self.page_workers * PAGE_RANGES_PER_WORKER))
+        with ProcessPoolExecutor(max_workers=self.page_workers) as pool:
+            futures = [pool.submit(_extract_pages, opener, file_path, start, min(start + step, page_count))
+                       for start in range(0, page_count, step)]
+            return [text for future in futures for text in future.result()]
+    
+    def open_pdf(self, source: Union[str, io.BytesIO], module: str = 'PyPDF2') -> PagedDocument:
+        """PDF pages through PyPDF2 (or pypdf), extracted on demand"""
+        reader_module = load_module(module)
+        file = open(source, 'rb') if is_path(source) else source
+        try:
+            reader = reader_module.PdfReader(file)
+            metadata = {'pages': len(reader.pages),
+                        'title': reader.metadata.get('/Title', '') if reader.metadata else ''}
+        except Exception:
+            if file is not source:
+                file.close()
+            raise
+        return PagedDocument(reader.pages, lambda page: page.extract_text(), metadata,
+                             file.close if file is not source else None)
+    
+    def open_pdf_pypdf(self, source: Union[str, io.BytesIO]) -> PagedDocument:
+        return self.open_pdf(source, module='pypdf')
+    
+    def open_pdf_pymupdf(self, source: Union[str, io.BytesIO]) -> PagedDocument:
+        """PDF pages through MuPDF, extracted on demand"""
+        fitz = load_module('fitz')
+        doc = fitz.open(source) if is_path(source) else fitz.open(stream=source.getvalue(), filetype='pdf')
+        metadata = {'pages': doc.page_count, 'title': (doc.metadata or {}).get('title') or ''}
+        return PagedDocument(doc, lambda page: page.get_text(), metadata, doc.close)
+    
+    def _iter_pages(self, document: PagedDocument, metadata: Dict) -> Iterator[TextBlock]:
+        """Stream a paged document one page at a time"""
+        with document:
+            metadata.update(document.metadata)
+            offset = 0
+            for number in range(document.page_count):
+                text = document.text(number)
+                yield TextBlock(text, offset, number)
+                offset += len(text)
+    
+    def iter_pdf(self, source: Union[str, io.BytesIO], metadata: Dict, chunk_size: int = None,
+                 module: str = 'PyPDF2') -> Iterator[TextBlock]:
+        """Stream PDF text one page at a time"""
+        return self._iter_pages(self.open_pdf(source, module), metadata)
     
-    def parse_docx(self, file_path: str) -> Tuple[str, Dict]:
+    def iter_pdf_pypdf(self, source: Union[str, io.BytesIO], metadata: Dict,
+                       chunk_size: int = None) -> Iterator[TextBlock]:
+        """PyPDF2's maintained successor, same API with faster text extraction"""
+        return self.iter_pdf(source, metadata, chunk_size, module='pypdf')
+    
+    def iter_pdf_pymupdf(self, source: Union[str, io.BytesIO], metadata: Dict,
+                         chunk_size: int = None) -> Iterator[TextBlock]:
+        """Stream PDF text one page at a time with MuPDF"""
+        return self._iter_pages(self.open_pdf_pymupdf(source), metadata)
+    
+    def parse_docx(self, source: Union[str, io.BytesIO]) -> Tuple[str, Dict]:
         """Parse DOCX document"""
-        doc = docx.Document(file_path)
+        doc = load_module('docx').Document(source)
         content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
         
         metadata = {
@@ -57,42 +462,272 @@ class DocumentParser:
         }
         return content.strip(), metadata
     
-    def parse_html(self, file_path: str) -> Tuple[str, Dict]:
+    def parse_docx_xml(self, source: Union[str, io.BytesIO]) -> Tuple[str, Dict]:
+        """Parse DOCX straight from its XML, without building python-docx objects"""
+        metadata = {}
+        content = "\n".join(self._docx_xml_paragraphs(source, metadata))
+        return content.strip(), metadata
+    
+    def _docx_xml_paragraphs(self, source: Union[str, io.BytesIO], metadata: Dict) -> List[str]:
+        """Body paragraph texts as python-docx reports them (runs, tabs and breaks)"""
+        with zipfile.ZipFile(source) as archive:
+            targets = {'officeDocument': 'word/document.xml', 'core-properties': 'docProps/core.xml'}
+            if '_rels/.rels' in archive.namelist():
+                for relation in ElementTree.fromstring(archive.read('_rels/.rels')).iter(f'{RELS_NS}Relationship'):
+                    kind = relation.get('Type', '').rsplit('/', 1)[-1]
+                    if kind in targets:
+                        targets[kind] = relation.get('Target', '').lstrip('/')
+            body = ElementTree.fromstring(archive.read(targets['officeDocument'])).find(f'{WORD_NS}body')
+            title = None
+            if targets['core-properties'] in archive.namelist():
+                title = ElementTree.fromstring(archive.read(targets['core-properties'])).findtext(DC_TITLE)
+        
+        paragraphs = []
+        for paragraph in (body.iterfind(f'{WORD_NS}p') if body is not None else ()):
+            parts = []
+            for run in paragraph.iterfind(f'{WORD_NS}r'):
+                for child in run:
+                    if child.tag == f'{WORD_NS}t':
+                        parts.append(child.text or '')
+                    elif child.tag == f'{WORD_NS}tab':
+                        parts.append('\t')
+                    elif child.tag in (f'{WORD_NS}br', f'{WORD_NS}cr'):
+                        parts.append('\n')
+            paragraphs.append(''.join(parts))
+        
+        metadata['paragraphs'] = len(paragraphs)
+        metadata['title'] = title or ''
+        return paragraphs
+    
+    def parse_html(self, source: Union[str, io.BytesIO]) -> Tuple[str, Dict]:
         """Parse HTML document"""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            soup = BeautifulSoup(file.read(), 'html.parser')
-            content = soup.get_text()
-            
-            metadata = {
-                'title': soup.title.string if soup.title else '',
-                'links': len(soup.find_all('a'))
-            }
-            return content.strip(), metadata
+        soup = load_module('bs4').BeautifulSoup(read_text(source), 'html.parser')
+        content = soup.get_text()
+        
+        metadata = {
+            'title': soup.title.string if soup.title else '',
+            'links': len(soup.find_all('a'))
+        }
+        return content.strip(), metadata
+    
+    def parse_html_lxml(self, source: Union[str, io.BytesIO]) -> Tuple[str, Dict]:
+        """Parse HTML with lxml's C parser"""
+        markup = read_text(source)
+        if not markup.strip():
+            return "", {'title': '', 'links': 0}
+        # Bytes, so an XML encoding declaration in the markup is accepted
+        tree = load_module('lxml.html').document_fromstring(markup.encode('utf-8'))
+        # Match BeautifulSoup's get_text: no script/style contents, and whitespace-only
+        # strings outside <pre>/<textarea> collapsed to a single newline or space
+        for element in tree.xpath('//script|//style|//template'):
+            element.drop_tree()
+        for element in tree.iter():
+            if element.text and not element.text.strip() and element.tag not in PRESERVE_WHITESPACE_TAGS:
+                element.text = '\n' if '\n' in element.text else ' '
+            if element.tail and not element.tail.strip():
+                parent = element.getparent()
+                if parent is None or parent.tag not in PRESERVE_WHITESPACE_TAGS:
+                    element.tail = '\n' if '\n' in element.tail else ' '
+        title = tree.find('.//title')
+        metadata = {
+            'title': title.text if title is not None and len(title) == 0 else '',
+            'links': len(tree.findall('.//a'))
+        }
+        return tree.text_content().strip(), metadata
     
-    def parse_text(self, file_path: str) -> Tuple[str, Dict]:
+    def parse_email(self, source: Union[str, io.BytesIO]) -> Tuple[str, Dict]:
+        """Parse an email message: its main headers, then the body text
+        
+        An HTML-only body is converted by the HTML backend. Attachments are
+        only listed in the metadata; bundle_reader hands them on as
+        documents of their own.
+        """
+        mail = load_module('src.parsers.mail_message')
+        message = mail.read_message(read_bytes(source))
+        headers = {name: mail.header_text(message, name) for name in MAIL_HEADERS}
+        body, subtype = mail.message_body(message)
+        html = self.backend_for('html')
+        if subtype == 'html' and html:
+            body, _ = self._call(html.parse, io.BytesIO(body.encode('utf-8')))
+        lines = [f"{name}: {value}" for name, value in headers.items() if value]
+        content = "\n".join(lines) + "\n\n" + body.strip()
+        
+        metadata = {
+            'title': headers['Subject'],
+            'from': headers['From'],
+            'to': headers['To'],
+            'date': headers['Date'],
+            'message_id': mail.header_text(message, 'Message-ID'),
+            'attachments': [mail.attachment_name(part, index)
+                            for index, part in enumerate(mail.iter_attachments(message), 1)]
+        }
+        return content.strip(), metadata
+    
+    def parse_text(self, source: Union[str, io.BytesIO]) -> Tuple[str, Dict]:
         """Parse plain text document"""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            
+        if is_path(source) and os.path.getsize(source) >= MAP_THRESHOLD:
+            return self.parse_text_mapped(source)
+        content = read_text(source)
+        
+        metadata = {
+            'lines': len(content.split('\n')),
+            'chars': len(content)
+        }
+        return content.strip(), metadata
+    
+    def parse_text_mapped(self, file_path: str) -> Tuple[str, Dict]:
+        """Same result as parse_text, counting lines over a memory map and decoding the stripped text once
+        
+        Reading, splitting and stripping would each copy the whole text;
+        here the only copy is the decoded content itself.
+        """
+        with MappedText(file_path) as text:
+            start, end = text.stripped_range()
+            content = text.decode(start, end)
             metadata = {
-                'lines': len(content.split('\n')),
-                'chars': len(content)
+                'lines': text.line_count(),
+                'chars': len(text.decode(0, start)) + len(content) + len(text.decode(end))
             }
-            return content.strip(), metadata
-    
-    def parse_document(self, file_path: str) -> Tuple[str, Dict, str]:
-        """Parse any supported document format"""
-        doc_type = self.detect_format(file_path)
-        
-        if doc_type == 'pdf':
-            content, metadata = self.parse_pdf(file_path)
-        elif doc_type == 'docx':
-            content, metadata = self.parse_docx(file_path)
-        elif doc_type == 'html':
-            content, metadata = self.parse_html(file_path)
-        elif doc_type in ['text', 'txt']:
-            content, metadata = self.parse_text(file_path)
+        # Non-ASCII whitespace at either end (a no-op, without copying, otherwise)
+        return content.strip(), metadata
+    
+    def iter_docx(self, source: Union[str, io.BytesIO], metadata: Dict, chunk_size: int) -> Iterator[TextBlock]:
+        """Stream DOCX paragraphs in blocks of roughly chunk_size characters"""
+        doc = load_module('docx').Document(source)
+        metadata['paragraphs'] = len(doc.paragraphs)
+        metadata['title'] = doc.core_properties.title or ''
+        return self._paragraph_blocks((paragraph.text for paragraph in doc.paragraphs), chunk_size)
+    
+    def iter_docx_xml(self, source: Union[str, io.BytesIO], metadata: Dict, chunk_size: int) -> Iterator[TextBlock]:
+        """Stream DOCX paragraphs read straight from the XML"""
+        return self._paragraph_blocks(self._docx_xml_paragraphs(source, metadata), chunk_size)
+    
+    def _paragraph_blocks(self, paragraphs: Iterable[str], chunk_size: int) -> Iterator[TextBlock]:
+        """Newline-joined paragraphs in blocks of roughly chunk_size characters"""
+        offset = 0
+        parts, size = [], 0
+        for index, paragraph in enumerate(paragraphs):
+            text = paragraph if index == 0 else "\n" + paragraph
+            parts.append(text)
+            size += len(text)
+            if size >= chunk_size:
+                yield TextBlock("".join(parts), offset)
+                offset += size
+                parts, size = [], 0
+        if parts:
+            yield TextBlock("".join(parts), offset)
+    
+    def iter_text(self, source: Union[str, io.BytesIO], metadata: Dict, chunk_size: int) -> Iterator[TextBlock]:
+        """Stream a text file in blocks of chunk_size characters"""
+        if is_path(source) and os.path.getsize(source) >= MAP_THRESHOLD:
+            yield from self.iter_text_mapped(source, metadata, chunk_size)
+            return
+        source = open(source, 'rb') if is_path(source) else source
+        with io.TextIOWrapper(source, encoding='utf-8') as file:
+            offset = 0
+            newlines = 0
+            while True:
+                text = file.read(chunk_size)
+                if not text:
+                    break
+                newlines += text.count('\n')
+                yield TextBlock(text, offset)
+                offset += len(text)
+            
+            metadata['lines'] = newlines + 1
+            metadata['chars'] = offset
+    
+    def iter_text_mapped(self, file_path: str, metadata: Dict, chunk_size: int) -> Iterator[TextBlock]:
+        """Stream a memory-mapped text file in blocks of whole lines
+        
+        Each block is decoded from its byte range on demand, so only one
+        block is ever held as a string, and blocks end at a line break so
+        the scanner has no partial line to carry over.
+        """
+        with MappedText(file_path) as text:
+            offset = 0
+            newlines = 0
+            for start, end in text.block_ranges(chunk_size):
+                block = text.decode(start, end)
+                newlines += block.count('\n')
+                yield TextBlock(block, offset)
+                offset += len(block)
+            
+            metadata['lines'] = newlines + 1
+            metadata['chars'] = offset
+    
+    def _iter_parsed(self, backend: FormatBackend, source: Union[str, io.BytesIO], metadata: Dict) -> Iterator[TextBlock]:
+        """Backends without streaming (e.g. HTML, which needs the whole tree) yield one block"""
+        content, parsed_metadata = self._call(backend.parse, source)
+        metadata.update(parsed_metadata)
+        yield TextBlock(content, 0)
+    
+    def iter_document(self, source: DocumentSource, chunk_size: int = None) -> Tuple[Iterator[TextBlock], Dict, str]:
+        """Stream any supported document format as text blocks
+        
+        Returns the block iterator, a metadata dict that is filled in as the
+        blocks are consumed, and the detected type. Block text is not
+        stripped, so offsets refer to the raw extracted text.
+        """
+        chunk_size = chunk_size or self.STREAM_CHUNK_SIZE
+        source = as_source(source)
+        doc_type = self.detect_format(source)
+        metadata = {}
+        
+        backend = self.backend_for(doc_type)
+        if backend and backend.iterate:
+            blocks = self._call(backend.iterate, source, metadata, chunk_size)
+        elif backend:
+            blocks = self._iter_parsed(backend, source, metadata)
+        else:
+            blocks = iter(())
+        
+        return blocks, metadata, doc_type
+    
+    def open_pages(self, source: DocumentSource, doc_type: str) -> Optional[PagedDocument]:
+        """Random page access to a document, or None when its backend has none (not a paged format)"""
+        backend = self.backend_for(doc_type)
+        if backend is None or backend.pages is None:
+            return None
+        return self._call(backend.pages, as_source(source))
+    
+    def parse_opened(self, document: PagedDocument, source: Union[str, io.BytesIO], doc_type: str,
+                     texts: Dict[int, str] = None) -> Tuple[str, Dict, str]:
+        """What parse_document returns for a document from open_pages, reusing the page texts already read"""
+        pages = self.backend_for(doc_type).pages
+        content, metadata = self.parse_pages(document, source, pages if isinstance(pages, str) else None, texts)
+        return content, metadata, doc_type
+    
+    def parse_document(self, source: DocumentSource, doc_type: str = None) -> Tuple[str, Dict, str]:
+        """Parse any supported document format (doc_type skips detection when known)"""
+        source = as_source(source)
+        doc_type = doc_type or self.detect_format(source)
+        
+        backend = self.backend_for(doc_type)
+        if backend:
+            content, metadata = self._call(backend.parse, source)
         else:
             content, metadata = "", {}
         
-        return content, metadata, doc_type
\ No newline at end of file
+        return content, metadata, doc_type
+    
+    def preload(self, doc_types: Iterable[str] = None):
+        """Import the selected parser libraries up front (all formats by default) for long-lived processes"""
+        for doc_type in doc_types or self.backends:
+            backend = self.backend_for(doc_type)
+            if backend and backend.module:
+                load_module(backend.module)
+
+
+# Built-in backends; rank reflects relative speed on the benchmark corpus
+register_backend('pdf', FormatBackend('pymupdf', 'fitz', lambda parser, path: parser.parse_pdf(path, 'open_pdf_pymupdf'),
+                                      'iter_pdf_pymupdf', rank=10, pages='open_pdf_pymupdf'))
+register_backend('pdf', FormatBackend('pypdf', 'pypdf', lambda parser, path: parser.parse_pdf(path, 'open_pdf_pypdf'),
+                                      'iter_pdf_pypdf', rank=50, pages='open_pdf_pypdf'))
+register_backend('pdf', FormatBackend('pypdf2', 'PyPDF2', 'parse_pdf', 'iter_pdf', rank=60, pages='open_pdf'))
+register_backend('docx', FormatBackend('docx-xml', None, 'parse_docx_xml', 'iter_docx_xml', rank=10))
+register_backend('docx', FormatBackend('python-docx', 'docx', 'parse_docx', 'iter_docx', rank=50))
+register_backend('html', FormatBackend('lxml', 'lxml.html', 'parse_html_lxml', rank=10))
+register_backend('html', FormatBackend('bs4', 'bs4', 'parse_html', rank=50))
+register_backend('text', FormatBackend('text', None, 'parse_text', 'iter_text', rank=0))
+register_backend('email', FormatBackend('email', 'src.parsers.mail_message', 'parse_email', rank=0))
@@ -0,0 +1,63 @@
+import mimetypes
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from typing import Iterator, Tuple
+
+# The modern policy, for EmailMessage's get_body and iter_attachments
+_parser = BytesParser(policy=policy.default)
+
+
+def read_message(data: bytes) -> EmailMessage:
+    """Message parsed from its bytes (attachments are decoded only when asked for)"""
+    return _parser.parsebytes(data)
+
+
+def part_text(part: EmailMessage) -> str:
+    """Decoded text of a text/* part, even with an unknown or wrong charset"""
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeDecodeError):
+        return (part.get_payload(decode=True) or b'').decode('utf-8', 'replace')
+
+
+def message_body(message: EmailMessage) -> Tuple[str, str]:
+    """(text, subtype) of a message's body, plain text preferred over HTML ('' when it has none)"""
+    body = message.get_body(preferencelist=('plain', 'html'))
+    if body is None:
+        return '', ''
+    return part_text(body), body.get_content_subtype()
+
+
+def attachment_name(part: EmailMessage, index: int) -> str:
+    """File name of an attachment, made up from its content type when it has none"""
+    filename = part.get_filename()
+    if filename:
+        return filename.replace('\\', '/').rsplit('/', 1)[-1]
+    if part.get_content_type() == 'message/rfc822':
+        extension = '.eml'
+    else:
+        extension = mimetypes.guess_extension(part.get_content_type()) or ''
+    return f"attachment-{index}{extension}"
+
+
+def attachment_bytes(part: EmailMessage) -> bytes:
+    """Decoded bytes of an attachment (a forwarded message as it was sent)"""
+    if part.get_content_type() == 'message/rfc822':
+        return part.get_payload(0).as_bytes()
+    return part.get_payload(decode=True) or b''
+
+
+def iter_attachments(message: EmailMessage) -> Iterator[EmailMessage]:
+    """Attachment parts of a message, including those of nested multiparts"""
+    for part in message.iter_attachments():
+        if part.is_multipart() and part.get_content_maintype() == 'multipart':
+            yield from iter_attachments(part)
+        else:
+            yield part
+
+
+def header_text(message: EmailMessage, name: str) -> str:
+    """A header's decoded value ('' when missing)"""
+    value = message.get(name)
+    return str(value) if value is not None else ''
@@ -0,0 +1,101 @@
+import os
+import mmap
+from typing import Iterator, Tuple
+
+# Text files at least this large are memory-mapped instead of read into a string
+MAP_THRESHOLD = 8 << 20
+
+# Bytes copied out of the map at a time when counting (mmap.count needs Python 3.13)
+COUNT_CHUNK = 1 << 20
+
+# Bytes str.strip() removes at the ends of a document that are also single characters
+ASCII_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+
+class MappedText:
+    """Read-only memory map of a UTF-8 text file
+
+    Line counting, newline searches and the whitespace-stripped extent run
+    over the mapped pages in C without building the document's string
+    (counting copies at most COUNT_CHUNK bytes at a time); only the byte
+    ranges handed to decode() become text. Decoding matches reading
+    the file in text mode (universal newlines), so offsets into decoded
+    text line up with what parse_text returns. Memoryviews from view() must
+    be released before close().
+    """
+
+    def __init__(self, file_path: str):
+        self._file = open(file_path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # Empty files cannot be mapped
+        self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.has_cr = self.buffer.find(b'\r') >= 0
+
+    def __enter__(self) -> 'MappedText':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def line_count(self, start: int = 0, end: int = None) -> int:
+        """Lines in a byte range, as len(text.split('\\n')) counts them after decoding"""
+        end = self.size if end is None else end
+        newlines = self.count(b'\n', start, end)
+        if self.has_cr:
+            # Universal newlines: a lone \r ends a line too, \r\n only once
+            newlines += self.count(b'\r', start, end) - self.count(b'\r\n', start, end)
+        return newlines + 1
+
+    def count(self, sub: bytes, start: int = 0, end: int = None) -> int:
+        """Non-overlapping occurrences of sub in a byte range"""
+        end = self.size if end is None else end
+        if hasattr(self.buffer, 'count'):
+            return self.buffer.count(sub, start, end)
+        total = 0
+        while start < end:
+            stop = min(start + COUNT_CHUNK, end)
+            # Reach len(sub) - 1 bytes past the chunk so a match across its edge counts here, once
+            total += self.buffer[start:min(stop + len(sub) - 1, end)].count(sub)
+            start = stop
+        return total
+
+    def stripped_range(self) -> Tuple[int, int]:
+        """Byte range left after dropping leading and trailing ASCII whitespace"""
+        start, end = 0, self.size
+        buffer = self.buffer
+        while start < end and buffer[start:start + 1] in ASCII_WHITESPACE:
+            start += 1
+        while end > start and buffer[end - 1:end] in ASCII_WHITESPACE:
+            end -= 1
+        return start, end
+
+    def view(self, start: int = 0, end: int = None) -> memoryview:
+        """Zero-copy view of a byte range"""
+        return memoryview(self.buffer)[start:self.size if end is None else end]
+
+    def decode(self, start: int = 0, end: int = None) -> str:
+        """Text of a byte range, with newlines translated like text mode"""
+        end = self.size if end is None else end
+        with self.view(start, end) as view:
+            text = str(view, 'utf-8')
+        if self.has_cr and '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    def block_ranges(self, block_bytes: int) -> Iterator[Tuple[int, int]]:
+        """Byte ranges of about block_bytes, each ending just after a newline (or at the end)
+
+        Blocks never split a line, so they never split a UTF-8 sequence or
+        a \\r\\n pair either.
+        """
+        start = 0
+        while start < self.size:
+            end = self.buffer.find(b'\n', min(start + block_bytes, self.size) - 1)
+            end = self.size if end < 0 else end + 1
+            yield start, end
+            start = end
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self._file.close()
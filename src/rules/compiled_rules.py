@@ -0,0 +1,208 @@
+from bisect import bisect_right
+from typing import Dict, List, Any, NamedTuple, Optional, Tuple
+from src.utils.document_scanner import KEY_CLEAN_PATTERN, KV_SEPARATORS
+
+# Bumped whenever compiled extractors change shape; older ones are not used
+COMPILER_VERSION = "1.1"
+
+# Lines a field may have moved from where it sat in the learned document
+DRIFT_LINES = 10
+
+# Share of labelled locators that must find their field, or the full extraction runs instead
+MIN_MATCH_SHARE = 0.8
+
+# Longest label a locator anchors on
+MAX_LABEL_CHARS = 50
+
+
+class FieldLocator(NamedTuple):
+    """Where one learned field sits in its layout
+
+    The value is the rest of the first line (among non-blank lines) that
+    starts with label, or the line after it with next_line. An empty label
+    is purely positional: the whole line at that index.
+
+    For paged documents, page is the page the field was learned on
+    (negative counts from the last page) and page_line its line on that
+    page.
+    """
+    target: str  # 'title', 'key_value_pairs.<key>' or 'key_fields.<name>'
+    label: str
+    line: int
+    next_line: bool = False
+    page: Optional[int] = None
+    page_line: Optional[int] = None
+
+
+def content_lines(content: str) -> List[str]:
+    """Non-blank lines, stripped (the lines the rule scanner counts)"""
+    return [line for line in map(str.strip, content.split('\n')) if line]
+
+
+def normalize_key(label: str) -> str:
+    """Key the rule scanner would derive from a label"""
+    return KEY_CLEAN_PATTERN.sub('_', label.rstrip(KV_SEPARATORS).strip().lower())
+
+
+def _line_pages(content: str, page_starts: List[int]) -> List[Tuple[int, int]]:
+    """(page, line on that page) of each non-blank line, given the character offsets of the pages"""
+    positions = []
+    offset = 0
+    page, first = -1, 0
+    for line in content.split('\n'):
+        if line.strip():
+            line_page = bisect_right(page_starts, offset) - 1
+            if line_page != page:
+                page, first = line_page, len(positions)
+            positions.append((page, len(positions) - first))
+        offset += len(line) + 1
+    return positions
+
+
+def _locate(lines: List[str], value: str) -> Optional[Tuple[str, int, bool]]:
+    """(label, line, next_line) of the first line ending in value after a label, or None"""
+    for index, line in enumerate(lines):
+        if not line.endswith(value):
+            continue
+        label = line[:len(line) - len(value)].strip()
+        if label:
+            if len(label) <= MAX_LABEL_CHARS:
+                return label, index, False
+        elif index and lines[index - 1][-1] in KV_SEPARATORS and len(lines[index - 1]) <= MAX_LABEL_CHARS:
+            return lines[index - 1], index - 1, True
+    return None
+
+
+def compile_rules(content: str, extracted_fields: Dict[str, Any], page_starts: List[int] = None) -> Dict[str, Any]:
+    """Locators for the fields learned from a document, in their stored (JSON) form
+
+    Key/value pairs are anchored on the label they followed, provided the
+    label yields the same key again; AI key_fields on whatever label
+    precedes their value; the title by its line. Fields whose value is not
+    at the end of a line are left out, except the title: a learned title
+    that is not a whole line (an AI-written one, say) leaves no locators
+    at all, so the layout keeps the full extraction rather than losing
+    its title. With page_starts (the character
+    offset of each page in content) locators also record their page, so
+    later documents of the layout can parse only the pages that hold fields.
+    """
+    lines = content_lines(content)
+    locators = []
+    for key, value in (extracted_fields.get('key_value_pairs') or {}).items():
+        found = _locate(lines, str(value).strip()) if str(value).strip() else None
+        if found and normalize_key(found[0]) == key:
+            locators.append(FieldLocator(f"key_value_pairs.{key}", *found))
+    key_fields = extracted_fields.get('key_fields')
+    if isinstance(key_fields, dict):
+        for name, value in key_fields.items():
+            if isinstance(value, (str, int, float)) and not isinstance(value, bool) and str(value).strip():
+                found = _locate(lines, str(value).strip())
+                if found:
+                    locators.append(FieldLocator(f"key_fields.{name}", *found))
+    title = extracted_fields.get('title') or (extracted_fields.get('metadata', {}).get('title_candidates') or [None])[0]
+    if isinstance(title, str) and title.strip():
+        if title.strip() not in lines:
+            return {'version': COMPILER_VERSION, 'locators': []}
+        locators.append(FieldLocator('title', '', lines.index(title.strip())))
+    spec = {'version': COMPILER_VERSION}
+    if page_starts:
+        pages = len(page_starts)
+        positions = _line_pages(content, page_starts)
+        paged = []
+        for locator in locators:
+            page, page_line = positions[locator.line]
+            # Fields in the back half are counted from the end, so they are found when page counts vary
+            paged.append(locator._replace(page=page if page < (pages + 1) // 2 else page - pages,
+                                          page_line=page_line))
+        locators = paged
+        spec['pages'] = pages
+    spec['locators'] = [locator._asdict() for locator in locators]
+    return spec
+
+
+class CompiledRules:
+    """Targeted extractor for one learned layout
+
+    Runs the locators of compile_rules over a document's non-blank lines
+    instead of the full rule scan: each looks at its learned line first,
+    then at most DRIFT_LINES either way.
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.locators = [FieldLocator(**locator) for locator in spec.get('locators', [])]
+        self.labelled = sum(1 for locator in self.locators if locator.label)
+        # Every locator knows its page, so documents can be parsed page by page
+        self.paged = bool(self.locators) and all(locator.page is not None for locator in self.locators)
+
+    @property
+    def usable(self) -> bool:
+        """Whether there is anything to anchor on"""
+        return self.labelled > 0
+
+    def _find(self, lines: List[str], locator: FieldLocator) -> Optional[str]:
+        """Value of one locator, or None"""
+        if not locator.label:
+            return lines[locator.line] if locator.line < len(lines) else None
+        for offset in range(DRIFT_LINES + 1):
+            for index in (locator.line - offset, locator.line + offset):
+                if 0 <= index < len(lines) and lines[index].startswith(locator.label):
+                    if locator.next_line:
+                        return lines[index + 1] if index + 1 < len(lines) else None
+                    return lines[index][len(locator.label):].strip() or None
+        return None
+
+    def pages_for(self, page_count: int) -> Optional[List[int]]:
+        """Pages (from 0) holding the fields of a document with page_count pages, or None if some do not exist"""
+        if not self.paged:
+            return None
+        pages = {0}
+        for locator in self.locators:
+            page = locator.page if locator.page >= 0 else page_count + locator.page
+            if not 0 <= page < page_count:
+                return None
+            pages.add(page)
+        return sorted(pages)
+
+    def extract(self, content: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Fields and the share of labelled locators that matched, or None below MIN_MATCH_SHARE"""
+        lines = content_lines(content)
+        return self._extract([(lines, locator) for locator in self.locators], len(lines), len(content))
+
+    def extract_pages(self, texts: Dict[int, str], page_count: int) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Like extract, from the text of the pages pages_for(page_count) named
+
+        Each locator searches only its own page, from its line on that page.
+        """
+        lines = {page: content_lines(text) for page, text in texts.items()}
+        searches = []
+        for locator in self.locators:
+            page = locator.page if locator.page >= 0 else page_count + locator.page
+            searches.append((lines.get(page, []), locator._replace(line=locator.page_line)))
+        return self._extract(searches, sum(map(len, lines.values())), sum(map(len, texts.values())))
+
+    def _extract(self, searches: List[Tuple[List[str], FieldLocator]], line_count: int,
+                 char_count: int) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Run (lines, locator) searches into extracted fields and their match share"""
+        if not self.usable:
+            return None
+        extracted = {'key_value_pairs': {}}
+        matched = 0
+        for lines, locator in searches:
+            value = self._find(lines, locator)
+            if value is None:
+                continue
+            matched += bool(locator.label)
+            group, _, name = locator.target.partition('.')
+            if name:
+                extracted.setdefault(group, {})[name] = value
+            else:
+                extracted[group] = value
+        share = matched / self.labelled
+        if share < MIN_MATCH_SHARE:
+            return None
+        extracted['metadata'] = {
+            'title_candidates': [extracted['title']] if 'title' in extracted else [],
+            'line_count': line_count,
+            'char_count': char_count,
+        }
+        return extracted, round(share, 3)
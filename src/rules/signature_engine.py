@@ -1,53 +1,206 @@
+import os
 import json
 import hashlib
-from typing import Dict, List, Any
+import threading
+from typing import Dict, List, Any, Tuple, Optional
 from datetime import datetime
+from src.rules.signature_store import SignatureStore, MemorySignatureStore
+from src.rules.similarity import structure_sketch, band_keys, estimate_similarity
+from src.rules.compiled_rules import CompiledRules, COMPILER_VERSION
+
+# Leading lines that make up a layout signature
+SIGNATURE_LINES = 10
+
+# Estimated structural similarity needed to reuse another signature's rules
+SIMILARITY_THRESHOLD = 0.8
+
+# Below this similarity an exact signature hit is treated as a collision
+COLLISION_THRESHOLD = 0.3
+
+
+class SignatureHead:
+    """Collects the leading line layout of streamed text for a signature"""
+    
+    def __init__(self):
+        self.structure = []  # Blank/non-blank flag per completed line
+        self.complete = False
+        self._current = False  # Current partial line has text
+        self._started = False
+    
+    def feed(self, text: str) -> bool:
+        """Add streamed text; True once the signature lines are settled"""
+        if self.complete:
+            return True
+        if not self._started:
+            # Leading whitespace is stripped, as in parsed content
+            text = text.lstrip()
+            if not text:
+                return False
+            self._started = True
+        
+        lines = text.split('\n', SIGNATURE_LINES + 1)
+        for index, line in enumerate(lines):
+            has_text = self._current or bool(line.strip())
+            if index == len(lines) - 1:
+                self._current = has_text
+            else:
+                self.structure.append(has_text)
+                self._current = False
+            # Settled once text follows the signature lines, so trailing
+            # blank lines are never mistaken for part of the layout
+            if len(self.structure) >= SIGNATURE_LINES and (any(self.structure[SIGNATURE_LINES:]) or self._current):
+                self.structure = self.structure[:SIGNATURE_LINES]
+                self.complete = True
+                break
+        return self.complete
+    
+    def layout(self) -> List[bool]:
+        """Line flags matching extract_signature on the stripped text"""
+        if self.complete:
+            return self.structure
+        if not self._started:
+            return [False]
+        structure = self.structure + [self._current]
+        while not structure[-1]:
+            structure.pop()
+        return structure[:SIGNATURE_LINES]
+
 
 class SignatureEngine:
     """Learn and reuse document signatures/patterns"""
     
-    def __init__(self):
-        self.signatures = {}
-        self.sender_patterns = {}
+    def __init__(self, store: SignatureStore = None):
+        self.store = store if store is not None else MemorySignatureStore()
         self.version = "1.0"
+        self.similarity_threshold = SIMILARITY_THRESHOLD
+        self.collision_threshold = COLLISION_THRESHOLD
+        self.track_learned = False  # Journal new patterns for drain_learned (batch workers)
+        self.learned = []
+        self._compiled = {}  # (sender, signature, learned_at) -> CompiledRules
+        self._lock = threading.Lock()
     
     def extract_signature(self, content: str, metadata: Dict) -> str:
         """Extract document signature for pattern matching"""
-        lines = content.split('\n')[:10]
+        lines = content.split('\n', SIGNATURE_LINES)[:SIGNATURE_LINES]
         structure = [len(line.strip()) > 0 for line in lines]
-        signature = hashlib.md5(str(structure).encode()).hexdigest()[:8]
-        return signature
-    
-    def learn_pattern(self, signature: str, extraction_rules: Dict, sender: str = None):
-        """Learn new extraction pattern"""
-        if sender:
-            if sender not in self.sender_patterns:
-                self.sender_patterns[sender] = {}
-            self.sender_patterns[sender][signature] = {
-                'rules': extraction_rules,
-                'version': self.version,
-                'learned_at': datetime.now().isoformat()
-            }
-        else:
-            self.signatures[signature] = {
-                'rules': extraction_rules,
-                'version': self.version,
-                'learned_at': datetime.now().isoformat()
-            }
+        return self._hash_structure(structure)
+    
+    def extract_signature_from_head(self, head: SignatureHead, metadata: Dict) -> str:
+        """Signature of streamed text, equal to extract_signature on the whole content"""
+        return self._hash_structure(head.layout())
+    
+    def extract_signature_from_layout(self, layout: List[bool]) -> str:
+        """Signature of the blank/non-blank flags of a document's leading lines"""
+        return self._hash_structure(layout[:SIGNATURE_LINES])
+    
+    def extract_sketch(self, content: str) -> Optional[List[int]]:
+        """MinHash fingerprint of the leading line shapes, for similarity matching"""
+        return structure_sketch(content)
+    
+    def _hash_structure(self, structure: List[bool]) -> str:
+        """Short hash of the blank/non-blank line layout"""
+        return hashlib.md5(str(structure).encode()).hexdigest()[:8]
+    
+    def learn_pattern(self, signature: str, extraction_rules: Dict, sender: str = None,
+                      sketch: List[int] = None, extractors: Dict = None):
+        """Learn new extraction pattern (extractors: compile_rules output for the fast path)"""
+        entry = {
+            'rules': extraction_rules,
+            'version': self.version,
+            'learned_at': datetime.now().isoformat()
+        }
+        if sketch:
+            entry['minhash'] = sketch
+        if extractors:
+            entry['extractors'] = extractors
+        self.store.put(signature, entry, sender)
+        if self.track_learned:
+            with self._lock:
+                self.learned.append((signature, sender, entry))
+    
+    def drain_learned(self) -> List[Tuple[str, str, Dict]]:
+        """Return and clear patterns learned since the last drain"""
+        with self._lock:
+            learned, self.learned = self.learned, []
+        return learned
+    
+    def merge_learned(self, learned: List[Tuple[str, str, Dict]]):
+        """Merge patterns learned elsewhere, keeping the most recent entry"""
+        self.store.merge(learned)
     
     def get_rules(self, signature: str, sender: str = None) -> Dict:
         """Get extraction rules for signature"""
-        if sender and sender in self.sender_patterns:
-            return self.sender_patterns[sender].get(signature, {}).get('rules', {})
-        return self.signatures.get(signature, {}).get('rules', {})
+        if sender and self.store.has_sender(sender):
+            entry = self.store.get(signature, sender)
+        else:
+            entry = self.store.get(signature)
+        return (entry or {}).get('rules', {})
+    
+    def match_rules(self, signature: str, sketch: Optional[List[int]],
+                    sender: str = None) -> Tuple[Dict, Optional[str], float]:
+        """Rules for a document, falling back to the most similar learned layout
+        
+        Returns (rules, matched signature, similarity). An exact signature
+        hit is used unless both sides have sketches that disagree (a hash
+        collision between unrelated layouts); otherwise the LSH buckets are
+        searched for the nearest sketch above similarity_threshold.
+        """
+        entry, matched, similarity = self.match_pattern(signature, sketch, sender)
+        return (entry or {}).get('rules', {}), matched, similarity
+    
+    def match_pattern(self, signature: str, sketch: Optional[List[int]],
+                      sender: str = None) -> Tuple[Optional[Dict], Optional[str], float]:
+        """Like match_rules, but returns the whole learned entry"""
+        scope = sender if sender and self.store.has_sender(sender) else None
+        entry = self.store.get(signature, scope)
+        if entry and entry.get('rules'):
+            if not sketch or not entry.get('minhash'):
+                return entry, signature, 1.0
+            similarity = estimate_similarity(sketch, entry['minhash'])
+            if similarity >= self.collision_threshold:
+                return entry, signature, similarity
+        
+        if not sketch:
+            return None, None, 0.0
+        best_signature, best_entry, best_similarity = None, None, 0.0
+        for candidate, candidate_entry in self.store.candidates(band_keys(sketch), scope):
+            if candidate == signature or not candidate_entry or not candidate_entry.get('rules'):
+                continue
+            similarity = estimate_similarity(sketch, candidate_entry.get('minhash'))
+            if similarity >= self.similarity_threshold and similarity > best_similarity:
+                best_signature, best_entry, best_similarity = candidate, candidate_entry, similarity
+        return best_entry, best_signature, best_similarity
+    
+    def compiled_rules(self, signature: str, entry: Optional[Dict], sender: str = None) -> Optional[CompiledRules]:
+        """Fast-path extractor of a matched entry, built once per learned version"""
+        extractors = (entry or {}).get('extractors')
+        if not extractors or extractors.get('version') != COMPILER_VERSION:
+            return None
+        key = (sender or '', signature, entry.get('learned_at'))
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = CompiledRules(extractors)
+            with self._lock:
+                self._compiled[key] = compiled
+        return compiled if compiled.usable else None
+    
+    def export_state(self) -> Dict[str, Any]:
+        """Snapshot of learned signatures (the persisted format)"""
+        data = self.store.export()
+        data['version'] = self.version
+        return data
+    
+    def load_state(self, data: Dict[str, Any]):
+        """Replace learned signatures with a snapshot"""
+        self.store.replace(data)
+        self.version = data.get('version', '1.0')
     
     def save_signatures(self, filepath: str):
-        """Persist learned signatures"""
-        data = {
-            'signatures': self.signatures,
-            'sender_patterns': self.sender_patterns,
-            'version': self.version
-        }
+        """Persist learned signatures (persistent stores are already up to date)"""
+        if self.store.persistent:
+            return
+        data = self.export_state()
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
         with open(filepath, 'w') as f:
             json.dump(data, f, indent=2)
     
@@ -55,9 +208,6 @@ class SignatureEngine:
         """Load saved signatures"""
         try:
             with open(filepath, 'r') as f:
-                data = json.load(f)
-                self.signatures = data.get('signatures', {})
-                self.sender_patterns = data.get('sender_patterns', {})
-                self.version = data.get('version', '1.0')
+                self.load_state(json.load(f))
         except FileNotFoundError:
             pass
\ No newline at end of file
@@ -0,0 +1,368 @@
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from src.rules.similarity import band_keys
+
+# Seconds a writer waits for another process's lock on the database
+SQLITE_BUSY_TIMEOUT = 30.0
+
+# Rows written per transaction when importing a JSON file
+MIGRATION_BATCH_SIZE = 10000
+
+# Most similar-signature candidates returned from the LSH buckets
+MAX_CANDIDATES = 50
+
+
+class SignatureStore(ABC):
+    """Backend holding learned patterns keyed by (sender, signature)
+
+    Entries are the dicts SignatureEngine.learn_pattern builds ('rules',
+    'version', 'learned_at' and optionally a 'minhash' sketch and compiled
+    'extractors'); a sender of None is the global table. Sketched entries are indexed into LSH buckets
+    so candidates finds structurally similar signatures without a scan.
+    """
+
+    # Whether writes are already durable (save_signatures has nothing to do)
+    persistent = False
+
+    @abstractmethod
+    def get(self, signature: str, sender: str = None) -> Optional[Dict]:
+        """Entry for a signature, or None"""
+
+    @abstractmethod
+    def put(self, signature: str, entry: Dict, sender: str = None):
+        """Insert or replace one entry"""
+
+    @abstractmethod
+    def merge(self, learned: Iterable[Tuple[str, str, Dict]]):
+        """Upsert (signature, sender, entry) triples, keeping the most recent entry"""
+
+    @abstractmethod
+    def has_sender(self, sender: str) -> bool:
+        """Whether any pattern was learned for a sender"""
+
+    @abstractmethod
+    def candidates(self, keys: List[str], sender: str = None) -> List[Tuple[str, Dict]]:
+        """(signature, entry) pairs sharing an LSH bucket, most shared buckets first"""
+
+    @abstractmethod
+    def export(self) -> Dict[str, Any]:
+        """All entries as {'signatures': ..., 'sender_patterns': ...}"""
+
+    @abstractmethod
+    def replace(self, data: Dict[str, Any]):
+        """Replace every entry with an exported snapshot"""
+
+    def close(self):
+        """Release any resources held by the store"""
+
+
+class MemorySignatureStore(SignatureStore):
+    """Patterns held in dicts, persisted as a whole JSON file"""
+
+    def __init__(self):
+        self.signatures = {}
+        self.sender_patterns = {}
+        self._buckets = None  # (sender, band key) -> signatures, built on first search
+        self._lock = threading.Lock()
+
+    def get(self, signature: str, sender: str = None) -> Optional[Dict]:
+        if sender:
+            return self.sender_patterns.get(sender, {}).get(signature)
+        return self.signatures.get(signature)
+
+    def put(self, signature: str, entry: Dict, sender: str = None):
+        with self._lock:
+            self._put(signature, entry, sender)
+
+    def _put(self, signature: str, entry: Dict, sender: str = None):
+        """Place an entry in the sender or global table"""
+        if sender:
+            if sender not in self.sender_patterns:
+                self.sender_patterns[sender] = {}
+            self.sender_patterns[sender][signature] = entry
+        else:
+            self.signatures[signature] = entry
+        if self._buckets is not None:
+            self._index(signature, entry, sender)
+
+    def _index(self, signature: str, entry: Dict, sender: str = None):
+        """Add a sketched entry to the LSH buckets"""
+        if entry.get('minhash'):
+            for key in band_keys(entry['minhash']):
+                self._buckets[(sender or '', key)].add(signature)
+
+    def merge(self, learned: Iterable[Tuple[str, str, Dict]]):
+        with self._lock:
+            for signature, sender, entry in learned:
+                current = self.get(signature, sender)
+                if current and current.get('learned_at', '') > entry.get('learned_at', ''):
+                    continue
+                self._put(signature, entry, sender)
+
+    def has_sender(self, sender: str) -> bool:
+        return sender in self.sender_patterns
+
+    def candidates(self, keys: List[str], sender: str = None) -> List[Tuple[str, Dict]]:
+        with self._lock:
+            if self._buckets is None:
+                self._buckets = defaultdict(set)
+                for signature, entry_sender, entry in snapshot_entries(self.export_unlocked()):
+                    self._index(signature, entry, entry_sender)
+            shared = defaultdict(int)
+            for key in keys:
+                for signature in self._buckets.get((sender or '', key), ()):
+                    shared[signature] += 1
+        ranked = sorted(shared, key=shared.get, reverse=True)[:MAX_CANDIDATES]
+        return [(signature, self.get(signature, sender)) for signature in ranked]
+
+    def export(self) -> Dict[str, Any]:
+        with self._lock:
+            return self.export_unlocked()
+
+    def export_unlocked(self) -> Dict[str, Any]:
+        """Snapshot for callers already holding the lock"""
+        return {
+            'signatures': dict(self.signatures),
+            'sender_patterns': {sender: dict(patterns) for sender, patterns in self.sender_patterns.items()}
+        }
+
+    def replace(self, data: Dict[str, Any]):
+        with self._lock:
+            self.signatures = data.get('signatures', {})
+            self.sender_patterns = data.get('sender_patterns', {})
+            self._buckets = None
+
+
+class SQLiteSignatureStore(SignatureStore):
+    """Patterns in an indexed SQLite table, written one upsert at a time
+
+    Lookups hit the (sender, signature) primary key, so nothing is loaded up
+    front and the database is only opened on first use. Each thread gets
+    its own connection; WAL journaling lets batch worker processes share
+    one file, and upserts keep whichever entry was learned last.
+    """
+
+    persistent = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """This thread's connection, created (with the schema) on first use"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS patterns (
+                        sender TEXT NOT NULL,
+                        signature TEXT NOT NULL,
+                        rules TEXT NOT NULL,
+                        version TEXT,
+                        learned_at TEXT,
+                        minhash TEXT,
+                        extractors TEXT,
+                        PRIMARY KEY (sender, signature)
+                    ) WITHOUT ROWID
+                """)
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS pattern_buckets (
+                        sender TEXT NOT NULL,
+                        bucket TEXT NOT NULL,
+                        signature TEXT NOT NULL,
+                        PRIMARY KEY (sender, bucket, signature)
+                    ) WITHOUT ROWID
+                """)
+                connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                # Databases created before sketches and compiled extractors were stored
+                columns = [row[1] for row in connection.execute("PRAGMA table_info(patterns)")]
+                if 'minhash' not in columns:
+                    connection.execute("ALTER TABLE patterns ADD COLUMN minhash TEXT")
+                if 'extractors' not in columns:
+                    connection.execute("ALTER TABLE patterns ADD COLUMN extractors TEXT")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def get(self, signature: str, sender: str = None) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT rules, version, learned_at, minhash, extractors FROM patterns WHERE sender = ? AND signature = ?",
+            (sender or '', signature)
+        ).fetchone()
+        return self._entry(row) if row else None
+
+    def put(self, signature: str, entry: Dict, sender: str = None):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO patterns VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._row(signature, entry, sender)
+            )
+            connection.execute(
+                "DELETE FROM pattern_buckets WHERE sender = ? AND signature = ?", (sender or '', signature)
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO pattern_buckets VALUES (?, ?, ?)", self._bucket_rows(signature, entry, sender)
+            )
+
+    def merge(self, learned: Iterable[Tuple[str, str, Dict]]):
+        learned = list(learned)
+        if not learned:
+            return
+        with self._connect() as connection:
+            self._merge_rows(connection, learned)
+
+    def _merge_rows(self, connection: sqlite3.Connection, learned: List[Tuple[str, str, Dict]]):
+        """Newest-wins upsert of entries and their buckets within a transaction"""
+        connection.executemany("""
+            INSERT INTO patterns VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (sender, signature) DO UPDATE SET
+                rules = excluded.rules, version = excluded.version,
+                learned_at = excluded.learned_at, minhash = excluded.minhash, extractors = excluded.extractors
+            WHERE IFNULL(excluded.learned_at, '') >= IFNULL(patterns.learned_at, '')
+        """, [self._row(signature, entry, sender) for signature, sender, entry in learned])
+        # Buckets of superseded sketches may linger; candidates are
+        # always re-scored against the stored sketch
+        connection.executemany(
+            "INSERT OR IGNORE INTO pattern_buckets VALUES (?, ?, ?)",
+            [row for signature, sender, entry in learned for row in self._bucket_rows(signature, entry, sender)]
+        )
+
+    def _row(self, signature: str, entry: Dict, sender: str = None) -> tuple:
+        """Table row for an entry"""
+        minhash = entry.get('minhash')
+        extractors = entry.get('extractors')
+        return (sender or '', signature, json.dumps(entry.get('rules', {})),
+                entry.get('version'), entry.get('learned_at'), json.dumps(minhash) if minhash else None,
+                json.dumps(extractors) if extractors else None)
+
+    def _bucket_rows(self, signature: str, entry: Dict, sender: str = None) -> List[tuple]:
+        """LSH bucket rows for a sketched entry"""
+        if not entry.get('minhash'):
+            return []
+        return [(sender or '', key, signature) for key in band_keys(entry['minhash'])]
+
+    def _entry(self, row: tuple) -> Dict:
+        """Entry dict from (rules, version, learned_at, minhash, extractors) columns"""
+        entry = {'rules': json.loads(row[0]), 'version': row[1], 'learned_at': row[2]}
+        if row[3]:
+            entry['minhash'] = json.loads(row[3])
+        if row[4]:
+            entry['extractors'] = json.loads(row[4])
+        return entry
+
+    def has_sender(self, sender: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM patterns WHERE sender = ? LIMIT 1", (sender,)
+        ).fetchone()
+        return row is not None
+
+    def candidates(self, keys: List[str], sender: str = None) -> List[Tuple[str, Dict]]:
+        if not keys:
+            return []
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connect().execute(f"""
+            SELECT p.signature, p.rules, p.version, p.learned_at, p.minhash, p.extractors
+            FROM (
+                SELECT signature, COUNT(*) AS shared FROM pattern_buckets
+                WHERE sender = ? AND bucket IN ({placeholders})
+                GROUP BY signature ORDER BY shared DESC LIMIT ?
+            ) AS c
+            JOIN patterns AS p ON p.sender = ? AND p.signature = c.signature
+            ORDER BY c.shared DESC
+        """, (sender or '', *keys, MAX_CANDIDATES, sender or '')).fetchall()
+        return [(row[0], self._entry(row[1:])) for row in rows]
+
+    def count(self) -> int:
+        """Number of stored patterns"""
+        return self._connect().execute("SELECT COUNT(*) FROM patterns").fetchone()[0]
+
+    def export(self) -> Dict[str, Any]:
+        data = {'signatures': {}, 'sender_patterns': {}}
+        rows = self._connect().execute("SELECT sender, signature, rules, version, learned_at, minhash, extractors FROM patterns")
+        for row in rows:
+            sender, signature, entry = row[0], row[1], self._entry(row[2:])
+            if sender:
+                data['sender_patterns'].setdefault(sender, {})[signature] = entry
+            else:
+                data['signatures'][signature] = entry
+        return data
+
+    def replace(self, data: Dict[str, Any]):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM patterns")
+            connection.execute("DELETE FROM pattern_buckets")
+            self._merge_rows(connection, list(snapshot_entries(data)))
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """Stored metadata value"""
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        """Store a metadata value"""
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def migrate_json(self, filepath: str) -> int:
+        """Import a signatures.json file once; returns the number of patterns imported
+
+        Existing rows are only replaced by newer entries, and the file is
+        left in place. A file that was already imported (same size and
+        modification time) is skipped.
+        """
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return 0
+        marker = f"{os.path.abspath(filepath)}:{stat.st_size}:{stat.st_mtime_ns}"
+        if self.get_meta('migrated_from') == marker:
+            return 0
+
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+
+        imported = 0
+        batch = []
+        for item in snapshot_entries(data):
+            batch.append(item)
+            if len(batch) >= MIGRATION_BATCH_SIZE:
+                self.merge(batch)
+                imported += len(batch)
+                batch = []
+        self.merge(batch)
+        imported += len(batch)
+
+        if data.get('version'):
+            self.set_meta('version', data['version'])
+        self.set_meta('migrated_from', marker)
+        return imported
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+def snapshot_entries(data: Dict[str, Any]) -> Iterable[Tuple[str, Optional[str], Dict]]:
+    """(signature, sender, entry) for every pattern in an exported snapshot"""
+    for signature, entry in data.get('signatures', {}).items():
+        yield signature, None, entry
+    for sender, patterns in data.get('sender_patterns', {}).items():
+        for signature, entry in patterns.items():
+            yield signature, sender, entry
@@ -0,0 +1,96 @@
+import re
+import zlib
+import numpy as np
+from typing import List, Optional, Iterable
+
+# Leading lines whose shapes make up a structural fingerprint
+SHAPE_LINES = 60
+
+# Consecutive line shapes per shingle (single shapes are always included)
+SHINGLE_SIZE = 3
+
+# MinHash permutations, split into LSH bands of equal rows
+NUM_PERM = 64
+LSH_BANDS = 16
+
+# Hashes are taken modulo a Mersenne prime below 2**31 so products fit in 64 bits
+MERSENNE_PRIME = (1 << 31) - 1
+
+TOKEN_SPLIT_PATTERN = re.compile(r'\S+')
+TRAILING_PUNCT_PATTERN = re.compile(r'[^\w]+$')
+
+# Fixed permutations so sketches compare across processes and runs
+_random = np.random.RandomState(1)
+_PERM_A = _random.randint(1, MERSENNE_PRIME, size=NUM_PERM, dtype=np.int64)
+_PERM_B = _random.randint(0, MERSENNE_PRIME, size=NUM_PERM, dtype=np.int64)
+
+
+def token_class(token: str) -> str:
+    """Coarse class of a token, keeping trailing punctuation such as ':'"""
+    punct = TRAILING_PUNCT_PATTERN.search(token)
+    suffix = punct.group()[-1] if punct else ''
+    core = token[:punct.start()] if punct else token
+    if not core:
+        return 'P' + suffix
+    if core.isdigit() or core.replace(',', '').replace('.', '').replace('/', '').replace('-', '').isdigit():
+        return 'N' + suffix
+    if core.isupper():
+        return 'U' + suffix
+    if core[0].isupper():
+        return 'W' + suffix
+    if core.isalpha():
+        return 'w' + suffix
+    return 'M' + suffix
+
+
+def line_shape(line: str) -> str:
+    """Layout of one line: indentation and run-collapsed token classes"""
+    if not line.strip():
+        return ''
+    shape = ['>'] if line[0].isspace() else []
+    for token in TOKEN_SPLIT_PATTERN.findall(line):
+        cls = token_class(token)
+        if shape and shape[-1].rstrip('+') == cls:
+            shape[-1] = cls + '+'
+        else:
+            shape.append(cls)
+    return ' '.join(shape)
+
+
+def structure_shingles(content: str) -> List[str]:
+    """Shapes of the leading lines and their consecutive runs"""
+    shapes = [line_shape(line) for line in content.strip().split('\n')[:SHAPE_LINES]]
+    shingles = {'1|' + shape for shape in shapes if shape}
+    for index in range(len(shapes) - SHINGLE_SIZE + 1):
+        shingles.add('3|' + '\n'.join(shapes[index:index + SHINGLE_SIZE]))
+    return sorted(shingles)
+
+
+def minhash(shingles: Iterable[str]) -> Optional[List[int]]:
+    """MinHash sketch of a shingle set (None when there is nothing to hash)"""
+    hashes = np.fromiter((zlib.crc32(s.encode()) & MERSENNE_PRIME for s in shingles), dtype=np.int64)
+    if not len(hashes):
+        return None
+    values = (np.outer(hashes, _PERM_A) + _PERM_B) % MERSENNE_PRIME
+    return values.min(axis=0).tolist()
+
+
+def structure_sketch(content: str) -> Optional[List[int]]:
+    """Structural fingerprint of a document's leading layout"""
+    return minhash(structure_shingles(content))
+
+
+def band_keys(sketch: List[int]) -> List[str]:
+    """LSH bucket keys; similar sketches share at least one with high probability"""
+    rows = len(sketch) // LSH_BANDS
+    return [
+        f"{band}:{zlib.crc32(str(sketch[band * rows:(band + 1) * rows]).encode()):08x}"
+        for band in range(LSH_BANDS)
+    ]
+
+
+def estimate_similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of two sketches"""
+    if not first or not second or len(first) != len(second):
+        return 0.0
+    return sum(a == b for a, b in zip(first, second)) / len(first)
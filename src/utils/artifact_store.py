@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Iterable, Iterator, Tuple
+
+# Seconds a connection waits on another process's write lock
+SQLITE_BUSY_TIMEOUT = 30.0
+
+# zlib level for stored payloads (fastest; higher levels save little on extracted text)
+COMPRESSION_LEVEL = 1
+
+
+def stage_stamp(*parts: Any) -> str:
+    """Version stamp of a stage: the code versions and inputs its output depends on"""
+    return '|'.join(str(part) for part in parts)
+
+
+def value_digest(value: Any) -> str:
+    """Short digest of a JSON-serializable input (for example the rules a document matched)"""
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class ArtifactStore:
+    """SQLite store of per-stage pipeline outputs, keyed by file content
+
+    Each document (identified by the SHA-256 of its bytes) keeps the output
+    of every stage it went through - parsed text and metadata, signature,
+    rule fields and AI result - together with the stamp it was computed
+    under. A stage is reused only while its stamp still matches, and each
+    stamp includes the stamps of the stages before it, so a new parser
+    version reruns everything while new rules or learned patterns rerun
+    only the rule stage. Payloads are zlib-compressed JSON; connections are
+    per thread and the database is shared by worker processes (WAL mode).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """This thread's connection, created (with the schema) on first use"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS sources (
+                        source_key TEXT PRIMARY KEY,
+                        file_path TEXT,
+                        sender TEXT,
+                        updated_at REAL
+                    ) WITHOUT ROWID
+                """)
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS artifacts (
+                        source_key TEXT NOT NULL,
+                        stage TEXT NOT NULL,
+                        stamp TEXT NOT NULL,
+                        data BLOB NOT NULL,
+                        PRIMARY KEY (source_key, stage)
+                    ) WITHOUT ROWID
+                """)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def get(self, source_key: str, stage: str, stamp: str = None) -> Optional[Dict[str, Any]]:
+        """Stored output of a stage, or None when missing or computed under another stamp
+
+        Without a stamp the stored output is returned whatever it was computed under.
+        """
+        row = self._connect().execute(
+            "SELECT stamp, data FROM artifacts WHERE source_key = ? AND stage = ?", (source_key, stage)
+        ).fetchone()
+        if row is None or (stamp is not None and row[0] != stamp):
+            return None
+        return json.loads(zlib.decompress(row[1]))
+
+    def put(self, source_key: str, stage: str, stamp: str, data: Dict[str, Any]):
+        """Store the output of a stage, replacing any older one"""
+        payload = zlib.compress(json.dumps(data, separators=(',', ':'), default=str).encode(), COMPRESSION_LEVEL)
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)",
+                               (source_key, stage, stamp, payload))
+
+    def record_source(self, source_key: str, file_path: Optional[str], sender: str = None):
+        """Remember where a document came from, for reprocessing without the caller (None: given in memory)"""
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                               (source_key, os.path.abspath(file_path) if file_path else None, sender, time.time()))
+
+    def source(self, source_key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(file path, sender) a document was last processed with"""
+        row = self._connect().execute(
+            "SELECT file_path, sender FROM sources WHERE source_key = ?", (source_key,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def source_keys(self, source_keys: Iterable[str] = None) -> Iterator[str]:
+        """Keys of every stored document (or the given ones that are stored), oldest first"""
+        if source_keys is not None:
+            for source_key in source_keys:
+                if self.source(source_key) is not None:
+                    yield source_key
+            return
+        rows = self._connect().execute("SELECT source_key FROM sources ORDER BY updated_at, source_key")
+        for row in rows.fetchall():
+            yield row[0]
+
+    def count(self) -> int:
+        """Number of stored documents"""
+        return self._connect().execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
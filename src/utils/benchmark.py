@@ -0,0 +1,443 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Any, Callable, Tuple, Optional
+
+# Synthetic document sizes (MB) benchmarked by default
+DEFAULT_SIZES_MB = (0.1, 1.0, 10.0)
+
+# Relative slowdown (or memory growth) reported as a regression
+DEFAULT_THRESHOLD = 0.2
+
+# Learned patterns in the signature lookup benchmarks
+DEFAULT_SIGNATURES = 10000
+
+# Latency of the simulated AI model in the routing benchmarks
+SIMULATED_AI_SECONDS = 0.05
+
+SAMPLE_DIR = 'sample_data'
+
+_WORDS = (
+    "agreement payment service client provider invoice amount period delivery schedule "
+    "revenue report quarter account balance total terms notice party contract section "
+    "review approval budget forecast growth margin customer vendor order shipment"
+).split()
+_LABELS = ["Invoice Number", "Due Date", "Customer ID", "Account", "Reference", "Order No",
+           "Contact", "Phone", "Email", "Amount Due", "Tax ID", "Region"]
+
+
+class SyntheticCorpus:
+    """Deterministic documents shaped like the sample data, scaled to any size"""
+
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+
+    def sentence(self) -> str:
+        """One prose sentence"""
+        words = self.random.choices(_WORDS, k=self.random.randint(6, 16))
+        return " ".join(words).capitalize() + "."
+
+    def section(self, number: int) -> List[str]:
+        """Header, key/value block, table and prose paragraph"""
+        r = self.random
+        lines = [f"SECTION {number} - {r.choice(_WORDS).upper()} {r.choice(_WORDS).upper()}:", ""]
+        for label in r.sample(_LABELS, 4):
+            lines.append(f"{label}: {r.choice(['INV', 'ACC', 'REF'])}-{r.randint(1000, 99999)}")
+        lines.append(f"Date: {r.randint(1, 28):02d}/{r.randint(1, 12):02d}/{r.randint(2019, 2025)}")
+        lines.append("")
+        lines.append("Item        Qty      Price      Total")
+        for _ in range(r.randint(2, 5)):
+            quantity, price = r.randint(1, 50), r.randint(5, 900)
+            lines.append(f"{r.choice(_WORDS).title():<12}{quantity:<9}${price:<10}${quantity * price}")
+        lines.append("")
+        lines.append(" ".join(self.sentence() for _ in range(r.randint(3, 8))))
+        lines.append("")
+        return lines
+
+    def lines(self, target_bytes: int) -> List[str]:
+        """Lines of a text document of roughly target_bytes"""
+        lines = ["QUARTERLY BUSINESS REPORT", "Prepared for the Board of Directors", ""]
+        size = sum(len(line) + 1 for line in lines)
+        number = 0
+        while size < target_bytes:
+            number += 1
+            section = self.section(number)
+            lines.extend(section)
+            size += sum(len(line) + 1 for line in section)
+        return lines
+
+    def write(self, directory: str, doc_format: str, target_bytes: int, name: str = None) -> str:
+        """Write a synthetic document in a format (text, html, docx, pdf)"""
+        lines = self.lines(target_bytes)
+        extension = {'text': 'txt'}.get(doc_format, doc_format)
+        path = os.path.join(directory, f"{name or 'synthetic'}.{extension}")
+        if doc_format == 'text':
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines))
+        elif doc_format == 'html':
+            write_html(path, lines)
+        elif doc_format == 'docx':
+            write_docx(path, lines)
+        elif doc_format == 'pdf':
+            write_pdf(path, lines)
+        else:
+            raise ValueError(f"Unsupported format: {doc_format}")
+        return path
+
+
+def write_html(path: str, lines: List[str]):
+    """HTML page with a paragraph per line"""
+    from html import escape
+    body = "\n".join(f"<p>{escape(line)}</p>" if line else "<br>" for line in lines)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"<html><head><title>{escape(lines[0])}</title></head><body>\n{body}\n</body></html>")
+
+
+def write_docx(path: str, lines: List[str]):
+    """Word document with a paragraph per line"""
+    import docx
+    document = docx.Document()
+    for line in lines:
+        document.add_paragraph(line)
+    document.save(path)
+
+
+def write_pdf(path: str, lines: List[str], lines_per_page: int = 60):
+    """Minimal text-only PDF (Helvetica, one text object per page)"""
+    def escape(line: str) -> str:
+        line = line.encode('latin-1', 'replace').decode('latin-1')
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in pages:
+        text = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({escape(line)}) Tj T*" for line in page) + " ET"
+        stream = text.encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        page_ids.append(len(objects))
+    kids = " ".join(f"{number} 0 R" for number in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def measure(calls: List[Tuple[Callable[[], Any], int]], repeat: int = 5, warmup: int = 1,
+            trace_memory: bool = True) -> Dict[str, float]:
+    """Time each (call, input bytes) pair `repeat` times
+
+    Throughput counts every call as one document; latency percentiles are
+    over individual calls. Peak memory is the largest traced Python
+    allocation of a single call, taken in a separate untimed pass.
+    """
+    for _ in range(warmup):
+        for call, _ in calls:
+            call()
+
+    latencies = []
+    for _ in range(repeat):
+        for call, _ in calls:
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+
+    peak = 0
+    if trace_memory:
+        for call, _ in calls:
+            tracemalloc.start()
+            try:
+                call()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+    total_time = sum(latencies) or 1e-9
+    total_bytes = sum(size for _, size in calls) * repeat
+    return {
+        'docs': len(calls),
+        'runs': len(latencies),
+        'bytes': sum(size for _, size in calls),
+        'docs_per_s': len(latencies) / total_time,
+        'mb_per_s': total_bytes / total_time / 1e6,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'peak_mb': peak / 1e6
+    }
+
+
+def size_label(size_mb: float) -> str:
+    """Short label for a synthetic size"""
+    return f"{size_mb * 1000:g}KB" if size_mb < 1 else f"{size_mb:g}MB"
+
+
+class BenchmarkSuite:
+    """Benchmarks for the parser, each rule stage, signature storage and the full pipeline"""
+
+    def __init__(self, sizes_mb: Tuple[float, ...] = DEFAULT_SIZES_MB, repeat: int = 5,
+                 formats: Tuple[str, ...] = ('text', 'html', 'docx', 'pdf'),
+                 signatures: int = DEFAULT_SIGNATURES, sample_dir: str = SAMPLE_DIR,
+                 seed: int = 0, log: Callable[[str], None] = print):
+        self.sizes_mb = sizes_mb
+        self.repeat = repeat
+        self.formats = formats
+        self.signatures = signatures
+        self.sample_dir = sample_dir
+        self.seed = seed
+        self.log = log
+        self.results = {}
+
+    def repeats_for(self, size_bytes: int) -> int:
+        """Fewer repetitions for very large inputs"""
+        return max(1, self.repeat // 5) if size_bytes > 5_000_000 else self.repeat
+
+    def record(self, name: str, calls: List[Tuple[Callable[[], Any], int]], repeat: int = None):
+        """Measure one case and keep its metrics"""
+        total = sum(size for _, size in calls)
+        metrics = measure(calls, repeat or self.repeats_for(total // max(1, len(calls))))
+        self.results[name] = metrics
+        self.log(f"{name:<45} {metrics['docs_per_s']:>9.1f} docs/s {metrics['mb_per_s']:>8.2f} MB/s "
+                 f"p50 {metrics['p50_ms']:>9.2f} ms  peak {metrics['peak_mb']:>7.1f} MB")
+
+    def run(self) -> Dict[str, Any]:
+        """Run every benchmark and return the report"""
+        from src.parsers.document_parser import DocumentParser, FORMAT_BACKENDS, is_installed
+        from src.utils.rule_processor import RuleProcessor
+
+        workdir = tempfile.mkdtemp(prefix='multidoc-bench-')
+        try:
+            parser = DocumentParser()
+            corpus = SyntheticCorpus(self.seed)
+            samples = self.sample_files()
+
+            # Inputs: the sample data grouped by format, plus synthetic files per size
+            inputs = {}
+            for path in samples:
+                extension = os.path.splitext(path)[1].lstrip('.').lower()
+                inputs.setdefault(({'txt': 'text'}.get(extension, extension), 'samples'), []).append(path)
+            for doc_format in self.formats:
+                for size_mb in self.sizes_mb:
+                    name = f"{doc_format}-{size_label(size_mb)}"
+                    path = corpus.write(workdir, doc_format, int(size_mb * 1_000_000), name)
+                    inputs[(doc_format, size_label(size_mb))] = [path]
+
+            for (doc_format, label), paths in inputs.items():
+                self.record(f"parse/{doc_format}/{label}",
+                            [(lambda p=p: parser.parse_document(p), os.path.getsize(p)) for p in paths])
+                # Every other installed backend of the format, to keep the speed ranking honest
+                for backend in FORMAT_BACKENDS.get(doc_format, []):
+                    if backend is parser.backend_for(doc_format) or not is_installed(backend.module):
+                        continue
+                    alternative = DocumentParser({doc_format: backend.name})
+                    self.record(f"parse/{doc_format}/{label}/{backend.name}",
+                                [(lambda p=p: alternative.parse_document(p), os.path.getsize(p)) for p in paths])
+
+            texts = {label: [parser.parse_document(p)[0] for p in paths]
+                     for (doc_format, label), paths in inputs.items() if doc_format == 'text'}
+            self.bench_rules(RuleProcessor(), texts)
+            self.bench_signatures(texts, workdir)
+            self.bench_pipeline({label: paths for (doc_format, label), paths in inputs.items()
+                                 if doc_format == 'text'})
+            self.bench_routing(samples)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        return {'meta': self.meta(), 'results': self.results}
+
+    def sample_files(self) -> List[str]:
+        """Documents in the sample data folder"""
+        if not os.path.isdir(self.sample_dir):
+            return []
+        return sorted(
+            os.path.join(self.sample_dir, name) for name in os.listdir(self.sample_dir)
+            if not name.lower().startswith('readme') and os.path.isfile(os.path.join(self.sample_dir, name))
+        )
+
+    def bench_rules(self, rules, texts: Dict[str, List[str]]):
+        """Each RuleProcessor stage on pre-parsed text"""
+        for label, contents in texts.items():
+            scans = [rules.scan(content) for content in contents]
+            sizes = [len(content.encode('utf-8')) for content in contents]
+            stages = {
+                'scan': lambda c, s: rules.scan(c),
+                'structure': lambda c, s: rules._extract_structure(s),
+                'contextual': lambda c, s: rules._extract_contextual(s),
+                'dynamic_metadata': lambda c, s: rules._extract_dynamic_metadata(s),
+                'basic_fields': lambda c, s: rules.extract_basic_fields(c, scan=s),
+                'apply_rules': lambda c, s: rules.apply_rules(c),
+            }
+            for stage, func in stages.items():
+                self.record(f"rules/{stage}/{label}", [
+                    (lambda c=c, s=s, f=func: f(c, s), size) for c, s, size in zip(contents, scans, sizes)
+                ])
+
+    def bench_signatures(self, texts: Dict[str, List[str]], workdir: str):
+        """Signature extraction, similarity lookups and persistence"""
+        from src.rules.signature_engine import SignatureEngine
+        from src.rules.signature_store import SQLiteSignatureStore
+
+        engine = SignatureEngine()
+        for label, contents in texts.items():
+            sizes = [len(content.encode('utf-8')) for content in contents]
+            self.record(f"signature/extract/{label}", [
+                (lambda c=c: engine.extract_signature(c, {}), size) for c, size in zip(contents, sizes)
+            ])
+            self.record(f"signature/sketch/{label}", [
+                (lambda c=c: engine.extract_sketch(c), size) for c, size in zip(contents, sizes)
+            ])
+
+        # A library of learned layouts drawn from the synthetic generator
+        corpus = SyntheticCorpus(self.seed + 1)
+        sketches = [engine.extract_sketch("\n".join(corpus.section(n))) for n in range(200)]
+        learned = [
+            (f"sig{index:08x}", f"sender{index % 50}" if index % 2 else None, {
+                'rules': {'title': f"Document {index}"},
+                'version': engine.version,
+                'learned_at': datetime.now().isoformat(),
+                'minhash': sketches[index % len(sketches)]
+            })
+            for index in range(self.signatures)
+        ]
+        step = max(1, self.signatures // 200)
+        probes = [(learned[i][0], learned[i][2]['minhash'], learned[i][1]) for i in range(0, self.signatures, step)]
+
+        stores = {'memory': engine, 'sqlite': SignatureEngine(SQLiteSignatureStore(os.path.join(workdir, 'signatures.db')))}
+        for name, target in stores.items():
+            target.store.merge(learned)
+            target.match_rules('warmup', probes[0][1], None)
+            self.record(f"signature/lookup_exact/{name}", [
+                (lambda p=p, t=target: t.match_rules(p[0], p[1], p[2]), 0) for p in probes
+            ])
+            self.record(f"signature/lookup_similar/{name}", [
+                (lambda p=p, t=target: t.match_rules('missing', p[1], p[2]), 0) for p in probes
+            ])
+            self.record(f"signature/learn/{name}", [
+                (lambda i=i, t=target: t.learn_pattern(f"new{i}", {'title': 'x'}, 'bench', sketches[i % 200]), 0)
+                for i in range(100)
+            ], repeat=1)
+        stores['sqlite'].store.close()
+
+        path = os.path.join(workdir, 'signatures.json')
+        self.record("signature/save_json", [(lambda: engine.save_signatures(path), 0)], repeat=3)
+        self.results["signature/save_json"]['bytes'] = os.path.getsize(path)
+
+    def bench_pipeline(self, inputs: Dict[str, List[str]]):
+        """End-to-end MainProcessor.process_document without AI or caching"""
+        from src.main_processor import MainProcessor
+        from src.rules.signature_engine import SignatureEngine
+
+        processor = MainProcessor(signature_engine=SignatureEngine())
+        for label, paths in inputs.items():
+            self.record(f"pipeline/process_document/{label}", [
+                (lambda p=p: processor.process_document(p), os.path.getsize(p)) for p in paths
+            ])
+
+    def bench_routing(self, paths: List[str]):
+        """Critical-path latency of each AI routing policy against FakeGenerativeModel
+
+        Answers are never cached, so every document the policy sends to AI
+        costs a model call (layouts learned from an answer skip AI on later
+        runs, as in production). Deferred calls finish in the background and
+        are waited for after the timed runs.
+        """
+        from src.ai.fake_model import FakeGenerativeModel
+        from src.ai.response_cache import ResponseCache
+        from src.ai.routing import ROUTING_POLICIES, make_policy
+        from src.main_processor import MainProcessor
+        from src.rules.signature_engine import SignatureEngine
+
+        if not paths:
+            return
+        sizes = [os.path.getsize(p) for p in paths]
+        for name in ROUTING_POLICIES:
+            model = FakeGenerativeModel(latency=SIMULATED_AI_SECONDS, response={'confidence': 0.5})
+            processor = MainProcessor(ai_model=model, signature_engine=SignatureEngine(), routing=make_policy(name))
+            processor.ai_processor.response_cache = ResponseCache(max_entries=0)
+            documents = []
+            self.record(f"routing/{name}/samples", [
+                (lambda p=p: documents.append(processor.process_document(p)), size) for p, size in zip(paths, sizes)
+            ], repeat=1)
+            for _ in processor.deferred_results(wait=True):
+                pass
+            # AI calls per processed document, and the share of documents that deferred theirs
+            self.results[f"routing/{name}/samples"].update(
+                ai_calls_per_doc=model.calls / len(documents),
+                deferred_share=sum(log.ai_deferred for _, log in documents) / len(documents)
+            )
+
+    def meta(self) -> Dict[str, Any]:
+        """Environment the numbers were taken in"""
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sizes_mb': list(self.sizes_mb),
+            'repeat': self.repeat
+        }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Regressions of a report against a baseline report
+
+    A case regresses when its median latency or peak memory grows, or its
+    throughput drops, by more than the threshold fraction.
+    """
+    regressions = []
+    for name, metrics in current.get('results', {}).items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        if metrics['p50_ms'] > base['p50_ms'] * (1 + threshold) and metrics['p50_ms'] - base['p50_ms'] > 0.01:
+            regressions.append(f"{name}: p50 {base['p50_ms']:.2f} -> {metrics['p50_ms']:.2f} ms")
+        if metrics['docs_per_s'] < base['docs_per_s'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['docs_per_s']:.1f} -> {metrics['docs_per_s']:.1f} docs/s")
+        if metrics['peak_mb'] > base['peak_mb'] * (1 + threshold) and metrics['peak_mb'] - base['peak_mb'] > 1:
+            regressions.append(f"{name}: peak memory {base['peak_mb']:.1f} -> {metrics['peak_mb']:.1f} MB")
+    return regressions
+
+
+def load_report(path: str) -> Optional[Dict[str, Any]]:
+    """Saved report, or None if the file doesn't exist"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_report(report: Dict[str, Any], path: str):
+    """Write a report as JSON"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,269 @@
+import re
+import json
+from itertools import chain, repeat
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+import numpy as np
+import pandas as pd
+from config.schema import DocumentSchema
+from src.rules.signature_engine import SignatureEngine, SIGNATURE_LINES
+
+# Documents tokenized per vectorized step; totals are folded in after each
+CHUNK_DOCUMENTS = 5000
+
+# Lines at least this long share the last line-length bucket
+LINE_LENGTH_CAP = 1000
+
+# Word tokens as the rule scanner finds them; keywords are the alphabetic ones longer than 2 characters
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# ASCII characters outside \w, blanked so that str.split() finds the tokens of ASCII text
+NON_WORD_ASCII = str.maketrans({chr(code): ' ' for code in range(128) if not (chr(code).isalnum() or chr(code) == '_')})
+
+# Columns a corpus frame needs (see documents_frame and load_results)
+CORPUS_COLUMNS = ('document_id', 'source_type', 'confidence_score', 'processing_method', 'content', 'signature')
+
+
+def documents_frame(documents: Iterable[DocumentSchema], signatures: Dict[str, str] = None) -> pd.DataFrame:
+    """Corpus frame of processed documents
+
+    signatures maps document_id to the layout signature the pipeline used
+    (ProcessingLog.signature); missing ones are computed from the content.
+    """
+    rows = [(document.document_id, document.source_type, document.confidence_score, document.processing_method,
+             document.content, (signatures or {}).get(document.document_id))
+            for document in documents if document is not None]
+    return pd.DataFrame(rows, columns=CORPUS_COLUMNS)
+
+
+def tokenize(text: str) -> List[str]:
+    """\\w+ tokens of a text (ASCII text is split without the regex engine)"""
+    if text.isascii():
+        return text.translate(NON_WORD_ASCII).split()
+    return TOKEN_PATTERN.findall(text)
+
+
+def load_results(paths: Iterable[str], chunk_documents: int = CHUNK_DOCUMENTS) -> Iterator[pd.DataFrame]:
+    """Corpus frames read from batch result files (.jsonl or .parquet), chunk by chunk
+
+    Result files carry no signature column, so CorpusStats works the
+    signatures out from the content.
+    """
+    for path in paths:
+        if path.endswith('.parquet'):
+            frame = pd.read_parquet(path, columns=list(CORPUS_COLUMNS[:-1]))
+            chunks = (frame.iloc[start:start + chunk_documents] for start in range(0, len(frame), chunk_documents))
+        else:
+            chunks = pd.read_json(path, lines=True, chunksize=chunk_documents, dtype=False)
+        for chunk in chunks:
+            if 'content' not in chunk:
+                chunk['content'] = ''
+            chunk = chunk.reindex(columns=list(CORPUS_COLUMNS))
+            chunk['content'] = chunk['content'].fillna('')
+            yield chunk.reset_index(drop=True)
+
+
+class CorpusStats:
+    """Token, keyword, line-length and per-signature statistics over many documents
+
+    Documents are added as frames (documents_frame, load_results) and
+    processed a chunk at a time: one regex pass per document finds the
+    tokens, pandas factorizes them to integer codes and NumPy does the
+    counting, so there is no per-token Python work and memory stays
+    bounded by the chunk size. Words and line lengths follow the rule scanner:
+    \\w+ tokens, keywords being the lowercased alphabetic ones longer than
+    two characters, and lengths of non-blank stripped lines.
+    A document_id seen again (a deferred AI upgrade appended to the
+    results) replaces its earlier record in the per-signature figures;
+    its text is only counted once.
+    """
+
+    def __init__(self, chunk_documents: int = CHUNK_DOCUMENTS):
+        self.chunk_documents = chunk_documents
+        self.documents = 0
+        self.words = 0
+        self.term_counts = pd.Series(dtype='int64')  # keyword -> occurrences
+        self.document_counts = pd.Series(dtype='int64')  # keyword -> documents containing it
+        self.type_terms = pd.Series(dtype='int64')  # (source_type, keyword) -> occurrences
+        self.line_lengths = np.zeros(LINE_LENGTH_CAP + 1, dtype=np.int64)  # lines per length
+        self._per_document = []  # frames of per-document figures, latest record of a document wins
+        self._seen = set()
+        self._engine = SignatureEngine()
+
+    def add_frame(self, frame: pd.DataFrame) -> 'CorpusStats':
+        """Fold a corpus frame into the totals"""
+        for start in range(0, len(frame), self.chunk_documents):
+            self._add_chunk(frame.iloc[start:start + self.chunk_documents])
+        return self
+
+    def add_documents(self, documents: Iterable[DocumentSchema], signatures: Dict[str, str] = None) -> 'CorpusStats':
+        """Fold processed documents into the totals"""
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= self.chunk_documents:
+                self._add_chunk(documents_frame(batch, signatures))
+                batch = []
+        if batch:
+            self._add_chunk(documents_frame(batch, signatures))
+        return self
+
+    def _add_chunk(self, chunk: pd.DataFrame):
+        ids = chunk['document_id'].to_numpy()
+        repeated = chunk['document_id'].isin(self._seen).to_numpy() | pd.Series(ids).duplicated().to_numpy()
+        self._seen.update(ids)
+        if repeated.any():
+            repeats = chunk[repeated]
+            self._per_document.append(self._document_figures(repeats, None, None, self._repeat_signatures(repeats)))
+            chunk = chunk[~repeated]
+        content = chunk['content'].reset_index(drop=True)
+        rows = np.arange(len(content))
+        self.documents += len(content)
+
+        # Tokens flattened with the row of their document and factorized to integer codes
+        found = list(map(tokenize, content))
+        words = np.fromiter(map(len, found), np.int64, len(found))
+        self.words += int(words.sum())
+        codes, spellings = pd.factorize(np.array(list(chain.from_iterable(found)), dtype=object))
+        spellings = pd.Index(spellings, dtype=object)
+        # Keywords and their lowercase forms are worked out once per distinct spelling
+        is_keyword = np.asarray((spellings.str.len() > 2) & spellings.str.isalpha(), dtype=bool)
+        if is_keyword.any():
+            lowered, vocabulary = pd.factorize(spellings[is_keyword].str.lower())
+            terms = np.full(len(spellings), -1)
+            terms[is_keyword] = lowered
+            codes = terms[codes]
+            keep = codes >= 0
+            codes, term_rows = codes[keep], np.repeat(rows, words)[keep]
+            size = len(vocabulary)
+            self.term_counts = self.term_counts.add(
+                pd.Series(np.bincount(codes, minlength=size), index=vocabulary), fill_value=0)
+            in_documents = np.unique(term_rows * size + codes) % size
+            self.document_counts = self.document_counts.add(
+                pd.Series(np.bincount(in_documents, minlength=size), index=vocabulary), fill_value=0)
+            type_codes, types = pd.factorize(chunk['source_type'].fillna('unknown'))
+            pairs = np.bincount(type_codes[term_rows] * size + codes, minlength=len(types) * size)
+            present = np.flatnonzero(pairs)
+            type_terms = pd.Series(pairs[present], index=pd.MultiIndex.from_arrays(
+                [types[present // size], vocabulary[present % size]], names=['source_type', 'term']))
+            self.type_terms = type_terms if self.type_terms.empty else self.type_terms.add(type_terms, fill_value=0)
+
+        # Lengths of non-blank stripped lines, split out of the chunk's text in one pass
+        lines = '\n'.join(content).split('\n')
+        lengths = np.fromiter(map(len, map(str.strip, lines)), np.int64, len(lines))
+        line_totals = np.fromiter(map(str.count, content, repeat('\n')), np.int64, len(content)) + 1
+        line_rows = np.repeat(rows, line_totals)
+        filled = lengths > 0
+        self.line_lengths += np.bincount(np.minimum(lengths[filled], LINE_LENGTH_CAP), minlength=LINE_LENGTH_CAP + 1)
+        line_counts = np.bincount(line_rows[filled], minlength=len(content))
+        signatures = self._signatures(chunk, line_rows, line_totals, filled)
+        self._per_document.append(self._document_figures(chunk, words, line_counts, signatures))
+
+    def _signatures(self, chunk: pd.DataFrame, line_rows: np.ndarray, line_totals: np.ndarray,
+                    filled: np.ndarray) -> np.ndarray:
+        """Signatures of a chunk, the missing ones taken from the flags of each document's leading lines"""
+        signatures = chunk['signature'].to_numpy(dtype=object, na_value=None)
+        missing = np.array([signature is None for signature in signatures], dtype=bool)
+        if not missing.any():
+            return signatures
+        # Each document's layout packed into an integer: a bit per leading line, then the line count
+        position = np.arange(len(line_rows)) - np.repeat(np.cumsum(line_totals) - line_totals, line_totals)
+        leading = position < SIGNATURE_LINES
+        bits = np.bincount(line_rows[leading], weights=filled[leading].astype(np.int64) << position[leading], minlength=len(line_totals))
+        layouts = bits.astype(np.int64) + (np.minimum(line_totals, SIGNATURE_LINES) << SIGNATURE_LINES)
+        distinct, inverse = np.unique(layouts[missing], return_inverse=True)
+        names = [self._engine.extract_signature_from_layout(
+            [bool(layout >> line & 1) for line in range(layout >> SIGNATURE_LINES)]) for layout in distinct.tolist()]
+        signatures[missing] = np.array(names, dtype=object)[inverse]
+        return signatures
+
+    def _repeat_signatures(self, chunk: pd.DataFrame) -> np.ndarray:
+        """Signatures of repeated records, computed per document (they are few)"""
+        return np.array([signature if isinstance(signature, str) else self._engine.extract_signature(content, {})
+                         for signature, content in zip(chunk['signature'], chunk['content'])], dtype=object)
+
+    def _document_figures(self, chunk: pd.DataFrame, words: Optional[np.ndarray], lines: Optional[np.ndarray],
+                          signatures: np.ndarray) -> pd.DataFrame:
+        """Signature, confidence, AI use and size per document (sizes None for repeated documents)"""
+        return pd.DataFrame({
+            'signature': signatures,
+            'confidence': chunk['confidence_score'].astype(float).to_numpy(),
+            'ai_assisted': (chunk['processing_method'] == 'ai_assisted').to_numpy(),
+            'words': words if words is not None else np.nan,
+            'lines': lines if lines is not None else np.nan,
+        }, index=pd.Index(chunk['document_id'].to_numpy(), name='document_id'))
+
+    def per_document(self) -> pd.DataFrame:
+        """Latest figures of every document, sizes carried over from its first record"""
+        if not self._per_document:
+            return pd.DataFrame(columns=['signature', 'confidence', 'ai_assisted', 'words', 'lines'])
+        frame = pd.concat(self._per_document)
+        sizes = frame[['words', 'lines']].groupby(level=0).first()
+        latest = frame[~frame.index.duplicated(keep='last')].drop(columns=['words', 'lines'])
+        return latest.join(sizes)
+
+    def tokens(self, top: int = 20) -> pd.DataFrame:
+        """Most frequent keywords with their document frequency and inverse document frequency"""
+        table = pd.DataFrame({'count': self.term_counts, 'documents': self.document_counts}).fillna(0)
+        table = table.astype('int64').nlargest(top, 'count')
+        table['idf'] = np.log((1 + self.documents) / (1 + table['documents'])) + 1
+        table.index.name = 'term'
+        return table
+
+    def keywords(self, top: int = 10) -> pd.DataFrame:
+        """Most frequent keywords per source type"""
+        if self.type_terms.empty:
+            return pd.DataFrame(columns=['source_type', 'term', 'count'])
+        frame = self.type_terms.astype('int64').rename('count').reset_index()
+        frame = frame.sort_values(['source_type', 'count', 'term'], ascending=[True, False, True])
+        return frame.groupby('source_type').head(top).reset_index(drop=True)
+
+    def line_length_distribution(self) -> Dict[str, Any]:
+        """Line count, mean, percentiles and histogram of non-blank line lengths"""
+        counts = self.line_lengths
+        total = int(counts.sum())
+        if not total:
+            return {'lines': 0}
+        lengths = np.arange(len(counts))
+        cumulative = np.cumsum(counts)
+        percentiles = {f"p{p}": int(np.searchsorted(cumulative, total * p / 100)) for p in (50, 90, 99)}
+        bins = [1, 20, 40, 80, 120, 200, LINE_LENGTH_CAP, LINE_LENGTH_CAP + 1]
+        histogram = np.add.reduceat(counts, bins[:-1])
+        return {
+            'lines': total,
+            'mean': float((lengths * counts).sum() / total),
+            **percentiles,
+            'histogram': {f"{low}-{high - 1}" if high <= LINE_LENGTH_CAP else f"{low}+": int(count)
+                          for low, high, count in zip(bins[:-1], bins[1:], histogram)}
+        }
+
+    def signature_summary(self, top: Optional[int] = None) -> pd.DataFrame:
+        """Per-signature document counts, mean confidence, AI share and mean size, largest first"""
+        documents = self.per_document()
+        summary = documents.groupby('signature').agg(
+            documents=('confidence', 'size'),
+            avg_confidence=('confidence', 'mean'),
+            ai_share=('ai_assisted', 'mean'),
+            avg_words=('words', 'mean'),
+            avg_lines=('lines', 'mean'),
+        ).sort_values('documents', ascending=False, kind='stable')
+        return summary.head(top) if top else summary
+
+    def report(self, top: int = 20) -> Dict[str, Any]:
+        """JSON-ready corpus report"""
+        return {
+            'documents': self.documents,
+            'words': self.words,
+            'vocabulary': int(len(self.term_counts)),
+            'tokens': self.tokens(top).reset_index().to_dict('records'),
+            'keywords': self.keywords(min(top, 10)).to_dict('records'),
+            'line_lengths': self.line_length_distribution(),
+            'signatures': self.signature_summary(top).reset_index().to_dict('records'),
+        }
+
+
+def corpus_report(paths: List[str], top: int = 20, chunk_documents: int = CHUNK_DOCUMENTS) -> Dict[str, Any]:
+    """Corpus report over batch result files"""
+    stats = CorpusStats(chunk_documents)
+    for frame in load_results(paths, chunk_documents):
+        stats.add_frame(frame)
+    return json.loads(json.dumps(stats.report(top), default=float))
@@ -0,0 +1,325 @@
+import re
+from typing import Dict, List, Any, Iterator
+from collections import defaultdict, Counter
+
+# Patterns are compiled once and shared by every scan
+TOKEN_PATTERN = re.compile(r'\w+')
+TABLE_SPLIT_PATTERN = re.compile(r'\s{2,}|\t+')
+SECTION_PATTERN = re.compile(r'^[A-Za-z0-9\s\-\/]{2,50}[:\-]$')
+KV_PATTERN = re.compile(r'([^\n:]{2,50})\s*[:\-]\s*([^\n]{1,100})')
+CODE_KV_PATTERN = re.compile(r'^([^\n]{2,40})\s+([A-Z0-9#\-\/]{3,})$', re.MULTILINE)
+CODE_VALUE_PATTERN = re.compile(r'\s*[A-Z0-9#\-\/]{3,}')
+SEPARATOR_PATTERN = re.compile(r'[:\-]')
+KEY_CLEAN_PATTERN = re.compile(r'\W+')
+DATE_PATTERN = re.compile(r'\b(?:\d{1,2}[/-])?\d{1,2}[/-]\d{2,4}|\d{1,2}\s+[A-Za-z]{3,9}\s+\d{2,4}\b')
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.?!])\s+')
+
+KV_SEPARATORS = ':-'
+CODE_CHARS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789#-/')
+
+# Tokens are summarized in bulk once this many are buffered
+TOKEN_FLUSH_SIZE = 50000
+
+# Leading lines kept for title candidates when text is not retained
+TITLE_LINES = 5
+
+# Optional passes of a scan; line counts/lengths and title lines are always kept
+SCAN_FEATURES = frozenset({'headers', 'tables', 'sections', 'key_values', 'words', 'dates', 'sentences'})
+
+
+class DocumentScanner:
+    """Single-pass tokenizer feeding every rule extractor
+
+    Lines are consumed one at a time, so the same scanner serves whole
+    documents (scan_document) and streamed text fed block by block (feed).
+    With retain_text=False the per-line copies (lines, sections, sentences)
+    are dropped so memory stays bounded on very large inputs. features
+    limits the scan to a subset of SCAN_FEATURES; fields of skipped passes
+    stay empty.
+    Key/value pairs may span a line break ("Key:" followed by the value on
+    the next line), so the unconsumed tail of the previous line is held back
+    and re-scanned together with the next line only when such a
+    continuation is possible.
+    """
+
+    def __init__(self, retain_text: bool = True, features: frozenset = SCAN_FEATURES):
+        self.retain_text = retain_text
+        self.features = frozenset(features)
+        self._key_values = 'key_values' in self.features
+        self._sentences = retain_text and 'sentences' in self.features
+        self._sections = 'sections' in self.features
+        self.lines = []
+        self.headers = []
+        self.table_rows = []
+        self.sections = defaultdict(list)
+        self.unique_words = set()
+        self.unique_numbers = set()
+        self.dates = []
+        self.sentences = []
+        self.keyword_counts = Counter()
+        self.word_count = 0
+        self.char_count = 0
+        self.line_count = 0
+        self.total_line_length = 0
+        self.max_line_length = 0
+        self.finished = False
+
+        self._tokens = []
+        self._kv_matches = []
+        self._code_matches = []
+        self._kv_pending = ''
+        self._code_pending = ''
+        self._section_count = 0
+        self._current_section = "section_0"
+        self._raw_lines = 0
+        self._partial = None
+        self._sentence_parts = []
+        self._sentence_boundary = True
+
+    def feed_line(self, raw_line: str):
+        """Scan one line of text (without its trailing newline)"""
+        self.char_count += len(raw_line) + (1 if self._raw_lines else 0)
+        self._raw_lines += 1
+
+        if self._sentences:
+            self._scan_sentences(raw_line + '\n')
+
+        line = raw_line.strip()
+        if not line:
+            # Whitespace may separate a key from its value
+            if self._key_values:
+                self._kv_pending += raw_line + '\n'
+                self._code_pending += raw_line + '\n'
+            return
+
+        if self._key_values:
+            self._scan_key_values(raw_line, line)
+
+        if self.retain_text or self.line_count < TITLE_LINES:
+            self.lines.append(line)
+        self.line_count += 1
+        self.total_line_length += len(line)
+        self.max_line_length = max(self.max_line_length, len(line))
+
+        features = self.features
+
+        # Headers: visually distinct lines (caps, punctuated, short)
+        if 'headers' in features and len(line) < 80:
+            if line.isupper() or (len(line) > 1 and line[-1] in KV_SEPARATORS):
+                self.headers.append(line)
+
+        # Tables: lines with tabular spacing or 3+ data chunks
+        if 'tables' in features and TABLE_SPLIT_PATTERN.search(line):
+            tokens = TABLE_SPLIT_PATTERN.split(line)
+            if len(tokens) >= 3 and all(TOKEN_PATTERN.search(t) for t in tokens):
+                self.table_rows.append(tokens)
+
+        # Sections: split into logical blocks by header-like lines
+        if self._sections:
+            if line[-1] in KV_SEPARATORS and SECTION_PATTERN.match(line):
+                self._section_count += 1
+                self._current_section = f"section_{self._section_count}"
+            elif self.retain_text:
+                self.sections[self._current_section].append(line)
+
+        if 'words' in features:
+            self._tokens.extend(TOKEN_PATTERN.findall(line))
+            if len(self._tokens) >= TOKEN_FLUSH_SIZE:
+                self._flush_tokens()
+
+        if 'dates' in features:
+            self.dates.extend(DATE_PATTERN.findall(line))
+
+    def feed(self, text: str):
+        """Scan a block of streamed text that may end mid-line"""
+        lines = ((self._partial or '') + text).split('\n')
+        self._partial = lines.pop()
+        for raw_line in lines:
+            self.feed_line(raw_line)
+
+    def checkpoint(self) -> tuple:
+        """Marker for added_since, taken before feeding more text"""
+        return len(self.headers), len(self.table_rows), len(self.dates), len(self._kv_matches), len(self._code_matches)
+
+    def added_since(self, checkpoint: tuple) -> Dict[str, Any]:
+        """Fields found since a checkpoint (pairs still awaiting a following line are not included)"""
+        headers, table_rows, dates, kv_matches, code_matches = checkpoint
+        return {
+            'headers': self.headers[headers:],
+            'table_rows': self.table_rows[table_rows:],
+            'dates': self.dates[dates:],
+            'key_value_pairs': self._normalize_pairs(self._kv_matches[kv_matches:] + self._code_matches[code_matches:])
+        }
+
+    def _scan_key_values(self, raw_line: str, line: str):
+        """Collect colon/dash pairs and trailing-code pairs up to this line
+
+        Matching for the pending text is settled once a line arrives that
+        cannot continue it, since either pattern may span line breaks.
+        """
+        # Colon/dash pairs continue when the pending tail ends in a separator
+        # or this line starts with one; a line that itself ends in a
+        # separator keeps the match open until its value shows up
+        pending = self._kv_pending
+        if line[0] in KV_SEPARATORS or pending.rstrip().endswith((':', '-')):
+            if line[-1] in KV_SEPARATORS:
+                self._kv_pending = pending + raw_line + '\n'
+                return self._scan_code_values(raw_line)
+            window = pending + raw_line
+            cut = len(pending)
+            resume = cut
+            for match in self._iter_key_values(window):
+                if match.start() >= cut:
+                    break
+                self._kv_matches.append((match.group(1), match.group(2)))
+                resume = max(resume, match.end())
+            self._kv_pending = window[resume:] + '\n'
+        else:
+            self._flush_kv_pending()
+            self._kv_pending = raw_line + '\n'
+        self._scan_code_values(raw_line)
+
+    def _scan_code_values(self, raw_line: str):
+        """Trailing-code pairs: the label may sit on a line above the code"""
+        pending = self._code_pending
+        if pending and CODE_VALUE_PATTERN.fullmatch(raw_line):
+            window = pending + raw_line
+            cut = len(pending)
+            consumed = False
+            for match in CODE_KV_PATTERN.finditer(window):
+                if match.start() >= cut:
+                    break
+                self._code_matches.append((match.group(1), match.group(2)))
+                consumed = match.end() > cut
+            self._code_pending = '' if consumed else raw_line + '\n'
+        else:
+            self._flush_code_pending()
+            self._code_pending = raw_line + '\n'
+
+    def _iter_key_values(self, text: str):
+        """Same matches as KV_PATTERN.finditer, trying only viable offsets
+
+        A key holds at most 50 characters before optional whitespace and the
+        separator, so a match can only start within that reach of some
+        separator; long runs of prose in between are never attempted.
+        """
+        pos = 0
+        tried = 0
+        while True:
+            for separator in SEPARATOR_PATTERN.finditer(text, pos):
+                key_end = separator.start()
+                while key_end > tried and text[key_end - 1].isspace():
+                    key_end -= 1
+                match = None
+                for start in range(max(tried, key_end - 50), separator.start() - 1):
+                    match = KV_PATTERN.match(text, start)
+                    if match:
+                        break
+                if match:
+                    yield match
+                    pos = tried = match.end()
+                    break
+                tried = max(tried, separator.start() - 1)
+            else:
+                return
+
+    def _flush_kv_pending(self):
+        """Match the pending tail on its own"""
+        for match in self._iter_key_values(self._kv_pending):
+            self._kv_matches.append((match.group(1), match.group(2)))
+        self._kv_pending = ''
+
+    def _flush_code_pending(self):
+        """Match the pending label lines on their own"""
+        pending = self._code_pending
+        if pending.rstrip()[-1:] in CODE_CHARS:
+            for match in CODE_KV_PATTERN.finditer(pending):
+                self._code_matches.append((match.group(1), match.group(2)))
+        self._code_pending = ''
+
+    def _scan_sentences(self, text: str):
+        """Basic sentence splitter that works across fed lines"""
+        if self._sentence_boundary:
+            text = text.lstrip()
+            if not text:
+                return
+            self._sentence_boundary = False
+
+        parts = SENTENCE_SPLIT_PATTERN.split(text)
+        self._sentence_parts.append(parts[0])
+        if len(parts) > 1:
+            self.sentences.append(''.join(self._sentence_parts))
+            self.sentences.extend(parts[1:-1])
+            self._sentence_parts = [parts[-1]]
+            self._sentence_boundary = parts[-1] == ''
+
+    def _flush_tokens(self):
+        """Fold buffered word tokens into counts and vocabularies"""
+        tokens = self._tokens
+        self._tokens = []
+        self.word_count += len(tokens)
+
+        words = [word for word in tokens if len(word) > 2 and word.isalpha()]
+        self.keyword_counts.update(map(str.lower, words))
+        self.unique_words.update(word for word in set(words) if word.isascii())
+        self.unique_numbers.update(word for word in set(tokens) if word.isdecimal())
+
+    def finish(self) -> 'DocumentScanner':
+        """Flush pending state once the last line has been fed"""
+        if self.finished:
+            return self
+        if self._partial is not None:
+            self.feed_line(self._partial)
+            self._partial = None
+        self._flush_tokens()
+        tail = ''.join(self._sentence_parts).rstrip()
+        if self._sentences and (tail or not self.sentences):
+            self.sentences.append(tail)
+        self._sentence_parts = []
+        self._flush_kv_pending()
+        self._flush_code_pending()
+        self.finished = True
+        return self
+
+    @property
+    def key_value_pairs(self) -> Dict[str, str]:
+        """Normalized key/value pairs, trailing-code pairs taking precedence"""
+        return self._normalize_pairs(self._kv_matches + self._code_matches)
+
+    def _normalize_pairs(self, matches: List[tuple]) -> Dict[str, str]:
+        """Clean raw (key, value) matches into a dict"""
+        kv_pairs = {}
+        for key, value in matches:
+            value = value.strip()
+            if value:
+                kv_pairs[KEY_CLEAN_PATTERN.sub('_', key.strip().lower())] = value
+        return kv_pairs
+
+    @property
+    def title_candidates(self) -> List[str]:
+        """Short, prominent lines at the top"""
+        return [
+            line for line in self.lines[:5]
+            if len(line) > 5 and (line.isupper() or len(line.split()) <= 6)
+        ]
+
+
+def iter_lines(content: str) -> Iterator[str]:
+    """The lines of content.split('\\n'), sliced out one at a time instead of all at once"""
+    find = content.find
+    start = 0
+    while True:
+        end = find('\n', start)
+        if end < 0:
+            yield content[start:]
+            return
+        yield content[start:end]
+        start = end + 1
+
+
+def scan_document(content: str, features: frozenset = SCAN_FEATURES) -> DocumentScanner:
+    """Tokenize a whole document in one traversal"""
+    scanner = DocumentScanner(features=features)
+    for raw_line in iter_lines(content):
+        scanner.feed_line(raw_line)
+    return scanner.finish()
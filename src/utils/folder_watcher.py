@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import threading
+from typing import List, Iterable, Callable, Tuple
+from src.main_processor import MainProcessor, BATCH_QUEUE_FACTOR
+from src.utils.output_writer import JsonlWriter
+
+# Seconds between folder scans when there is no backlog
+POLL_INTERVAL = 2.0
+
+# Seconds a file must go unmodified before it is picked up (skips files still being written)
+SETTLE_SECONDS = 1.0
+
+# Seconds between throughput reports
+REPORT_INTERVAL = 30.0
+
+# Names never picked up: hidden files and in-progress uploads
+IGNORED_SUFFIXES = ('.tmp', '.part', '.partial', '.crdownload')
+
+
+class Checkpoint:
+    """Append-only ledger of processed files
+
+    Files are keyed by path, size and modification time, so a file that
+    is replaced is processed again. Each record is synced to disk as it is
+    written; a restart loads the ledger and skips everything in it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}  # key -> record
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line from a crash
+                    self.entries[record['key']] = record
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def file_key(file_path: str, stat: os.stat_result) -> str:
+        """Identity of one version of a file"""
+        return f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def record(self, key: str, file_path: str, status: str, document_id: str = None):
+        """Mark a file version as processed"""
+        record = {'key': key, 'path': file_path, 'status': status, 'document_id': document_id,
+                  'processed_at': time.time()}
+        self.entries[key] = record
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class Throughput:
+    """Running document and byte rates"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.documents = 0
+        self.failed = 0
+        self.input_bytes = 0
+
+    def add(self, log, failed: bool):
+        self.documents += 1
+        self.failed += int(failed)
+        self.input_bytes += log.input_bytes
+
+    def summary(self, backlog: int = None) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        text = (f"{self.documents} documents ({self.failed} failed) in {elapsed:.1f}s: "
+                f"{self.documents / elapsed:.2f} docs/s, {self.input_bytes / elapsed / 1e6:.2f} MB/s")
+        if backlog is not None:
+            text += f", backlog {backlog}"
+        return text
+
+
+class FolderWatcher:
+    """Long-running ingestion of documents dropped into a folder
+
+    Each poll picks up settled files not in the checkpoint and processes at
+    most workers * BATCH_QUEUE_FACTOR of them on a pool that stays up for
+    the watcher's lifetime. The rest wait for the next round, which starts
+    immediately while there is a backlog. Each result is appended to the
+    JSON Lines output before its file is checkpointed, so a crash can
+    repeat at most the documents in flight but never loses one. Documents
+    whose AI fallback the routing policy deferred are appended again (same
+    document_id) once the background call finishes.
+    """
+
+    def __init__(self, processor: MainProcessor, folder: str, output_path: str, checkpoint_path: str = None,
+                 workers: int = None, sender: str = None, fields: Iterable[str] = None,
+                 poll_interval: float = POLL_INTERVAL, settle_seconds: float = SETTLE_SECONDS,
+                 report_interval: float = REPORT_INTERVAL, report: Callable[[str], None] = print):
+        self.processor = processor
+        self.folder = folder
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or output_path + '.checkpoint'
+        self.workers = workers or os.cpu_count() or 1
+        self.sender = sender
+        self.fields = fields
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.report_interval = report_interval
+        self.report = report
+        self.throughput = Throughput()
+        self.backlog = 0
+        self._stop = threading.Event()
+        self._own_files = {os.path.abspath(path) for path in (self.output_path, self.checkpoint_path)}
+
+    def stop(self):
+        """Finish the documents in flight, then return from run()"""
+        self._stop.set()
+
+    def pending_files(self, checkpoint: Checkpoint) -> List[Tuple[str, str]]:
+        """Settled files not yet processed, oldest first, as (path, checkpoint key)"""
+        now = time.time()
+        found = []
+        for root, dirs, names in os.walk(self.folder):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in names:
+                if name.startswith('.') or name.endswith(IGNORED_SUFFIXES):
+                    continue
+                file_path = os.path.join(root, name)
+                if os.path.abspath(file_path) in self._own_files:
+                    continue
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime < self.settle_seconds:
+                    continue
+                key = Checkpoint.file_key(file_path, stat)
+                if key not in checkpoint:
+                    found.append((stat.st_mtime, file_path, key))
+        found.sort()
+        return [(file_path, key) for _, file_path, key in found]
+
+    def run_once(self, checkpoint: Checkpoint, writer: JsonlWriter, pool=None) -> int:
+        """Process one bounded round of pending files; returns how many were handled"""
+        pending = self.pending_files(checkpoint)
+        batch = pending[:self.workers * BATCH_QUEUE_FACTOR]
+        self.backlog = len(pending) - len(batch)
+        keys = dict(batch)
+        results = self.processor.process_batch(list(keys), self.sender, self.workers, pool=pool)
+        for file_path, document, log in results:
+            if document is not None:
+                writer.write(document)
+                writer.flush()
+            checkpoint.record(keys[file_path], file_path, 'ok' if document else 'failed',
+                              document.document_id if document else None)
+            self.throughput.add(log, failed=document is None)
+            if document is None:
+                self.report(f"[ERROR] {file_path}: {'; '.join(log.warnings)}")
+        self.write_deferred(writer)
+        return len(batch)
+
+    def write_deferred(self, writer: JsonlWriter, wait: bool = False):
+        """Append documents upgraded by deferred AI fallbacks (with wait, all outstanding ones)"""
+        upgraded = False
+        for document, _ in self.processor.deferred_results(wait):
+            writer.write(document)
+            upgraded = True
+        if upgraded:
+            writer.flush()
+
+    def run(self, once: bool = False) -> Throughput:
+        """Watch until stop() (with once=True, until the folder has been drained once)"""
+        checkpoint = Checkpoint(self.checkpoint_path)
+        writer = JsonlWriter(self.output_path, self.fields, append=True)
+        pool = self.processor.batch_pool(self.workers) if self.workers > 1 else None
+        last_report = time.perf_counter()
+        reported = 0
+        self.report(f"[OK] Watching {self.folder} ({len(checkpoint.entries)} files already processed)")
+        try:
+            while not self._stop.is_set():
+                handled = self.run_once(checkpoint, writer, pool)
+                if handled and not self.processor.signature_engine.store.persistent:
+                    self.processor.save_signatures()
+                if time.perf_counter() - last_report >= self.report_interval and self.throughput.documents > reported:
+                    self.report(f"[OK] {self.throughput.summary(self.backlog)}")
+                    last_report = time.perf_counter()
+                    reported = self.throughput.documents
+                if self.backlog:
+                    continue
+                if once:
+                    break
+                self._stop.wait(self.poll_interval)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+            self.write_deferred(writer, wait=True)
+            writer.close()
+            checkpoint.close()
+            self.report(f"[OK] {self.throughput.summary()}")
+        return self.throughput
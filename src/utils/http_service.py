@@ -0,0 +1,242 @@
+import io
+import os
+import json
+import time
+import uuid
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Iterable, Iterator, Tuple, Union
+from urllib.parse import urlparse, parse_qs
+from src.main_processor import MainProcessor
+from src.parsers.document_parser import as_source
+from src.utils.output_writer import compact_document
+
+# Largest request body accepted (uploads are parsed from memory)
+MAX_REQUEST_BYTES = 256 * 1024 * 1024
+
+# Requests processed at once; further ones are refused with 503 instead of queueing
+MAX_ACTIVE_REQUESTS = 16
+
+
+class ServiceError(Exception):
+    """Request problem reported to the client with an HTTP status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ExtractionService:
+    """One warm MainProcessor and worker pool shared by every request
+
+    Signatures are loaded once, learned patterns from any request are
+    visible to later ones, and documents of concurrent requests share the
+    same worker processes. With more than one worker the processor needs a
+    persistent (SQLite) signature store: long-lived workers read patterns
+    from it as they are learned, where a JSON snapshot would stay as it was
+    at startup. Requests beyond max_active_requests are refused
+    so a burst cannot queue unbounded work. The routing budget is one
+    service-wide batch, so concurrent requests never reset each other's
+    spend: max_cost caps AI spend since startup and max_seconds counts from
+    startup.
+    """
+
+    def __init__(self, processor: MainProcessor, workers: int = None, allowed_roots: Iterable[str] = (),
+                 max_active_requests: int = MAX_ACTIVE_REQUESTS):
+        self.processor = processor
+        self.workers = workers or os.cpu_count() or 1
+        if self.workers > 1 and not processor.signature_engine.store.persistent:
+            raise ValueError("A service with worker processes needs a SQLite signature store (signature_db)")
+        processor.parser.preload()
+        self.pool = processor.batch_pool(self.workers) if self.workers > 1 else None
+        # Server-side paths may only be read below these folders (none: uploads only)
+        self.allowed_roots = tuple(os.path.realpath(root) for root in allowed_roots)
+        self._slots = threading.BoundedSemaphore(max_active_requests)
+        # Every request runs in this batch, so none of them resets the routing budget
+        self.batch = (str(uuid.uuid4()), time.time())
+        processor.routing.start_batch(*self.batch)
+
+    def acquire(self) -> bool:
+        """Reserve a request slot without waiting"""
+        return self._slots.acquire(blocking=False)
+
+    def release(self):
+        self._slots.release()
+
+    def check_paths(self, paths: List[str]) -> List[str]:
+        """Resolved request paths, all inside an allowed root"""
+        resolved = []
+        for path in paths:
+            real = os.path.realpath(path)
+            if not any(real == root or real.startswith(root + os.sep) for root in self.allowed_roots):
+                raise ServiceError(403, f"Path not allowed: {path}")
+            if not os.path.isfile(real):
+                raise ServiceError(404, f"File not found: {path}")
+            resolved.append(real)
+        return resolved
+
+    def extract(self, sources: List[Union[str, io.BytesIO]],
+                sender: str = None) -> Iterator[Tuple[Union[str, io.BytesIO], Dict[str, Any]]]:
+        """(source, result record) for each document (path or upload) as it finishes"""
+        for source, document, log in self.processor.process_batch(sources, sender, self.workers, pool=self.pool,
+                                                                  batch=self.batch):
+            record = {
+                'status': 'ok' if document is not None else 'failed',
+                'document': compact_document(document, self.processor.fields) if document is not None else None,
+                'log': log.model_dump(mode='json', exclude={'profile'})
+            }
+            yield source, record
+        # Deferred AI upgrades have no client to go to; their results live on in
+        # the response cache and artifact store, so drop them to bound memory
+        for _ in self.processor.deferred_results():
+            pass
+        if not self.processor.signature_engine.store.persistent:
+            self.processor.save_signatures()
+
+    def parse(self, source: Union[str, io.BytesIO]) -> Dict[str, Any]:
+        """Parsed text and metadata without extraction"""
+        content, metadata, doc_type = self.processor.parser.parse_document(source)
+        return {'source_type': doc_type, 'metadata': metadata, 'content': content}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def read_uploads(content_type: str, body: bytes) -> Tuple[List[Tuple[str, bytes]], Dict[str, str]]:
+    """Files and plain fields of a multipart/form-data body"""
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body
+    )
+    if not message.is_multipart():
+        raise ServiceError(400, "Expected a multipart/form-data body")
+    files = []
+    fields = {}
+    for part in message.iter_parts():
+        payload = part.get_payload(decode=True) or b''
+        filename = part.get_filename()
+        if filename:
+            files.append((os.path.basename(filename.replace('\\', '/')), payload))
+        else:
+            fields[part.get_param('name', header='content-disposition')] = payload.decode('utf-8', 'replace')
+    return files, fields
+
+
+def upload_sources(files: List[Tuple[str, bytes]]) -> Dict[io.BytesIO, str]:
+    """In-memory sources of uploads, named for format detection; returns source -> upload name"""
+    return {as_source(payload, filename): filename for filename, payload in files}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP front end of an ExtractionService
+
+    GET  /health              liveness
+    GET  /metrics             Prometheus metrics (when the processor has a registry)
+    POST /extract[?sender=]   multipart uploads or {"paths": [...], "sender": ...};
+                              streams one JSON line per document as it finishes
+    POST /parse               same inputs; returns parsed text and metadata
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MultiDoc'
+
+    @property
+    def service(self) -> ExtractionService:
+        return self.server.service
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok', 'workers': self.service.workers})
+        elif path == '/metrics' and self.service.processor.metrics:
+            body = self.service.processor.metrics.to_prometheus().encode()
+            self._send(200, body, 'text/plain; version=0.0.4')
+        else:
+            self._send_json(404, {'error': f"Not found: {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path not in ('/extract', '/parse'):
+            self._send_json(404, {'error': f"Not found: {url.path}"})
+            return
+        if not self.service.acquire():
+            self._send_json(503, {'error': "Too many requests in progress"})
+            return
+        try:
+            body = self._read_body()
+            sender = parse_qs(url.query).get('sender', [None])[0]
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('multipart/form-data'):
+                files, fields = read_uploads(content_type, body)
+                names = upload_sources(files)
+                sender = sender or fields.get('sender') or None
+            else:
+                try:
+                    request = json.loads(body or b'{}')
+                except ValueError:
+                    raise ServiceError(400, "Body must be JSON or multipart/form-data")
+                paths = request.get('paths') or []
+                names = {path: original for path, original in zip(self.service.check_paths(paths), paths)}
+                sender = sender or request.get('sender')
+            if not names:
+                raise ServiceError(400, "No documents in request")
+
+            if url.path == '/parse':
+                results = [dict(self.service.parse(source), file=name) for source, name in names.items()]
+                self._send_json(200, {'documents': results})
+            else:
+                self._stream_results(names, sender)
+        except ServiceError as e:
+            self._send_json(e.status, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+        finally:
+            self.service.release()
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_BYTES:
+            self.close_connection = True
+            raise ServiceError(413, f"Request body over {MAX_REQUEST_BYTES} bytes")
+        return self.rfile.read(length)
+
+    def _stream_results(self, names: Dict[Union[str, io.BytesIO], str], sender: str):
+        """Chunked JSON Lines, one line per document in completion order"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._headers_sent = True
+        for source, record in self.service.extract(list(names), sender):
+            line = json.dumps({'file': names[source], **record}, separators=(',', ':'),
+                              ensure_ascii=False, default=str).encode() + b'\n'
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _send_json(self, status: int, data: Dict[str, Any]):
+        if getattr(self, '_headers_sent', False):
+            # Mid-stream failure: the status is already sent, so end the connection
+            self.close_connection = True
+            return
+        self._send(status, json.dumps(data, default=str).encode(), 'application/json')
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        pass  # Request logging goes through the processor's metrics instead
+
+
+def make_server(service: ExtractionService, host: str = '127.0.0.1', port: int = 8000) -> ThreadingHTTPServer:
+    """Threaded HTTP server bound to a service"""
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
@@ -0,0 +1,203 @@
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+# Functions kept from a per-document cProfile capture
+PROFILE_TOP_FUNCTIONS = 15
+
+METRIC_PREFIX = 'multidoc'
+
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str):
+    """Add the wall time of a block to timings[stage] (no-op when timings is None)"""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def profiled(result: Dict[str, Any]):
+    """Capture a cProfile summary and tracemalloc peak for a block into result"""
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        if not tracing:
+            tracemalloc.stop()
+        result['top_functions'] = top_functions(profiler)
+
+
+def top_functions(profiler: cProfile.Profile, limit: int = PROFILE_TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+    """Most expensive functions of a profile by cumulative time"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f"{filename}:{line}({name})",
+            'calls': calls,
+            'total_time': total,
+            'cumulative_time': cumulative
+        })
+    rows.sort(key=lambda row: row['cumulative_time'], reverse=True)
+    return rows[:limit]
+
+
+class MetricsRegistry:
+    """Aggregates ProcessingLog instrumentation across documents
+
+    observe() folds each finished log into counters and a per-stage latency
+    histogram, exported with to_prometheus() (text exposition format, e.g.
+    for a node-exporter textfile collector). With jsonl_path set, every
+    observed log is also appended there as one JSON line.
+    """
+
+    def __init__(self, jsonl_path: str = None):
+        self.jsonl_path = jsonl_path
+        self.documents = {'ok': 0, 'failed': 0}
+        self.cache_hits = 0
+        self.ai_calls = 0
+        self.input_bytes = 0
+        self.content_chars = 0
+        self.cost = 0.0
+        self.ai_prompt_tokens = 0
+        self.ai_output_tokens = 0
+        self.ai_cache_hits = 0
+        self.routing_decisions = {}  # (policy, action) -> documents
+        self.deferred = {'ok': 0, 'failed': 0}  # deferred AI fallbacks finished in the background
+        self.stage_counts = {}
+        self.stage_sums = {}
+        self.stage_buckets = {}  # stage -> count per STAGE_BUCKETS bound
+        self._lock = threading.Lock()
+
+    def observe(self, log, failed: bool = False):
+        """Record one finished document's log"""
+        with self._lock:
+            self.documents['failed' if failed else 'ok'] += 1
+            self.cache_hits += int(log.cache_hit)
+            self.ai_calls += int(log.ai_usage)
+            self.input_bytes += log.input_bytes
+            self.content_chars += log.content_chars
+            self.cost += log.cost_estimate
+            self.ai_prompt_tokens += log.ai_prompt_tokens
+            self.ai_output_tokens += log.ai_output_tokens
+            self.ai_cache_hits += int(log.ai_cache_hit)
+            if log.routing_action:
+                decision = (log.routing_policy, log.routing_action)
+                self.routing_decisions[decision] = self.routing_decisions.get(decision, 0) + 1
+            for stage, seconds in log.stage_timings.items():
+                self.stage_counts[stage] = self.stage_counts.get(stage, 0) + 1
+                self.stage_sums[stage] = self.stage_sums.get(stage, 0.0) + seconds
+                buckets = self.stage_buckets.setdefault(stage, [0] * len(STAGE_BUCKETS))
+                for index, bound in enumerate(STAGE_BUCKETS):
+                    if seconds <= bound:
+                        buckets[index] += 1
+
+            if self.jsonl_path:
+                record = {
+                    'document_id': log.document_id,
+                    'failed': failed,
+                    'processing_time': log.processing_time,
+                    'stage_timings': log.stage_timings,
+                    'input_bytes': log.input_bytes,
+                    'content_chars': log.content_chars,
+                    'cache_hit': log.cache_hit,
+                    'ai_usage': log.ai_usage,
+                    'cost_estimate': log.cost_estimate,
+                    'ai_prompt_tokens': log.ai_prompt_tokens,
+                    'ai_output_tokens': log.ai_output_tokens,
+                    'ai_cache_hit': log.ai_cache_hit,
+                    'routing_policy': log.routing_policy,
+                    'routing_action': log.routing_action
+                }
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + '\n')
+
+    def observe_deferred(self, log, failed: bool = False):
+        """Record a deferred AI fallback finished in the background
+
+        Its AI usage, cost and tokens count like any other call; the
+        document itself was already counted when its rule-only version
+        was observed.
+        """
+        with self._lock:
+            self.deferred['failed' if failed else 'ok'] += 1
+            self.ai_calls += int(log.ai_usage)
+            self.cost += log.cost_estimate
+            self.ai_prompt_tokens += log.ai_prompt_tokens
+            self.ai_output_tokens += log.ai_output_tokens
+            self.ai_cache_hits += int(log.ai_cache_hit)
+
+    def to_prometheus(self) -> str:
+        """Aggregates in the Prometheus text exposition format"""
+        p = METRIC_PREFIX
+        with self._lock:
+            lines = [
+                f"# HELP {p}_documents_total Documents processed, by outcome",
+                f"# TYPE {p}_documents_total counter",
+            ]
+            lines += [f'{p}_documents_total{{status="{status}"}} {count}' for status, count in self.documents.items()]
+            for name, value, help_text in (
+                ('cache_hits_total', self.cache_hits, 'Documents served from the result cache'),
+                ('ai_calls_total', self.ai_calls, 'Documents that used the AI fallback'),
+                ('input_bytes_total', self.input_bytes, 'Bytes of input files read'),
+                ('content_chars_total', self.content_chars, 'Characters of parsed content'),
+                ('ai_cost_total', self.cost, 'Estimated AI cost'),
+                ('ai_prompt_tokens_total', self.ai_prompt_tokens, 'Prompt tokens sent to the AI fallback'),
+                ('ai_output_tokens_total', self.ai_output_tokens, 'Response tokens from the AI fallback'),
+                ('ai_cache_hits_total', self.ai_cache_hits, 'AI answers reused from the response cache'),
+            ):
+                lines += [f"# HELP {p}_{name} {help_text}", f"# TYPE {p}_{name} counter", f"{p}_{name} {value}"]
+
+            lines += [
+                f"# HELP {p}_routing_decisions_total Documents per AI routing policy and action",
+                f"# TYPE {p}_routing_decisions_total counter",
+            ]
+            lines += [f'{p}_routing_decisions_total{{policy="{policy}",action="{action}"}} {count}'
+                      for (policy, action), count in sorted(self.routing_decisions.items())]
+            lines += [
+                f"# HELP {p}_deferred_ai_total Deferred AI fallbacks finished in the background, by outcome",
+                f"# TYPE {p}_deferred_ai_total counter",
+            ]
+            lines += [f'{p}_deferred_ai_total{{status="{status}"}} {count}' for status, count in self.deferred.items()]
+
+            lines += [
+                f"# HELP {p}_stage_seconds Time spent per pipeline stage",
+                f"# TYPE {p}_stage_seconds histogram",
+            ]
+            for stage in sorted(self.stage_counts):
+                for bound, count in zip(STAGE_BUCKETS, self.stage_buckets[stage]):
+                    lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {self.stage_counts[stage]}')
+                lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {self.stage_sums[stage]}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {self.stage_counts[stage]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write the Prometheus export atomically (textfile collector friendly)"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, path)
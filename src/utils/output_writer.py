@@ -0,0 +1,258 @@
+import os
+import json
+from typing import Dict, List, Any, Iterable, Optional
+from config.schema import DocumentSchema
+
+try:
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Extracted text lists stored as [start, end] offsets into the content
+# (dotted paths reach into nested dicts; every list under 'sections' qualifies)
+SPAN_FIELDS = ('headers', 'sentences', 'metadata.title_candidates')
+SPAN_GROUPS = ('sections',)
+
+# Documents buffered per Parquet row group
+PARQUET_ROW_GROUP = 1000
+
+DOCUMENT_COLUMNS = ('document_id', 'title', 'source_type', 'processed_at', 'confidence_score', 'processing_method')
+
+
+def locate_spans(content: str, items: List[Any], start: int = 0) -> Optional[List[List[int]]]:
+    """Offsets of each string in content, searched in order from start (None if any is missing)"""
+    spans = []
+    cursor = start
+    for item in items:
+        if not isinstance(item, str):
+            return None
+        offset = content.find(item, cursor)
+        if offset < 0:
+            offset = content.find(item)
+            if offset < 0:
+                return None
+        spans.append([offset, offset + len(item)])
+        cursor = offset + len(item)
+    return spans
+
+
+def project_fields(extracted_fields: Dict[str, Any], fields: Iterable[str] = None) -> Dict[str, Any]:
+    """Keep only the named fields (top-level keys or keys of 'metadata')"""
+    if fields is None:
+        return dict(extracted_fields)
+    metadata = extracted_fields.get('metadata')
+    projected = {}
+    for name in fields:
+        if name in extracted_fields:
+            projected[name] = extracted_fields[name]
+        elif isinstance(metadata, dict) and name in metadata:
+            projected.setdefault('metadata', {})[name] = metadata[name]
+    return projected
+
+
+def _get_path(data: Dict[str, Any], path: str) -> Any:
+    for key in path.split('.'):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def _pop_path(data: Dict[str, Any], path: str):
+    keys = path.split('.')
+    for key in keys[:-1]:
+        data = data[key]
+    del data[keys[-1]]
+
+
+def _set_path(data: Dict[str, Any], path: str, value: Any):
+    keys = path.split('.')
+    for key in keys[:-1]:
+        data = data.setdefault(key, {})
+    data[keys[-1]] = value
+
+
+def compact_document(document: DocumentSchema, fields: Iterable[str] = None,
+                     include_content: bool = True) -> Dict[str, Any]:
+    """Compact JSON-ready record of a document
+
+    The content is stored once. Text lists found in it (headers, sentences,
+    section lines, title candidates) become [start, end] offsets under
+    'spans'. Other fields stay under 'fields', optionally limited to the
+    named ones. Without the content, nothing is converted to offsets.
+    """
+    record = {column: getattr(document, column) for column in DOCUMENT_COLUMNS}
+    record['processed_at'] = document.processed_at.isoformat()
+    record['metadata'] = document.metadata
+
+    extracted = project_fields(document.extracted_fields, fields)
+    if 'metadata' in extracted:
+        extracted['metadata'] = dict(extracted['metadata'])
+    spans = {}
+    if include_content:
+        record['content'] = document.content
+        for path in SPAN_FIELDS:
+            items = _get_path(extracted, path)
+            if isinstance(items, list):
+                located = locate_spans(document.content, items)
+                if located is not None:
+                    spans[path] = located
+                    _pop_path(extracted, path)
+        for group in SPAN_GROUPS:
+            if not isinstance(extracted.get(group), dict):
+                continue
+            # Group members follow each other in the text, so each search resumes where the last ended
+            members = extracted[group] = dict(extracted[group])
+            cursor = 0
+            for name, items in list(members.items()):
+                located = locate_spans(document.content, items, cursor) if isinstance(items, list) else None
+                if located is not None:
+                    spans[f"{group}.{name}"] = located
+                    del members[name]
+                    cursor = located[-1][1] if located else cursor
+    record['fields'] = extracted
+    record['spans'] = spans
+    return record
+
+
+def expand_document(record: Dict[str, Any]) -> DocumentSchema:
+    """Rebuild a DocumentSchema from a compact_document record"""
+    content = record.get('content', '')
+    extracted = json.loads(json.dumps(record.get('fields', {})))
+    for path, spans in record.get('spans', {}).items():
+        _set_path(extracted, path, [content[start:end] for start, end in spans])
+    return DocumentSchema(
+        content=content,
+        metadata=record.get('metadata', {}),
+        extracted_fields=extracted,
+        **{column: record.get(column) for column in DOCUMENT_COLUMNS}
+    )
+
+
+def dumps_compact(document: DocumentSchema, fields: Iterable[str] = None, include_content: bool = True) -> str:
+    """One compact record as a single JSON line"""
+    return json.dumps(compact_document(document, fields, include_content), separators=(',', ':'),
+                      ensure_ascii=False, default=str)
+
+
+class JsonlWriter:
+    """Streams documents to a JSON Lines file, one record per line
+
+    compact=False writes the full model_dump instead of compact records;
+    append=True adds to an existing file instead of replacing it.
+    """
+
+    def __init__(self, path: str, fields: Iterable[str] = None, include_content: bool = True,
+                 compact: bool = True, append: bool = False):
+        self.path = path
+        self.fields = tuple(fields) if fields is not None else None
+        self.include_content = include_content
+        self.compact = compact
+        self.count = 0
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, document: DocumentSchema):
+        """Append one document"""
+        if self.compact:
+            line = dumps_compact(document, self.fields, self.include_content)
+        else:
+            data = document.model_dump(mode='json')
+            data['extracted_fields'] = project_fields(data['extracted_fields'], self.fields)
+            if not self.include_content:
+                del data['content']
+            line = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+        self._file.write(line + '\n')
+        self.count += 1
+
+    def flush(self):
+        """Make written records durable"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetWriter:
+    """Streams compact records to a Parquet file in row groups
+
+    Document columns are typed; metadata, fields and spans are JSON strings
+    since their keys vary per document. Requires pyarrow.
+    """
+
+    def __init__(self, path: str, fields: Iterable[str] = None, include_content: bool = True,
+                 row_group_size: int = PARQUET_ROW_GROUP):
+        if pa is None:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.fields = tuple(fields) if fields is not None else None
+        self.include_content = include_content
+        self.row_group_size = row_group_size
+        self.count = 0
+        self.schema = pa.schema([
+            ('document_id', pa.string()),
+            ('title', pa.string()),
+            ('source_type', pa.string()),
+            ('processed_at', pa.string()),
+            ('confidence_score', pa.float64()),
+            ('processing_method', pa.string()),
+            ('content', pa.string()),
+            ('metadata', pa.string()),
+            ('fields', pa.string()),
+            ('spans', pa.string()),
+        ])
+        self._rows = []
+        self._writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, document: DocumentSchema):
+        """Buffer one document, flushing a row group when full"""
+        record = compact_document(document, self.fields, self.include_content)
+        for column in ('metadata', 'fields', 'spans'):
+            record[column] = json.dumps(record[column], separators=(',', ':'), ensure_ascii=False, default=str)
+        record.setdefault('content', None)
+        self._rows.append(record)
+        self.count += 1
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        frame = pd.DataFrame(self._rows, columns=self.schema.names)
+        self._writer.write_table(pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_writer(path: str, fields: Iterable[str] = None, include_content: bool = True):
+    """Batch writer chosen by file extension (.parquet, otherwise JSON Lines)"""
+    if path.endswith('.parquet'):
+        return ParquetWriter(path, fields, include_content)
+    return JsonlWriter(path, fields, include_content)
+
+
+def write_documents(documents: Iterable[DocumentSchema], path: str, fields: Iterable[str] = None,
+                    include_content: bool = True) -> int:
+    """Stream documents (None entries are skipped) to a batch file; returns the count written"""
+    with open_writer(path, fields, include_content) as writer:
+        for document in documents:
+            if document is not None:
+                writer.write(document)
+        return writer.count
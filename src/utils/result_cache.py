@@ -0,0 +1,164 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+from config.schema import DocumentSchema
+
+# Bytes read at a time while hashing a file
+HASH_CHUNK_SIZE = 1 << 20
+
+# Default bound on the total size of cached entries
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_digest(file_path: Union[str, io.BytesIO]) -> str:
+    """SHA-256 of a file's bytes (or of an in-memory document's)"""
+    if isinstance(file_path, io.BytesIO):
+        return hashlib.sha256(file_path.getvalue()).hexdigest()
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """On-disk, content-addressed cache of processed documents
+
+    Entries are keyed by the file bytes, the pipeline component versions and
+    anything else the result depends on (sender, AI availability). File names
+    start with a tag of the versions, so bumping a version (for example
+    SignatureEngine.version) makes every older entry a miss and purge_stale
+    deletes them. Total size is bounded with least-recently-used eviction;
+    entries are written atomically so worker processes can share one
+    directory (each keeps its own size estimate).
+    """
+
+    def __init__(self, cache_dir: str = 'data/cache', max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # name -> size, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild LRU order from entry modification times"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._size += size
+
+    @staticmethod
+    def version_tag(versions: Tuple[str, ...]) -> str:
+        """Short tag identifying the pipeline versions"""
+        return hashlib.md5('|'.join(versions).encode()).hexdigest()[:8]
+
+    def make_key(self, file_path: Union[str, io.BytesIO], versions: Tuple[str, ...], context: Tuple = (),
+                 content_digest: str = None) -> str:
+        """Cache key for a file's bytes under the given versions and context
+
+        Pass the file's content_digest when it is already known to skip rehashing.
+        """
+        digest = hashlib.sha256((content_digest or file_digest(file_path)).encode())
+        for part in context:
+            digest.update(b'\0' + str(part).encode())
+        return f"{self.version_tag(versions)}-{digest.hexdigest()}"
+
+    def get(self, key: str) -> Optional[DocumentSchema]:
+        """Cached document for a key, or None"""
+        data = self.read(key)
+        if data is None:
+            return None
+        try:
+            return DocumentSchema.model_validate_json(data)
+        except ValueError:
+            return None
+
+    def put(self, key: str, document: DocumentSchema):
+        """Store a document and evict least recently used entries over the limit"""
+        self.write(key, document.model_dump_json().encode('utf-8'))
+
+    def read(self, key: str) -> Optional[bytes]:
+        """Raw JSON stored under a key, or None"""
+        name = key + '.json'
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Touch the entry so LRU order survives restarts
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except OSError:
+            return data
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            else:
+                # Written by another process sharing the directory
+                self._entries[name] = size
+                self._size += size
+        return data
+
+    def write(self, key: str, data: bytes):
+        """Store raw JSON under a key and evict least recently used entries over the limit"""
+        name = key + '.json'
+        path = os.path.join(self.cache_dir, name)
+        if len(data) > self.max_bytes:
+            return
+
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._size -= self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                oldest, size = self._entries.popitem(last=False)
+                self._size -= size
+                self._remove(oldest)
+
+    def purge_stale(self, versions: Tuple[str, ...]) -> int:
+        """Delete entries written under other pipeline versions"""
+        prefix = self.version_tag(versions) + '-'
+        with self._lock:
+            stale = [name for name in self._entries if not name.startswith(prefix)]
+            for name in stale:
+                self._size -= self._entries.pop(name)
+                self._remove(name)
+        return len(stale)
+
+    def clear(self):
+        """Delete every entry"""
+        with self._lock:
+            for name in self._entries:
+                self._remove(name)
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, name: str):
+        """Delete an entry file another process may already have removed"""
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except FileNotFoundError:
+            pass
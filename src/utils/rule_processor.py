@@ -1,194 +1,240 @@
-# import re
-# from typing import Dict, List, Any, Tuple
-
-# class RuleProcessor:
-#     """Advanced extraction processor using multiple approaches"""
-    
-#     def __init__(self):
-#         pass
-    
-#     def extract_all_data(self, content: str) -> Dict[str, Any]:
-#         """Extract everything without keyword assumptions"""
-#         extracted = {}
-        
-#         # Raw content
-#         extracted['full_text'] = content
-#         extracted['lines'] = content.split('\n')
-#         extracted['words'] = content.split()
-        
-#         # Extract all patterns found
-#         extracted['all_numbers'] = re.findall(r'\d+(?:[.,]\d+)*', content)
-#         extracted['all_text_sequences'] = re.findall(r'[A-Za-z]+', content)
-#         extracted['all_mixed_sequences'] = re.findall(r'[A-Za-z0-9]+', content)
-#         extracted['all_special_chars'] = re.findall(r'[^A-Za-z0-9\s]', content)
-        
-#         # Extract any email-like patterns
-#         extracted['email_patterns'] = re.findall(r'\S+@\S+\.\S+', content)
-        
-#         # Extract any phone-like patterns
-#         extracted['phone_patterns'] = re.findall(r'\+?\d[\d\s\-\(\)]{7,}\d', content)
-        
-#         # Extract any date-like patterns
-#         extracted['date_patterns'] = re.findall(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4}', content)
-        
-#         # Extract any currency-like patterns
-#         extracted['currency_patterns'] = re.findall(r'[₹$]?\s*\d+(?:[,.]\d+)*', content)
-        
-#         # Extract any code-like patterns
-#         extracted['code_patterns'] = re.findall(r'\b[A-Z0-9]{3,}\b', content)
-        
-#         # Extract sentences
-#         extracted['sentences'] = [s.strip() for s in re.split(r'[.!?]+', content) if s.strip()]
-        
-#         # Extract paragraphs
-#         extracted['paragraphs'] = [p.strip() for p in content.split('\n\n') if p.strip()]
-        
-#         return extracted
-    
-#     def apply_rules(self, content: str, rules: Dict = None) -> Tuple[Dict[str, Any], float]:
-#         """Extract everything - no rules, no filtering"""
-#         extracted = self.extract_all_data(content)
-#         confidence = 1.0  # Always confident since we extract everything
-#         return extracted, confidence
-    
-#     def extract_basic_fields(self, content: str) -> Dict[str, Any]:
-#         """Extract basic document metadata"""
-#         lines = [line.strip() for line in content.split('\n') if line.strip()]
-        
-#         return {
-#             'title': lines[0] if lines else "",
-#             'word_count': len(content.split()),
-#             'line_count': len(lines)
-#         }
-
-
-
-
-
-
-import re
-from typing import Dict, List, Any, Tuple
-from collections import defaultdict, Counter
+from collections.abc import Mapping
+from typing import Dict, List, Any, Tuple, Iterable, Optional
+from src.utils.document_scanner import DocumentScanner, scan_document, SCAN_FEATURES
+from src.utils.instrumentation import timed
+from src.rules.compiled_rules import CompiledRules
+
+# Field name -> (placement in extract_all_data output, scan passes it needs, value from a scan)
+FIELDS = {
+    'headers': ('structure', ('headers',), lambda scan: list(scan.headers)),
+    'table_rows': ('structure', ('tables',), lambda scan: list(scan.table_rows)),
+    'sections': ('structure', ('sections',), lambda scan: {name: list(lines) for name, lines in scan.sections.items()}),
+    'key_value_pairs': ('contextual', ('key_values',), lambda scan: scan.key_value_pairs),
+    'unique_words': ('contextual', ('words',), lambda scan: list(scan.unique_words)),
+    'unique_numbers': ('contextual', ('words',), lambda scan: list(scan.unique_numbers)),
+    'sentences': ('contextual', ('sentences',), lambda scan: list(scan.sentences)),
+    'title_candidates': ('metadata', (), lambda scan: scan.title_candidates),
+    'dates': ('metadata', ('dates',), lambda scan: list(scan.dates)),
+    'word_count': ('metadata', ('words',), lambda scan: scan.word_count),
+    'line_count': ('metadata', (), lambda scan: scan.line_count),
+    'char_count': ('metadata', (), lambda scan: scan.char_count),
+    'top_keywords': ('metadata', ('words',), lambda scan: scan.keyword_counts.most_common(10)),
+    'avg_line_length': ('metadata', (), lambda scan: scan.total_line_length / scan.line_count if scan.line_count else 0),
+    'max_line_length': ('metadata', (), lambda scan: scan.max_line_length),
+}
+
+# Shorthands accepted in field lists
+FIELD_ALIASES = {
+    'title': ('title_candidates',),
+    'metadata': tuple(name for name, (placement, _, _) in FIELDS.items() if placement == 'metadata'),
+}
+
+
+def resolve_fields(fields: Iterable[str]) -> Tuple[str, ...]:
+    """Expand aliases and reject unknown field names"""
+    resolved = []
+    for name in fields:
+        for field in FIELD_ALIASES.get(name, (name,)):
+            if field not in FIELDS:
+                raise ValueError(f"Unknown field: {field}")
+            if field not in resolved:
+                resolved.append(field)
+    return tuple(resolved)
+
+
+def features_for(fields: Optional[Iterable[str]]) -> frozenset:
+    """Scan passes needed for a set of fields (every pass when fields is None)"""
+    if fields is None:
+        return SCAN_FEATURES
+    return frozenset(feature for name in resolve_fields(fields) for feature in FIELDS[name][1])
+
+
+class LazyFields(Mapping):
+    """Extracted fields of one document, computed on first access and memoized
+
+    Only the scan passes a field needs are run; a later field needing other
+    passes scans again with just those. prefetch() runs a single scan for a
+    known set of fields.
+    """
+
+    def __init__(self, content: str, scan: DocumentScanner = None):
+        self._content = content
+        self._scans = [scan] if scan is not None else []
+        self._values = {}
+
+    def _scan_for(self, features: frozenset) -> DocumentScanner:
+        """A scan covering the given passes, scanning again only if none does"""
+        for scan in self._scans:
+            if features <= scan.features:
+                return scan
+        scan = scan_document(self._content, features)
+        self._scans.append(scan)
+        return scan
+
+    def prefetch(self, fields: Iterable[str]) -> 'LazyFields':
+        """Compute several fields with one scan"""
+        missing = [name for name in resolve_fields(fields) if name not in self._values]
+        if missing:
+            scan = self._scan_for(features_for(missing))
+            for name in missing:
+                self._values[name] = FIELDS[name][2](scan)
+        return self
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in FIELDS:
+            raise KeyError(name)
+        if name not in self._values:
+            self._values[name] = FIELDS[name][2](self._scan_for(features_for([name])))
+        return self._values[name]
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def to_dict(self, fields: Iterable[str]) -> Dict[str, Any]:
+        """Requested fields laid out like extract_all_data output"""
+        fields = resolve_fields(fields)
+        self.prefetch(fields)
+        extracted = {}
+        for name in fields:
+            if FIELDS[name][0] == 'metadata':
+                extracted.setdefault('metadata', {})[name] = self[name]
+            else:
+                extracted[name] = self[name]
+        return extracted
 
 
 class RuleProcessor:
     """Fully Dynamic Document Processor (No Keywords or Hardcoded Entities)"""
 
     def __init__(self):
-        pass
+        self.version = "1.3"  # 1.1: single-pass scanner, 1.2: confidence from rule coverage, 1.3: compiled rules
 
-    def extract_all_data(self, content: str) -> Dict[str, Any]:
+    def scan(self, content: str, fields: Iterable[str] = None) -> DocumentScanner:
+        """Tokenize content once so every extractor can share the result
+        
+        With fields, only the passes those fields need are run.
+        """
+        return scan_document(content, features_for(fields))
+
+    def lazy_fields(self, content: str, scan: DocumentScanner = None) -> LazyFields:
+        """Fields computed on access, for consumers that read only a few"""
+        return LazyFields(content, scan)
+
+    def extract_fields(self, content: str, fields: Iterable[str], scan: DocumentScanner = None) -> Dict[str, Any]:
+        """Only the requested fields, skipping every scan pass they don't need"""
+        return LazyFields(content, scan).to_dict(fields)
+
+    def extract_block(self, scan: DocumentScanner, text: str) -> Dict[str, Any]:
+        """Feed one streamed block into a scan and return the fields it added"""
+        checkpoint = scan.checkpoint()
+        scan.feed(text)
+        return scan.added_since(checkpoint)
+
+    def extract_all_data(self, content: str, scan: DocumentScanner = None,
+                         timings: Dict[str, float] = None) -> Dict[str, Any]:
         """Main extraction pipeline: structure, context, metadata"""
+        if scan is None:
+            with timed(timings, 'rules.scan'):
+                scan = self.scan(content)
         extracted = {}
-        extracted.update(self._extract_structure(content))
-        extracted.update(self._extract_contextual(content))
-        extracted['metadata'] = self._extract_dynamic_metadata(content)
+        with timed(timings, 'rules.structure'):
+            extracted.update(self._extract_structure(scan))
+        with timed(timings, 'rules.contextual'):
+            extracted.update(self._extract_contextual(scan))
+        with timed(timings, 'rules.metadata'):
+            extracted['metadata'] = self._extract_dynamic_metadata(scan)
         return extracted
 
-    def _extract_structure(self, content: str) -> Dict[str, Any]:
+    def _extract_structure(self, scan: DocumentScanner) -> Dict[str, Any]:
         """Extract structural elements: headers, tables, sections"""
         structure = {}
-        lines = [line.strip() for line in content.split('\n') if line.strip()]
-
-        # Headers: visually distinct lines (caps, punctuated, short)
-        headers = [line for line in lines if len(line) < 80 and 
-                   (line.isupper() or re.match(r'.+[:\-]$', line))]
-        structure['headers'] = headers
-
-        # Tables: lines with tabular spacing or 3+ data chunks
-        table_rows = []
-        for line in lines:
-            tokens = re.split(r'\s{2,}|\t+', line)
-            if len(tokens) >= 3 and all(re.search(r'\w+', t) for t in tokens):
-                table_rows.append(tokens)
-        if table_rows:
-            structure['table_rows'] = table_rows
-
-        # Sections: split into logical blocks by header-like lines
-        sections = defaultdict(list)
-        current_section = "section_0"
-        section_count = 0
-        for line in lines:
-            if re.match(r'^[A-Za-z0-9\s\-\/]{2,50}[:\-]$', line):
-                section_count += 1
-                current_section = f"section_{section_count}"
-                continue
-            sections[current_section].append(line)
-        structure['sections'] = dict(sections)
-
+        structure['headers'] = list(scan.headers)
+        if scan.table_rows:
+            structure['table_rows'] = list(scan.table_rows)
+        structure['sections'] = {name: list(lines) for name, lines in scan.sections.items()}
         return structure
 
-    def _extract_contextual(self, content: str) -> Dict[str, Any]:
+    def _extract_contextual(self, scan: DocumentScanner) -> Dict[str, Any]:
         """Extract generic patterns, key-values, words/numbers, sentences"""
         contextual = {}
-        kv_pairs = {}
-
-        # Generic key-value pairs (colon, dash, or space-separated)
-        patterns = [
-            r'([^\n:]{2,50})\s*[:\-]\s*([^\n]{1,100})',
-            r'^([^\n]{2,40})\s+([A-Z0-9#\-\/]{3,})$'
-        ]
-
-        for pattern in patterns:
-            for match in re.finditer(pattern, content, re.MULTILINE):
-                key = re.sub(r'\W+', '_', match.group(1).strip().lower())
-                value = match.group(2).strip()
-                if value:
-                    kv_pairs[key] = value
-
-        contextual['key_value_pairs'] = kv_pairs
+        contextual['key_value_pairs'] = scan.key_value_pairs
 
         # Unique words (longer than 2 chars) and numbers
-        contextual['unique_words'] = list(set(re.findall(r'\b[A-Za-z]{3,}\b', content)))
-        contextual['unique_numbers'] = list(set(re.findall(r'\b\d+\b', content)))
-
-        # Sentences (basic sentence splitter)
-        sentences = re.split(r'(?<=[.?!])\s+', content.strip())
-        contextual['sentences'] = sentences
+        contextual['unique_words'] = list(scan.unique_words)
+        contextual['unique_numbers'] = list(scan.unique_numbers)
 
+        contextual['sentences'] = list(scan.sentences)
         return contextual
 
-    def _extract_dynamic_metadata(self, content: str) -> Dict[str, Any]:
+    def _extract_dynamic_metadata(self, scan: DocumentScanner) -> Dict[str, Any]:
         """Dynamic metadata: title, stats, top words, date patterns"""
         metadata = {}
-        lines = [line.strip() for line in content.split('\n') if line.strip()]
-        all_words = re.findall(r'\b\w+\b', content)
-
-        # Title candidates: short, prominent lines at the top
-        title_candidates = [
-            line for line in lines[:5]
-            if len(line) > 5 and (line.isupper() or len(line.split()) <= 6)
-        ]
-        metadata['title_candidates'] = title_candidates
-
-        # Extract date-like patterns (generic date formats)
-        date_pattern = r'\b(?:\d{1,2}[/-])?\d{1,2}[/-]\d{2,4}|\d{1,2}\s+[A-Za-z]{3,9}\s+\d{2,4}\b'
-        metadata['dates'] = re.findall(date_pattern, content)
+        metadata['title_candidates'] = scan.title_candidates
+        metadata['dates'] = list(scan.dates)
 
         # Document stats
-        metadata['word_count'] = len(all_words)
-        metadata['line_count'] = len(lines)
-        metadata['char_count'] = len(content)
+        metadata['word_count'] = scan.word_count
+        metadata['line_count'] = scan.line_count
+        metadata['char_count'] = scan.char_count
 
         # Top non-common words
-        words_filtered = [
-            word.lower() for word in all_words
-            if word.isalpha() and len(word) > 2
-        ]
-        metadata['top_keywords'] = Counter(words_filtered).most_common(10)
+        metadata['top_keywords'] = scan.keyword_counts.most_common(10)
 
         # Line length stats
-        line_lengths = [len(line) for line in lines]
-        metadata['avg_line_length'] = sum(line_lengths) / len(line_lengths) if line_lengths else 0
-        metadata['max_line_length'] = max(line_lengths) if line_lengths else 0
+        metadata['avg_line_length'] = scan.total_line_length / scan.line_count if scan.line_count else 0
+        metadata['max_line_length'] = scan.max_line_length
 
         return metadata
 
-    def apply_rules(self, content: str, rules: Dict = None) -> Tuple[Dict[str, Any], float]:
-        """No rules applied - just full dynamic extraction"""
-        extracted = self.extract_all_data(content)
-        return extracted, 1.0  # Always confident
+    def apply_rules(self, content: str, rules: Dict = None, scan: DocumentScanner = None,
+                    timings: Dict[str, float] = None, fields: Iterable[str] = None) -> Tuple[Dict[str, Any], float]:
+        """Full dynamic extraction (or only the requested fields) and its coverage confidence"""
+        if fields is not None:
+            with timed(timings, 'rules.fields'):
+                extracted = self.extract_fields(content, fields, scan)
+            return extracted, self.field_coverage(extracted, fields)
+        extracted = self.extract_all_data(content, scan, timings)
+        return extracted, self.score_confidence(extracted, rules)
+
+    def apply_compiled(self, content: str, compiled: CompiledRules) -> Optional[Tuple[Dict[str, Any], float]]:
+        """A learned layout's fields from its compiled extractors, without the full scan
+        
+        Returns None when too few of them match, so the caller falls back
+        to apply_rules; the confidence is the share that matched.
+        """
+        return compiled.extract(content)
 
-    def extract_basic_fields(self, content: str) -> Dict[str, Any]:
+    def score_confidence(self, extracted: Dict[str, Any], rules: Dict = None) -> float:
+        """How much of the document the rules explain, from 0 to 1
+        
+        Line coverage is the share of lines that produced a key/value pair,
+        header or table row. With learned rules it is averaged with the
+        share of the layout's learned keys found again in this document.
+        """
+        line_count = extracted.get('metadata', {}).get('line_count', 0)
+        if not line_count:
+            return 0.0
+        structured = (len(extracted.get('key_value_pairs', {})) + len(extracted.get('headers', []))
+                      + len(extracted.get('table_rows', [])))
+        coverage = min(1.0, structured / line_count)
+        learned_keys = set((rules or {}).get('key_value_pairs') or {})
+        if not learned_keys:
+            return round(coverage, 3)
+        recall = len(learned_keys & set(extracted.get('key_value_pairs', {}))) / len(learned_keys)
+        return round((coverage + recall) / 2, 3)
+
+    def field_coverage(self, extracted: Dict[str, Any], fields: Iterable[str]) -> float:
+        """Share of the requested fields that came out non-empty"""
+        names = resolve_fields(fields)
+        if not names:
+            return 1.0
+        found = sum(1 for name in names
+                    if extracted.get(name) or extracted.get('metadata', {}).get(name))
+        return round(found / len(names), 3)
+
+    def extract_basic_fields(self, content: str, scan: DocumentScanner = None) -> Dict[str, Any]:
         """Alias for metadata"""
-        return self._extract_dynamic_metadata(content)
+        return self._extract_dynamic_metadata(scan or self.scan(content))
@@ -0,0 +1,41 @@
+import sys
+import os
+import io
+import zipfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from src.main_processor import MainProcessor
+    from src.parsers.bundle_reader import iter_bundle
+
+    # A corrupt archive between two readable members, and a corrupt archive on its own
+    outer = io.BytesIO()
+    with zipfile.ZipFile(outer, 'w') as archive:
+        archive.writestr('a.txt', "Invoice Number: INV-1\nTotal: $10.00\n")
+        archive.writestr('inner.zip', b"PK\x03\x04 this is not a zip archive")
+        archive.writestr('b.txt', "Invoice Number: INV-2\nTotal: $20.00\n")
+    bad = b"PK\x03\x04 neither is this"
+
+    parts = [(part.path, part.error is not None) for part in iter_bundle(outer.getvalue(), name='outer.zip')]
+    expected = [('outer.zip/a.txt', False), ('outer.zip/inner.zip', True), ('outer.zip/b.txt', False)]
+    if parts == expected:
+        print("[OK] Corrupt nested archive became a failed part, the rest were read")
+    else:
+        print(f"[ERROR] Parts read: {parts}")
+
+    processor = MainProcessor()
+    results = []
+    for source, name in ((outer.getvalue(), 'outer.zip'), (bad, 'bad.zip')):
+        for part, document, log in processor.process_bundle(source, name=name, workers=1):
+            results.append((part.path, document is not None))
+    expected = [('outer.zip/a.txt', True), ('outer.zip/inner.zip', False), ('outer.zip/b.txt', True),
+                ('bad.zip', False)]
+    if sorted(results) == sorted(expected):
+        print("[OK] Bundles with corrupt archives processed without stopping")
+    else:
+        print(f"[ERROR] Bundle results: {results}")
+
+except Exception as e:
+    print(f"[ERROR] {e}")
+    import traceback
+    traceback.print_exc()
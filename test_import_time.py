@@ -0,0 +1,48 @@
+import sys
+import os
+import json
+import subprocess
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries a plain-text run without an API key should never import
+HEAVY_MODULES = ['PyPDF2', 'docx', 'bs4', 'lxml', 'magic', 'google.generativeai']
+
+# Runs in a fresh interpreter so nothing is already imported
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+from src.main_processor import MainProcessor
+import_time = time.perf_counter() - start
+processor = MainProcessor()
+processor.process_document("sample_data/invoice_sample.txt")
+after_text = [name for name in HEAVY_MODULES if name in sys.modules]
+processor.process_document("sample_data/report_sample.html")
+after_html = [name for name in HEAVY_MODULES if name in sys.modules]
+print(json.dumps({'import_time': import_time, 'after_text': after_text, 'after_html': after_html}))
+"""
+
+try:
+    root = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run(
+        [sys.executable, '-c', f"HEAVY_MODULES = {HEAVY_MODULES!r}" + PROBE],
+        cwd=root, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(f"[OK] MainProcessor imported in {result['import_time'] * 1000:.0f} ms")
+
+    if result['after_text']:
+        print(f"[ERROR] Text document loaded: {', '.join(result['after_text'])}")
+    else:
+        print("[OK] Text document loaded no parser or AI libraries")
+
+    # bs4 pulls in lxml itself when it is installed
+    html_libraries = [name for name in result['after_html'] if name in ('bs4', 'lxml')]
+    if html_libraries and len(html_libraries) == len(result['after_html']):
+        print(f"[OK] HTML document loaded {', '.join(html_libraries)} only")
+    else:
+        print(f"[ERROR] HTML document loaded: {', '.join(result['after_html']) or 'nothing'}")
+
+except Exception as e:
+    print(f"[ERROR] {e}")
+    import traceback
+    traceback.print_exc()